@@ -0,0 +1,222 @@
+import aiohttp
+import asyncio
+import math
+import time
+
+from collections import deque
+from urllib.parse import urlparse
+
+from django.conf import settings
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.download import DownloaderFactory, HttpDownloader
+from pulpcore.plugin.models import ProgressReport, Task
+
+import logging
+from gettext import gettext as _
+
+log = logging.getLogger(__name__)
+
+# Minimum number of completed downloads over which the latency and throughput of a host are measured
+# before its download concurrency is adjusted:
+ADAPTIVE_WINDOW_MIN_DOWNLOADS = 8
+# Factor by which the mean latency of a host may exceed the lowest one measured before the host is
+# considered congested:
+ADAPTIVE_LATENCY_TOLERANCE = 2.0
+# Relative throughput gain over the previous window that justifies a further increase:
+ADAPTIVE_THROUGHPUT_GAIN = 0.05
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limit the concurrent downloads from a host, like a semaphore whose limit adapts to the host.
+
+    The limit is kept within the minimum and maximum, and adjusted as follows:
+
+    * It is halved as soon as the host answers 429 (Too Many Requests) or 5xx, or a request times
+      out. Requests started before the previous decrease are ignored, so a burst of errors caused by
+      the old limit only halves it once.
+    * Otherwise, it is adjusted once per window of completed downloads: It is decreased by one if
+      the mean latency (the time to the response headers) exceeds ADAPTIVE_LATENCY_TOLERANCE times
+      the lowest one measured, which means requests are queuing upstream. It is increased if the
+      throughput exceeds the one of the previous window by ADAPTIVE_THROUGHPUT_GAIN, by half of the
+      limit until the first decrease or plateau ("slow start"), and by one afterwards.
+
+    Within a task, the chosen limit is reported as a progress report.
+    """
+
+    def __init__(self, host, limit, minimum, maximum):
+        self.host = host
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(limit, minimum), maximum)
+        self.active = 0
+        self.waiters = deque()
+        self.slow_start = True
+        self.best_latency = None
+        self.previous_throughput = None
+        self.last_decrease = time.monotonic()
+        self.progress_report = None
+        self._start_window()
+
+    def _start_window(self):
+        self.window_start = time.monotonic()
+        self.window_downloads = 0
+        self.window_bytes = 0
+        self.window_latency = 0.0
+
+    async def __aenter__(self):
+        while self.active >= self.limit:
+            waiter = asyncio.get_running_loop().create_future()
+            self.waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self.waiters:
+                    self.waiters.remove(waiter)
+                else:
+                    # Pass the wake-up on to the next waiter:
+                    self._wake_waiters()
+                raise
+        self.active += 1
+
+    async def __aexit__(self, exc_type, exc, traceback):
+        self.active -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self):
+        for i in range(min(self.limit - self.active, len(self.waiters))):
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+
+    async def completed(self, latency, size):
+        """
+        Record a completed download of size bytes, whose response headers took latency seconds.
+        """
+        self.window_downloads += 1
+        self.window_bytes += size
+        self.window_latency += latency
+        if self.window_downloads < max(self.limit, ADAPTIVE_WINDOW_MIN_DOWNLOADS):
+            return
+        throughput = self.window_bytes / max(time.monotonic() - self.window_start, 1e-6)
+        latency = self.window_latency / self.window_downloads
+        if self.best_latency is None or latency < self.best_latency:
+            self.best_latency = latency
+        limit = self.limit
+        if latency > ADAPTIVE_LATENCY_TOLERANCE * self.best_latency:
+            limit -= 1
+            self.slow_start = False
+        elif self.previous_throughput is None or throughput > self.previous_throughput * (
+            1 + ADAPTIVE_THROUGHPUT_GAIN
+        ):
+            limit += math.ceil(limit / 2) if self.slow_start else 1
+        else:
+            self.slow_start = False
+        self.previous_throughput = throughput
+        self._start_window()
+        await self._set_limit(limit)
+
+    async def throttled(self, started):
+        """
+        Record a request started at the given time that was throttled or failed by the host.
+        """
+        if started < self.last_decrease:
+            return
+        self.last_decrease = time.monotonic()
+        self.slow_start = False
+        self.previous_throughput = None
+        self._start_window()
+        await self._set_limit(self.limit // 2)
+
+    async def _set_limit(self, limit):
+        limit = min(max(limit, self.minimum), self.maximum)
+        if limit != self.limit:
+            message = "Changing the download concurrency for host '{}' from {} to {}."
+            log.info(_(message).format(self.host, self.limit, limit))
+            self.limit = limit
+            self._wake_waiters()
+        elif self.progress_report is not None:
+            return
+        if Task.current() is None:
+            return
+        if self.progress_report is None:
+            self.progress_report = ProgressReport(
+                message=_("Download concurrency for host '{}'").format(self.host),
+                code="sync.download_concurrency",
+                state=TASK_STATES.COMPLETED,
+            )
+        self.progress_report.total = self.progress_report.done = limit
+        await self.progress_report.asave()
+
+
+class AdaptiveHttpDownloader(HttpDownloader):
+    """
+    An HttpDownloader bounded by an AdaptiveConcurrencyLimiter rather than a static semaphore.
+
+    The outcome of each request is reported to the limiter.
+    """
+
+    def __init__(self, *args, limiter=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limiter = limiter
+        self.semaphore = limiter
+        self._started = None
+        self._latency = None
+
+    def raise_for_status(self, response):
+        """
+        Record the latency of the response, and raise an error if its status is >= 400.
+        """
+        self._latency = time.monotonic() - self._started
+        super().raise_for_status(response)
+
+    async def _run(self, extra_data=None):
+        """
+        Download the url, reporting the outcome to the limiter.
+        """
+        self._started = time.monotonic()
+        try:
+            download_result = await super()._run(extra_data=extra_data)
+        except aiohttp.ClientResponseError as e:
+            if e.status == 429 or e.status >= 500:
+                await self.limiter.throttled(self._started)
+            raise
+        except asyncio.TimeoutError:
+            await self.limiter.throttled(self._started)
+            raise
+        await self.limiter.completed(self._latency, download_result.artifact_attributes["size"])
+        return download_result
+
+
+class AdaptiveDownloaderFactory(DownloaderFactory):
+    """
+    A DownloaderFactory adapting the download concurrency for each host of the remote.
+
+    The limits start at the download_concurrency of the remote, and stay within the
+    ADAPTIVE_DOWNLOAD_CONCURRENCY_MIN and ADAPTIVE_DOWNLOAD_CONCURRENCY_MAX settings.
+    """
+
+    def __init__(self, remote):
+        super().__init__(
+            remote,
+            downloader_overrides={"http": AdaptiveHttpDownloader, "https": AdaptiveHttpDownloader},
+        )
+        self.limiters = {}
+
+    def build(self, url, **kwargs):
+        """
+        Build a downloader, which is bounded by the limiter of its host for http(s) urls.
+        """
+        parsed_url = urlparse(url)
+        if parsed_url.scheme.lower() in ("http", "https"):
+            host = parsed_url.netloc
+            if host not in self.limiters:
+                self.limiters[host] = AdaptiveConcurrencyLimiter(
+                    host,
+                    self._remote.download_concurrency or self._remote.DEFAULT_DOWNLOAD_CONCURRENCY,
+                    settings.ADAPTIVE_DOWNLOAD_CONCURRENCY_MIN,
+                    settings.ADAPTIVE_DOWNLOAD_CONCURRENCY_MAX,
+                )
+            kwargs["limiter"] = self.limiters[host]
+        return super().build(url, **kwargs)
@@ -0,0 +1,26 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("deb", "0026_aptrepository_publish_upstream_release_fields"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aptremote",
+            name="metadata_policy",
+            field=models.TextField(
+                choices=[
+                    ("full", "Download all variants of the repository metadata files."),
+                    (
+                        "minimal",
+                        "Download only the smallest variant of each repository metadata file.",
+                    ),
+                ],
+                default="full",
+            ),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django_lifecycle.mixins
+import pulpcore.app.models.base
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("deb", "0027_aptremote_metadata_policy"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AptSyncCheckpoint",
+            fields=[
+                (
+                    "pulp_id",
+                    models.UUIDField(
+                        default=pulpcore.app.models.base.pulp_uuid,
+                        editable=False,
+                        primary_key=True,
+                        serialize=False,
+                    ),
+                ),
+                ("pulp_created", models.DateTimeField(auto_now_add=True)),
+                ("pulp_last_updated", models.DateTimeField(auto_now=True, null=True)),
+                ("remote_options", models.JSONField()),
+                ("relative_path", models.TextField()),
+                ("artifact_set_sha256", models.CharField(max_length=255)),
+                ("content_pks", models.JSONField()),
+                ("architectures", models.JSONField()),
+                (
+                    "remote",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sync_checkpoints",
+                        to="deb.aptremote",
+                    ),
+                ),
+                (
+                    "repository",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sync_checkpoints",
+                        to="deb.aptrepository",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("repository", "remote", "relative_path")},
+            },
+            bases=(django_lifecycle.mixins.LifecycleModelMixin, models.Model),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("deb", "0028_aptsynccheckpoint"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aptremote",
+            name="exclude_packages",
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name="aptremote",
+            name="include_packages",
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name="aptremote",
+            name="priorities",
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name="aptremote",
+            name="sections",
+            field=models.TextField(null=True),
+        ),
+        migrations.AddField(
+            model_name="aptremote",
+            name="source_packages",
+            field=models.TextField(null=True),
+        ),
+    ]
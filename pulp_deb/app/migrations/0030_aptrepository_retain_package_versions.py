@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("deb", "0029_aptremote_package_filters"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aptrepository",
+            name="retain_package_versions",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
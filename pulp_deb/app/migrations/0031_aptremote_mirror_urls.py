@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("deb", "0030_aptrepository_retain_package_versions"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aptremote",
+            name="mirror_urls",
+            field=models.TextField(null=True),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("deb", "0031_aptremote_mirror_urls"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="aptremote",
+            name="adaptive_download_concurrency",
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -26,4 +26,4 @@ from .publication import AptDistribution, AptPublication, VerbatimPublication
 
 from .remote import AptRemote
 
-from .repository import AptRepository, AptRepositoryReleaseServiceOverride
+from .repository import AptRepository, AptRepositoryReleaseServiceOverride, AptSyncCheckpoint
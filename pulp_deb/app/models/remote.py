@@ -2,6 +2,8 @@ from django.db import models
 
 from pulpcore.plugin.models import Remote
 
+from pulp_deb.app.downloaders import AdaptiveDownloaderFactory
+
 
 class AptRemote(Remote):
     """
@@ -10,6 +12,15 @@ class AptRemote(Remote):
 
     TYPE = "apt-remote"
 
+    # Constants for the ChoiceField 'metadata_policy'
+    FULL = "full"
+    MINIMAL = "minimal"
+
+    METADATA_POLICY_CHOICES = (
+        (FULL, "Download all variants of the repository metadata files."),
+        (MINIMAL, "Download only the smallest variant of each repository metadata file."),
+    )
+
     distributions = models.TextField(null=True)
     components = models.TextField(null=True)
     architectures = models.TextField(null=True)
@@ -18,6 +29,27 @@ class AptRemote(Remote):
     sync_installer = models.BooleanField(default=False)
     gpgkey = models.TextField(null=True)
     ignore_missing_package_indices = models.BooleanField(default=False)
+    metadata_policy = models.TextField(choices=METADATA_POLICY_CHOICES, default=FULL)
+    include_packages = models.TextField(null=True)
+    exclude_packages = models.TextField(null=True)
+    sections = models.TextField(null=True)
+    priorities = models.TextField(null=True)
+    source_packages = models.TextField(null=True)
+    mirror_urls = models.TextField(null=True)
+    adaptive_download_concurrency = models.BooleanField(default=False)
+
+    @property
+    def download_factory(self):
+        """
+        Return the DownloaderFactory, which adapts the download concurrency if so configured.
+        """
+        if not self.adaptive_download_concurrency:
+            return super().download_factory
+        try:
+            return self._download_factory
+        except AttributeError:
+            self._download_factory = AdaptiveDownloaderFactory(self)
+            return self._download_factory
 
     class Meta:
         default_related_name = "%(app_label)s_%(model_name)s"
@@ -1,3 +1,6 @@
+from collections import defaultdict
+
+from debian.debian_support import Version
 from django.db import models
 from pulpcore.plugin.models import BaseModel, Repository
 from pulpcore.plugin.repo_version_utils import remove_duplicates, validate_version_paths
@@ -41,6 +44,7 @@ class AptRepository(Repository):
     ]
 
     publish_upstream_release_fields = models.BooleanField(default=True)
+    retain_package_versions = models.PositiveIntegerField(default=0)
 
     signing_service = models.ForeignKey(
         AptReleaseSigningService, on_delete=models.PROTECT, null=True
@@ -88,6 +92,8 @@ class AptRepository(Repository):
         from pulp_deb.app.tasks.exceptions import DuplicateDistributionException
 
         remove_duplicates(new_version)
+        if self.retain_package_versions > 0:
+            self._remove_old_package_versions(new_version)
         validate_version_paths(new_version)
         releases = new_version.get_content(Release.objects.all())
         distributions = []
@@ -97,6 +103,79 @@ class AptRepository(Repository):
                 raise DuplicateDistributionException(distribution)
             distributions.append(distribution)
 
+    def _remove_old_package_versions(self, new_version):
+        """
+        Remove all but the retain_package_versions newest versions of each package from each
+        release component of the new repository version.
+
+        Packages are told apart by their name and architecture, and their versions are compared
+        following the Debian version ordering. The PackageReleaseComponents of the older versions
+        are removed, while the packages themselves are only removed once no release component keeps
+        them. Packages outside of any release component, like installer packages, are compared
+        across the whole repository version.
+        """
+        # The versions of each package per release component (None for packages outside of any),
+        # with their pks and the pks of their PackageReleaseComponents:
+        package_versions = defaultdict(lambda: defaultdict(list))
+        for package_model in (Package, InstallerPackage):
+            packages = {
+                pk: (package, architecture, version)
+                for pk, package, architecture, version in new_version.get_content(
+                    package_model.objects
+                ).values_list("pk", "package", "architecture", "version")
+            }
+            if package_model is Package:
+                package_release_components = new_version.get_content(
+                    PackageReleaseComponent.objects
+                ).values_list("pk", "package", "release_component")
+            else:
+                package_release_components = []
+            component_package_pks = set()
+            for prc_pk, package_pk, release_component_pk in package_release_components:
+                if package_pk in packages:
+                    package, architecture, version = packages[package_pk]
+                    key = (package_model, release_component_pk, package, architecture)
+                    package_versions[key][version].append((package_pk, prc_pk))
+                    component_package_pks.add(package_pk)
+            for package_pk, (package, architecture, version) in packages.items():
+                if package_pk not in component_package_pks:
+                    key = (package_model, None, package, architecture)
+                    package_versions[key][version].append((package_pk, None))
+
+        old_package_pks = defaultdict(set)
+        old_prc_pks = []
+        retained_package_pks = set()
+        for (package_model, *_), versions in package_versions.items():
+            retained_versions = self._get_retained_package_versions(versions)
+            for version, packages in versions.items():
+                for package_pk, prc_pk in packages:
+                    if version in retained_versions:
+                        retained_package_pks.add(package_pk)
+                    else:
+                        old_package_pks[package_model].add(package_pk)
+                        if prc_pk is not None:
+                            old_prc_pks.append(prc_pk)
+
+        if old_prc_pks:
+            new_version.remove_content(PackageReleaseComponent.objects.filter(pk__in=old_prc_pks))
+        for package_model, package_pks in old_package_pks.items():
+            package_pks -= retained_package_pks
+            if package_pks:
+                new_version.remove_content(package_model.objects.filter(pk__in=package_pks))
+
+    def _get_retained_package_versions(self, versions):
+        """
+        Get the retain_package_versions newest of the versions, or all of them if they cannot be
+        ordered.
+        """
+        if len(versions) <= self.retain_package_versions:
+            return set(versions)
+        try:
+            newest_versions = sorted(versions, key=Version, reverse=True)
+        except ValueError:
+            return set(versions)
+        return set(newest_versions[: self.retain_package_versions])
+
 
 class AptRepositoryReleaseServiceOverride(BaseModel):
     """
@@ -111,3 +190,25 @@ class AptRepositoryReleaseServiceOverride(BaseModel):
 
     class Meta:
         unique_together = (("repository", "release_distribution"),)
+
+
+class AptSyncCheckpoint(BaseModel):
+    """
+    A package index that a sync of the remote into the repository has completely handled.
+
+    Checkpoints are kept until such a sync succeeds, so a sync that is interrupted can be resumed
+    without parsing the completed package indices again.
+    """
+
+    repository = models.ForeignKey(
+        AptRepository, on_delete=models.CASCADE, related_name="sync_checkpoints"
+    )
+    remote = models.ForeignKey(AptRemote, on_delete=models.CASCADE, related_name="sync_checkpoints")
+    remote_options = models.JSONField()
+    relative_path = models.TextField()
+    artifact_set_sha256 = models.CharField(max_length=255)
+    content_pks = models.JSONField()
+    architectures = models.JSONField()
+
+    class Meta:
+        unique_together = (("repository", "remote", "relative_path"),)
@@ -68,6 +68,41 @@ class YesNoField(Field):
             raise ValidationError('Value must be "yes" or "no".')
 
 
+def _validate_822_string(value):
+    """
+    Validate and clean a single field value from 822 data the way a CharField would.
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValidationError(_("Not a valid string."), code="invalid")
+    value = str(value).strip()
+    if not value:
+        raise ValidationError(_("This field may not be blank."), code="blank")
+    if "\x00" in value:
+        raise ValidationError(
+            _("Null characters are not allowed."), code="null_characters_not_allowed"
+        )
+    try:
+        value.encode("utf-8")
+    except UnicodeEncodeError as e:
+        message = _("Surrogate characters are not allowed: U+{:X}.")
+        raise ValidationError(
+            message.format(ord(value[e.start])), code="surrogate_characters_not_allowed"
+        )
+    return value
+
+
+def _validate_822_yes_no(value):
+    """
+    Validate and translate a 'yes' or 'no' field value from 822 data the way a YesNoField would.
+    """
+    value = value.strip().lower()
+    if value == "yes":
+        return True
+    if value == "no":
+        return False
+    raise ValidationError('Value must be "yes" or "no".')
+
+
 class NullableCharField(CharField):
     """
     A serializer that accepts null values but saves them as the NULL_VALUE str.
@@ -306,6 +341,7 @@ class BasePackage822Serializer(SingleArtifactContentSerializer):
         "replaces": "Replaces",
     }
     TRANSLATION_DICT_INV = {v: k for k, v in TRANSLATION_DICT.items()}
+    YES_NO_FIELDS = ("essential", "build_essential")
 
     package = CharField()
     source = CharField(required=False)
@@ -350,6 +386,56 @@ class BasePackage822Serializer(SingleArtifactContentSerializer):
         """
         Translate deb822.Package to a dictionary for class instatiation.
         """
+        return cls(data=cls._translate822(data), **kwargs)
+
+    @classmethod
+    def validated_data_from822(cls, data):
+        """
+        Translate and validate deb822.Package without instantiating a serializer.
+
+        The result is the same as the validated_data of a valid from822() serializer and can be
+        passed to the model directly. It is used when creating packages from 822 data during sync
+        and upload, where instantiating a serializer for each package is prohibitively slow.
+
+        Raises:
+            ValidationError: With the same details a from822() serializer would report.
+        """
+        package_fields = cls._translate822(data)
+        validated_data = {}
+        errors = {}
+        for key in cls.TRANSLATION_DICT:
+            if key not in package_fields:
+                if cls._declared_fields[key].required:
+                    errors[key] = ValidationError(
+                        _("This field is required."), code="required"
+                    ).detail
+                continue
+            try:
+                if key in cls.YES_NO_FIELDS:
+                    validated_data[key] = _validate_822_yes_no(package_fields[key])
+                else:
+                    validated_data[key] = _validate_822_string(package_fields[key])
+            except ValidationError as e:
+                errors[key] = e.detail
+        custom_fields = {}
+        custom_field_errors = {}
+        for key, value in package_fields["custom_fields"].items():
+            try:
+                custom_fields[str(key)] = _validate_822_string(value)
+            except ValidationError as e:
+                custom_field_errors[key] = e.detail
+        if custom_field_errors:
+            errors["custom_fields"] = custom_field_errors
+        if errors:
+            raise ValidationError(errors)
+        validated_data["custom_fields"] = custom_fields
+        return validated_data
+
+    @classmethod
+    def _translate822(cls, data):
+        """
+        Translate deb822.Package to a dictionary of serializer fields.
+        """
         skip = ["Filename", "MD5sum", "Size", "SHA1", "SHA256", "SHA512"]
         package_fields = {}
         custom_fields = {}
@@ -427,7 +513,7 @@ class BasePackage822Serializer(SingleArtifactContentSerializer):
                 del package_fields["multi_arch"]
 
         package_fields["custom_fields"] = custom_fields
-        return cls(data=package_fields, **kwargs)
+        return package_fields
 
     def to822(self, component=""):
         """Create deb822.Package object from model."""
@@ -579,9 +665,7 @@ class BasePackageMixin(Serializer):
                 )
             raise ValidationError(_(message).format(e))
 
-        from822_serializer = self.Meta.from822_serializer.from822(data=package_paragraph)
-        from822_serializer.is_valid(raise_exception=True)
-        package_data = from822_serializer.validated_data
+        package_data = self.Meta.from822_serializer.validated_data_from822(package_paragraph)
         data.update(package_data)
         data["sha256"] = data["artifact"].sha256
 
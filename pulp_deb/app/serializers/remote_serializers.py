@@ -64,6 +64,72 @@ class AptRemoteSerializer(RemoteSerializer):
         required=False,
     )
 
+    metadata_policy = ChoiceField(
+        help_text="The policy to use when downloading repository metadata. The possible values "
+        "include: 'full' and 'minimal'. 'full' is the default and downloads every variant of "
+        "each metadata file referenced by the upstream Release file. 'minimal' downloads only the "
+        "smallest compressed variant of each package index and only the InRelease file if the "
+        "upstream repository provides one. Any other variants are created on demand.",
+        choices=AptRemote.METADATA_POLICY_CHOICES,
+        default=AptRemote.FULL,
+    )
+
+    include_packages = CharField(
+        help_text="Whitespace separated list of package names to sync.\n"
+        'Shell-style wildcards like "python3-*" may be used. '
+        "If none are supplied, all packages are synchronized.",
+        required=False,
+        allow_null=True,
+    )
+
+    exclude_packages = CharField(
+        help_text="Whitespace separated list of package names not to sync.\n"
+        'Shell-style wildcards like "*-dbgsym" may be used. '
+        "This takes precedence over include_packages.",
+        required=False,
+        allow_null=True,
+    )
+
+    sections = CharField(
+        help_text="Whitespace separated list of sections to sync.\n"
+        'A section like "utils" also matches the sections of other areas, like "contrib/utils". '
+        "If none are supplied, packages of all sections are synchronized.",
+        required=False,
+        allow_null=True,
+    )
+
+    priorities = CharField(
+        help_text='Whitespace separated list of priorities to sync, like "required important".\n'
+        "If none are supplied, packages of all priorities are synchronized.",
+        required=False,
+        allow_null=True,
+    )
+
+    source_packages = CharField(
+        help_text="Whitespace separated list of source package names to sync the binary packages "
+        "of.\nShell-style wildcards may be used. "
+        "If none are supplied, packages built from any source package are synchronized.",
+        required=False,
+        allow_null=True,
+    )
+
+    mirror_urls = CharField(
+        help_text="Whitespace separated list of the URLs of additional mirrors of the url.\n"
+        "Package downloads are spread across the url and the mirrors, preferring the fastest and "
+        "demoting failing ones. A mirror is only used for a distribution if its Release file "
+        "matches the one at the url.",
+        required=False,
+        allow_null=True,
+    )
+
+    adaptive_download_concurrency = BooleanField(
+        help_text="Adapt the download concurrency for each upstream host while downloading, "
+        "starting at download_concurrency. It is lowered when the host answers 429 or 5xx, times "
+        "out or its latency rises, and raised while this increases the throughput. The chosen "
+        "limits are reported in the progress reports of the task.",
+        required=False,
+    )
+
     policy = ChoiceField(
         help_text="The policy to use when downloading content. The possible values include: "
         "'immediate', 'on_demand', and 'streamed'. 'immediate' is the default.",
@@ -71,6 +137,15 @@ class AptRemoteSerializer(RemoteSerializer):
         default=Remote.IMMEDIATE,
     )
 
+    def validate_mirror_urls(self, value):
+        """
+        Validate each of the mirror URLs like the url.
+        """
+        if value:
+            for url in value.split():
+                self.validate_url(url)
+        return value
+
     class Meta:
         fields = RemoteSerializer.Meta.fields + (
             "distributions",
@@ -81,5 +156,13 @@ class AptRemoteSerializer(RemoteSerializer):
             "sync_installer",
             "gpgkey",
             "ignore_missing_package_indices",
+            "metadata_policy",
+            "include_packages",
+            "exclude_packages",
+            "sections",
+            "priorities",
+            "source_packages",
+            "mirror_urls",
+            "adaptive_download_concurrency",
         )
         model = AptRemote
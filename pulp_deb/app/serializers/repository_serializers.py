@@ -56,6 +56,17 @@ class AptRepositorySerializer(RepositorySerializer):
         required=False,
     )
 
+    retain_package_versions = serializers.IntegerField(
+        help_text=_(
+            "The number of versions of each package to keep in each release component of the "
+            "repository; older versions will be purged. The default is '0', which will disable "
+            "this feature and keep all versions of each package. Packages are told apart by their "
+            "name and architecture."
+        ),
+        min_value=0,
+        required=False,
+    )
+
     signing_service = RelatedField(
         help_text="A reference to an associated signing service. Used if "
         "AptPublication.signing_service is not set",
@@ -78,6 +89,7 @@ class AptRepositorySerializer(RepositorySerializer):
     class Meta:
         fields = RepositorySerializer.Meta.fields + (
             "publish_upstream_release_fields",
+            "retain_package_versions",
             "signing_service",
             "signing_service_release_overrides",
         )
@@ -144,6 +156,24 @@ class AptRepositorySyncURLSerializer(RepositorySyncURLSerializer):
         required=False,
         default=True,
     )
+    plan = serializers.BooleanField(
+        help_text=_(
+            "Only estimate the number of packages the sync would add and remove, and the amount of "
+            "data it would download, without downloading any packages or creating a repository "
+            "version. The estimates are reported as progress reports of the task."
+        ),
+        required=False,
+        default=False,
+    )
+    distributed = serializers.BooleanField(
+        help_text=_(
+            "Sync each distribution of the remote in a child task of its own, so that several "
+            "workers can sync them at the same time. A final task merges them into a single "
+            "repository version. All of these tasks belong to the task group of the returned task."
+        ),
+        required=False,
+        default=False,
+    )
 
 
 class CopySerializer(serializers.Serializer):
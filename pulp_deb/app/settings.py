@@ -8,4 +8,47 @@ Check `Plugin Writer's Guide`_ for more details.
 FORBIDDEN_CHECKSUM_WARNINGS = True
 FORCE_IGNORE_MISSING_PACKAGE_INDICES = False
 
+# Number of worker processes used to parse and validate package indices during sync. Using 0 parses
+# package indices in the sync task itself. The chunk size is the number of package paragraphs handed
+# to a worker process at a time.
+PACKAGE_INDEX_PARSE_PROCESSES = 0
+PACKAGE_INDEX_PARSE_CHUNK_SIZE = 1000
+
+# Limits bounding the memory use of syncs with many distributions and package indices: The number
+# of distributions and of package indices handled concurrently, and the number of packages of a
+# package index held in the sync pipeline at a time. Using 0 means no limit.
+SYNC_MAX_CONCURRENT_DISTRIBUTIONS = 2
+SYNC_MAX_CONCURRENT_PACKAGE_INDICES = 4
+SYNC_MAX_PENDING_PACKAGES = 10000
+
+# Seconds between the bulk writes of the checkpoints of the package indices a sync has parsed, which
+# an interrupted sync of the same remote into the same repository resumes from. Syncs finishing
+# sooner write no checkpoints. Using 0 writes each checkpoint right away.
+SYNC_CHECKPOINT_INTERVAL = 300
+
+# Directory caching the packages of the package indices synced by any repository, so syncs of an
+# unchanged package index from the same upstream url with the same options need not parse it again.
+# Defaults to a "deb-package-index-cache" directory in the WORKING_DIRECTORY. The least recently
+# used entries are evicted once the cache exceeds PACKAGE_INDEX_CACHE_SIZE bytes. Using 0 disables
+# the cache.
+PACKAGE_INDEX_CACHE_DIRECTORY = None
+PACKAGE_INDEX_CACHE_SIZE = 256 * 1024 * 1024
+
+# Build changed package indices from the previously synced ones using the upstream pdiffs
+# (Packages.diff/Index), where available, instead of downloading them in full.
+SYNC_PDIFFS = False
+
+# Directory holding a keyring for each remote gpgkey, along with the cached results of verifying
+# Release files with it. Defaults to a "deb-gpg" directory in the WORKING_DIRECTORY.
+GPG_KEYRING_DIRECTORY = None
+
+# Bounds of the download concurrency for each host of remotes with adaptive_download_concurrency.
+ADAPTIVE_DOWNLOAD_CONCURRENCY_MIN = 1
+ADAPTIVE_DOWNLOAD_CONCURRENCY_MAX = 50
+
+# Measure the wall time, throughput and queue waits of each sync pipeline stage, and the parse time
+# of each package index. The results are stored in the "sync_metrics" info of the new repository
+# version and in progress reports of the sync task, and exported as OpenTelemetry metrics.
+SYNC_METRICS = False
+
 APT_BY_HASH = True
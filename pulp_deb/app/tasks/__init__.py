@@ -1,4 +1,5 @@
 # flake8: noqa
 from .publishing import publish, publish_verbatim
-from .synchronizing import synchronize
+from .synchronizing import synchronize, synchronize_distributed
+from .planning import plan_synchronize
 from .copy import copy_content
@@ -0,0 +1,265 @@
+import aiohttp
+import math
+import os
+
+from debian import deb822
+from urllib.parse import quote, urlparse, urlunparse
+
+from pulpcore.plugin.constants import TASK_STATES
+from pulpcore.plugin.models import Artifact, ProgressReport, Remote
+
+from pulp_deb.app.models import (
+    AptRemote,
+    AptRepository,
+    InstallerPackage,
+    Package,
+    PackageIndex,
+)
+from pulp_deb.app.tasks.synchronizing import (
+    BULK_CONTENT_BATCH_SIZE,
+    PACKAGE_INDEX_DECOMPRESSORS,
+    NoReleaseFile,
+    _filter_split_architectures,
+    _filter_split_components,
+    _get_package_filters,
+    _get_package_key,
+    _iter_package_index_chunks,
+    _package_architecture_wanted,
+    _package_filters_match,
+    _scan_package_index_chunks,
+)
+
+from django.conf import settings
+
+import logging
+from gettext import gettext as _
+
+log = logging.getLogger(__name__)
+
+
+def plan_synchronize(remote_pk, repository_pk, mirror):
+    """
+    Estimate the changes a sync would make to the repository, without syncing it.
+
+    Only the Release files and the package indices are downloaded, and their package paragraphs
+    are scanned rather than parsed. The estimates are reported as progress reports of the task.
+
+    Args:
+        remote_pk (str): The remote PK.
+        repository_pk (str): The repository PK.
+        mirror (bool): True for mirror mode, False for additive.
+
+    Raises:
+        ValueError: If the remote does not specify a URL to sync
+
+    """
+    remote = AptRemote.objects.get(pk=remote_pk)
+    repository = AptRepository.objects.get(pk=repository_pk)
+
+    if not remote.url:
+        raise ValueError(_("A remote must have a url specified to synchronize."))
+
+    # The size of each upstream package by its (relative_path, sha256) key:
+    upstream_packages = {}
+    metadata_size = 0
+    for distribution in remote.distributions.split():
+        metadata_size += _plan_distribution(remote, distribution, upstream_packages)
+
+    previous_version = repository.latest_version()
+    previous_packages = set()
+    for package_model in (Package, InstallerPackage):
+        previous_packages.update(
+            previous_version.get_content(package_model.objects).values_list(
+                "relative_path", "sha256"
+            )
+        )
+    packages_added = len(upstream_packages.keys() - previous_packages)
+    packages_removed = len(previous_packages - upstream_packages.keys()) if mirror else 0
+
+    artifacts_to_download = 0
+    download_size = metadata_size
+    if remote.policy == Remote.IMMEDIATE:
+        missing_sha256s = _get_missing_sha256s({sha256 for _path, sha256 in upstream_packages})
+        for (_path, sha256), size in upstream_packages.items():
+            if sha256 in missing_sha256s:
+                missing_sha256s.remove(sha256)
+                artifacts_to_download += 1
+                download_size += size
+
+    message = (
+        "Sync plan for repository '{}': {} packages to add, {} packages to remove, {} package "
+        "artifacts and {} bytes to download."
+    )
+    log.info(
+        _(message).format(
+            repository.name,
+            packages_added,
+            packages_removed,
+            artifacts_to_download,
+            download_size,
+        )
+    )
+    for report_message, code, total in (
+        ("Packages to add", "sync.plan.packages_added", packages_added),
+        ("Packages to remove", "sync.plan.packages_removed", packages_removed),
+        ("Package artifacts to download", "sync.plan.artifacts_to_download", artifacts_to_download),
+        # Report MiB, since the byte count of a large remote does not fit a progress report:
+        ("Download size (MiB)", "sync.plan.download_size", math.ceil(download_size / 2**20)),
+    ):
+        ProgressReport(
+            message=_(report_message),
+            code=code,
+            state=TASK_STATES.COMPLETED,
+            total=total,
+            done=total,
+        ).save()
+
+
+def _plan_distribution(remote, distribution, upstream_packages):
+    """
+    Scan the package indices of the distribution, adding the wanted packages to upstream_packages.
+
+    Returns the number of bytes of metadata a sync of the distribution would download.
+    """
+    if distribution[-1] == "/":
+        release_file_dir = distribution.strip("/")
+    else:
+        release_file_dir = os.path.join("dists", distribution)
+
+    release_file_dict = None
+    for filename in ("InRelease", "Release"):
+        download = _fetch(remote, os.path.join(release_file_dir, filename))
+        if download is not None:
+            with open(download.path, "rb") as release_file:
+                release_file_dict = deb822.Release(release_file)
+            # A full sync downloads both Release file variants, but they are small:
+            metadata_size = os.path.getsize(download.path)
+            os.remove(download.path)
+            break
+    if release_file_dict is None:
+        raise NoReleaseFile(url=_to_url(remote, release_file_dir))
+
+    file_references = {
+        file_reference["name"]: file_reference
+        for file_reference in release_file_dict.get("SHA256", [])
+    }
+
+    release_architectures = release_file_dict.get("Architectures", "").split()
+    options = {
+        "distribution": distribution,
+        "release_architectures": release_architectures,
+        "remote_architectures": (remote.architectures or "").split(),
+        "package_filters": _get_package_filters(remote),
+    }
+    if distribution[-1] == "/":
+        package_indices = [("", "")]
+    else:
+        architectures = _filter_split_architectures(
+            release_file_dict.get("Architectures", ""), remote.architectures, distribution
+        )
+        infixes = ["", "debian-installer"] if remote.sync_udebs else [""]
+        package_indices = [
+            (
+                os.path.join(os.path.basename(component), infix, "binary-{}".format(architecture)),
+                architecture,
+            )
+            for component in _filter_split_components(
+                release_file_dict.get("Components", ""), remote.components, distribution
+            )
+            for infix in infixes
+            for architecture in architectures
+        ]
+
+    for package_index_dir, architecture in package_indices:
+        variants = [
+            file_references[path]
+            for path in (
+                os.path.join(package_index_dir, filename)
+                for filename in PackageIndex.SUPPORTED_ARTIFACTS
+                if filename != "Release"
+            )
+            if path in file_references
+        ]
+        if not variants:
+            continue
+        smallest_variant = min(variants, key=lambda variant: int(variant["size"]))
+        if remote.metadata_policy == AptRemote.MINIMAL:
+            metadata_size += int(smallest_variant["size"])
+        else:
+            metadata_size += sum(int(variant["size"]) for variant in variants)
+        download = _fetch(
+            remote, os.path.join(release_file_dir, smallest_variant["name"]), smallest_variant
+        )
+        if download is None:
+            continue
+        _scan_package_index(
+            download.path,
+            os.path.splitext(smallest_variant["name"])[1],
+            dict(options, architecture=architecture),
+            upstream_packages,
+        )
+        os.remove(download.path)
+    return metadata_size
+
+
+def _scan_package_index(path, extension, options, upstream_packages):
+    """
+    Add the wanted packages of the (possibly compressed) package index to upstream_packages.
+    """
+    decompressor = PACKAGE_INDEX_DECOMPRESSORS.get(extension)
+    open_package_index = decompressor.open if decompressor else open
+    with open_package_index(path, "rb") as package_index_file:
+        chunks = _iter_package_index_chunks(
+            package_index_file, settings.PACKAGE_INDEX_PARSE_CHUNK_SIZE
+        )
+        for chunk in _scan_package_index_chunks(chunks):
+            for _raw_paragraph, fields in chunk:
+                if _package_architecture_wanted(
+                    fields.get("Architecture"), options
+                ) and _package_filters_match(fields, options["package_filters"]):
+                    try:
+                        size = int(fields.get("Size", 0))
+                    except ValueError:
+                        message = "Ignoring package paragraph with invalid size. {}"
+                        log.warning(_(message).format(fields))
+                        continue
+                    upstream_packages[_get_package_key(fields)] = size
+
+
+def _get_missing_sha256s(sha256s):
+    """
+    Return the subset of the sha256 checksums that no existing Artifact has.
+    """
+    sha256s = list(sha256s)
+    missing_sha256s = set(sha256s)
+    for i in range(0, len(sha256s), BULK_CONTENT_BATCH_SIZE):
+        batch = sha256s[i : i + BULK_CONTENT_BATCH_SIZE]
+        missing_sha256s.difference_update(
+            Artifact.objects.filter(sha256__in=batch).values_list("sha256", flat=True)
+        )
+    return missing_sha256s
+
+
+def _to_url(remote, relative_path):
+    parsed_url = urlparse(remote.url)
+    url_path = quote(os.path.join(parsed_url.path, relative_path), safe=":/")
+    return urlunparse(parsed_url._replace(path=url_path))
+
+
+def _fetch(remote, relative_path, file_reference=None):
+    """
+    Download the file at relative_path from the remote, returning None if it does not exist.
+    """
+    kwargs = {}
+    if file_reference is not None:
+        kwargs["expected_digests"] = {"sha256": file_reference["sha256"]}
+        kwargs["expected_size"] = int(file_reference["size"])
+    downloader = remote.get_downloader(url=_to_url(remote, relative_path), **kwargs)
+    try:
+        return downloader.fetch()
+    except FileNotFoundError:
+        return None
+    except aiohttp.ClientResponseError as e:
+        if e.status == 404:
+            return None
+        raise
@@ -15,8 +15,10 @@ from django.db.utils import IntegrityError
 from django.forms.models import model_to_dict
 
 from pulpcore.plugin.models import (
+    ContentArtifact,
     PublishedArtifact,
     PublishedMetadata,
+    RemoteArtifact,
     RepositoryVersion,
 )
 
@@ -29,6 +31,7 @@ from pulp_deb.app.models import (
     Release,
     ReleaseArchitecture,
     ReleaseComponent,
+    ReleaseFile,
     VerbatimPublication,
     AptReleaseSigningService,
 )
@@ -62,11 +65,60 @@ def publish_verbatim(repository_version_pk):
     )
     with tempfile.TemporaryDirectory("."):
         with VerbatimPublication.create(repo_version, pass_through=True) as publication:
-            pass
+            _publish_by_hash_indices(publication)
 
     log.info(_("Publication (verbatim): {publication} created").format(publication=publication.pk))
 
 
+def _publish_by_hash_indices(publication):
+    """
+    Publish the indices of distributions announcing Acquire-By-Hash at their by-hash paths.
+
+    Clients fetch the indices listed in the Release files of such distributions from
+    "by-hash/SHA256/<digest>" paths next to them, which a verbatim publication does not contain
+    otherwise.
+    """
+    repo_version = publication.repository_version
+    announced_paths = set()
+    for release_file in ReleaseFile.objects.filter(pk__in=repo_version.content):
+        release_file_dict = deb822.Release(release_file.main_artifact.file)
+        if release_file_dict.get("Acquire-By-Hash", "").strip().lower() == "yes":
+            release_dir = os.path.dirname(release_file.relative_path)
+            announced_paths.update(
+                os.path.normpath(os.path.join(release_dir, unit["Name"]))
+                for unit in release_file_dict.get("SHA256", [])
+            )
+    if not announced_paths:
+        return
+
+    content_artifacts = ContentArtifact.objects.filter(
+        content__in=repo_version.content, relative_path__in=announced_paths
+    ).select_related("artifact")
+    # Variants of the indices that were not downloaded only have a RemoteArtifact:
+    remote_sha256s = dict(
+        RemoteArtifact.objects.filter(content_artifact__in=content_artifacts).values_list(
+            "content_artifact", "sha256"
+        )
+    )
+    published_artifacts = {}
+    for content_artifact in content_artifacts.iterator():
+        if content_artifact.artifact:
+            sha256 = content_artifact.artifact.sha256
+        else:
+            sha256 = remote_sha256s.get(content_artifact.pk)
+        if not sha256:
+            continue
+        relative_path = os.path.join(
+            os.path.dirname(content_artifact.relative_path), "by-hash", "SHA256", sha256
+        )
+        published_artifacts[relative_path] = PublishedArtifact(
+            relative_path=relative_path,
+            publication=publication,
+            content_artifact=content_artifact,
+        )
+    PublishedArtifact.objects.bulk_create(published_artifacts.values())
+
+
 def publish(
     repository_version_pk,
     simple=False,
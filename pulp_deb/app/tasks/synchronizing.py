@@ -1,33 +1,57 @@
 import asyncio
 import aiohttp
+import django
+import multiprocessing
 import os
-import shutil
+import re
 import bz2
+import copy
 import gzip
 import lzma
 import gnupg
 import hashlib
+import json
+import shutil
+import sys
+import time
 
 from asgiref.sync import sync_to_async
-from collections import defaultdict
-from tempfile import NamedTemporaryFile
+from collections import defaultdict, deque
+from contextlib import AsyncExitStack
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatchcase
+from tempfile import NamedTemporaryFile, TemporaryDirectory, mkdtemp, mkstemp
 from debian import deb822
-from urllib.parse import quote, urlparse, urlunparse, urljoin
+from urllib.parse import quote, unquote, urlparse, urlunparse, urljoin
+from uuid import UUID, uuid4
 from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
 from django.db.utils import IntegrityError
+from opentelemetry.metrics import get_meter
 
-from pulpcore.plugin.exceptions import DigestValidationError
+from pulpcore.plugin.download import DownloadResult, HttpDownloader
+from pulpcore.plugin.exceptions import DigestValidationError, SizeValidationError
+from pulpcore.plugin import pulp_hashlib
 
+from pulpcore.plugin.constants import TASK_STATES
 from pulpcore.plugin.models import (
     Artifact,
+    Content,
+    ContentArtifact,
     ProgressReport,
     Remote,
+    RemoteArtifact,
+    Task,
+    TaskGroup,
 )
 
 from pulpcore.plugin.stages import (
+    ContentAssociation,
     DeclarativeArtifact,
     DeclarativeContent,
     DeclarativeVersion,
+    EndStage,
     Stage,
     QueryExistingArtifacts,
     ArtifactDownloader,
@@ -36,7 +60,11 @@ from pulpcore.plugin.stages import (
     ContentSaver,
     RemoteArtifactSaver,
     ResolveContentFutures,
+    create_pipeline,
 )
+from pulpcore.plugin.serializers import RemoteSerializer
+from pulpcore.plugin.sync import sync_to_async_iterable
+from pulpcore.plugin.tasking import dispatch
 
 from pulp_deb.app.models import (
     GenericContent,
@@ -51,6 +79,7 @@ from pulp_deb.app.models import (
     InstallerPackage,
     AptRemote,
     AptRepository,
+    AptSyncCheckpoint,
 )
 
 from pulp_deb.app.serializers import (
@@ -87,6 +116,23 @@ class NoReleaseFile(Exception):
         )
 
 
+class DistributedSyncFailed(Exception):
+    """
+    Exception to signal, that the sync of some distributions of a distributed sync failed.
+    """
+
+    def __init__(self, count, *args, **kwargs):
+        """
+        Exception to signal, that the sync of some distributions of a distributed sync failed.
+        """
+        super().__init__(
+            "The sync of {} distribution(s) failed, see the failed tasks of this task "
+            "group.".format(count),
+            *args,
+            **kwargs,
+        )
+
+
 class NoValidSignatureForKey(Exception):
     """
     Exception to signal, that verification of release file with provided GPG key fails.
@@ -176,30 +222,186 @@ def synchronize(remote_pk, repository_pk, mirror, optimize):
     repository = AptRepository.objects.get(pk=repository_pk)
     previous_repo_version = repository.latest_version()
 
-    # TODO: The optimize feature currently does not work in combination with mirror=True! We fall
-    # back to full sync for now, until a proper fix is ready:
-    if mirror:
-        log.info(_("Falling back to optimize=False behaviour since mirror=True is set!"))
-        optimize = False
-
     if not remote.url:
         raise ValueError(_("A remote must have a url specified to synchronize."))
 
     first_stage = DebFirstStage(remote, optimize, mirror, previous_repo_version)
     DebDeclarativeVersion(first_stage, repository, mirror=mirror).create()
+    # The sync is complete, so there is nothing left to resume:
+    AptSyncCheckpoint.objects.filter(repository=repository, remote=remote).delete()
+
+
+def synchronize_distributed(remote_pk, repository_pk, mirror, optimize):
+    """
+    Sync content from the remote repository, using a child task per distribution.
+
+    The child tasks sync their distribution into a hidden staging repository each, so they can run
+    on different workers at the same time. A final task merges the staging repositories into a new
+    version of the repository. All of these tasks are dispatched to the task group of this task.
+
+    Args:
+        remote_pk (str): The remote PK.
+        repository_pk (str): The repository PK.
+        mirror (bool): True for mirror mode, False for additive.
+        optimize (bool): Optimize mode.
+
+    Raises:
+        ValueError: If the remote does not specify a URL to sync
+
+    """
+    remote = AptRemote.objects.get(pk=remote_pk)
+    repository = AptRepository.objects.get(pk=repository_pk)
+
+    if not remote.url:
+        raise ValueError(_("A remote must have a url specified to synchronize."))
+
+    task_group = TaskGroup.current()
+    staging_repositories = []
+    child_task_pks = []
+    for distribution in remote.distributions.split():
+        staging_repository = AptRepository.objects.create(
+            name="{}-sync-{}".format(repository.name, uuid4()), user_hidden=True
+        )
+        staging_repositories.append(staging_repository)
+        child_task = dispatch(
+            synchronize_distribution,
+            task_group=task_group,
+            exclusive_resources=[staging_repository],
+            shared_resources=[repository, remote],
+            kwargs={
+                "remote_pk": str(remote.pk),
+                "repository_pk": str(repository.pk),
+                "staging_repository_pk": str(staging_repository.pk),
+                "distribution": distribution,
+                "mirror": mirror,
+                "optimize": optimize,
+            },
+        )
+        child_task_pks.append(str(child_task.pk))
+    # The merge waits for the child tasks, since it needs all of their staging repositories:
+    dispatch(
+        merge_distributed_sync,
+        task_group=task_group,
+        exclusive_resources=[repository] + staging_repositories,
+        shared_resources=[remote],
+        kwargs={
+            "remote_pk": str(remote.pk),
+            "repository_pk": str(repository.pk),
+            "staging_repository_pks": [str(staging.pk) for staging in staging_repositories],
+            "child_task_pks": child_task_pks,
+            "mirror": mirror,
+        },
+    )
+    task_group.finish()
+
+
+def synchronize_distribution(
+    remote_pk, repository_pk, staging_repository_pk, distribution, mirror, optimize
+):
+    """
+    Sync one distribution of the remote into a staging repository, for a distributed sync.
+
+    The repository itself is left unchanged, but its latest version is the basis for optimize mode,
+    just like for a regular sync.
+    """
+    remote = AptRemote.objects.get(pk=remote_pk)
+    repository = AptRepository.objects.get(pk=repository_pk)
+    staging_repository = AptRepository.objects.get(pk=staging_repository_pk)
+
+    first_stage = DebFirstStage(
+        remote, optimize, mirror, repository.latest_version(), distributions=[distribution]
+    )
+    DebDeclarativeVersion(first_stage, staging_repository, mirror=mirror).create()
+
+
+def merge_distributed_sync(
+    remote_pk, repository_pk, staging_repository_pks, child_task_pks, mirror
+):
+    """
+    Merge the staging repositories of a distributed sync into a new version of the repository.
+
+    Raises:
+        DistributedSyncFailed: If the sync of any distribution failed
+
+    """
+    remote = AptRemote.objects.get(pk=remote_pk)
+    repository = AptRepository.objects.get(pk=repository_pk)
+    staging_repositories = AptRepository.objects.filter(pk__in=staging_repository_pks)
+
+    try:
+        failed_count = (
+            Task.objects.filter(pk__in=child_task_pks).exclude(state=TASK_STATES.COMPLETED).count()
+        )
+        if failed_count:
+            raise DistributedSyncFailed(failed_count)
+
+        staging_versions = [staging.latest_version() for staging in staging_repositories]
+        staging_content = Q()
+        sync_info = {}
+        for staging_version in staging_versions:
+            staging_content |= Q(pk__in=staging_version.content.values("pk"))
+            # The staging versions share the remote and sync options, but not the validators:
+            release_file_validators = sync_info.get("release_file_validators", {})
+            sync_info.update(staging_version.info)
+            release_file_validators.update(staging_version.info["release_file_validators"])
+            sync_info["release_file_validators"] = release_file_validators
+
+        with repository.new_version() as new_version:
+            if mirror:
+                new_version.remove_content(new_version.content.exclude(staging_content))
+            new_version.add_content(Content.objects.filter(staging_content))
+            # The metrics of each distribution remain in the progress reports of its child task:
+            sync_info.pop("sync_metrics", None)
+            new_version.info = sync_info
+    finally:
+        staging_repositories.delete()
+    # The sync is complete, so there is nothing left to resume:
+    AptSyncCheckpoint.objects.filter(repository=repository, remote=remote).delete()
 
 
 class DeclarativeFailsafeArtifact(DeclarativeArtifact):
     """
     A declarative artifact that does not fail on 404.
+
+    It also keeps the HTTP validators (ETag and Last-Modified) of the response, and downloads from
+    the immutable by_hash_url first if there is one, falling back to the urls. If the artifact
+    cannot be downloaded, its deferred fallback_d_artifacts are downloaded in turn instead, until
+    one of them succeeds.
     """
 
+    validators = None
+    fallback_d_artifacts = ()
+
+    def __init__(self, *args, by_hash_url=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.by_hash_url = by_hash_url
+
     async def download(self):
         """
-        Download the artifact and set to None on 404.
+        Download the artifact and set to None on 404, falling back to the fallback_d_artifacts.
         """
+        download_result = await self._download()
+        if self.artifact is not None:
+            return download_result
+        for d_artifact in self.fallback_d_artifacts:
+            message = "Falling back to the artifact with relative_path='{}'."
+            log.info(_(message).format(d_artifact.relative_path))
+            d_artifact.deferred_download = False
+            if not d_artifact.artifact._state.adding:
+                # The artifact has been downloaded before:
+                return None
+            download_result = await d_artifact.download()
+            if d_artifact.artifact is not None:
+                return download_result
+
+    async def _download(self):
+        urls = self.urls
+        if self.by_hash_url:
+            # The url remains the plain one, which is kept for on-demand downloads, since upstream
+            # repos expire their by-hash files:
+            self.urls = [self.by_hash_url, *urls]
         try:
-            await super().download()
+            download_result = await super().download()
         except aiohttp.client_exceptions.ClientResponseError as e:
             if e.code == 404:
                 self.artifact = None
@@ -210,6 +412,12 @@ class DeclarativeFailsafeArtifact(DeclarativeArtifact):
                 )
             else:
                 raise
+        except FileNotFoundError:
+            # The equivalent of a 404 for file:// remotes
+            self.artifact = None
+            log.info(
+                _("Artifact with relative_path='{}' not found. Ignored").format(self.relative_path)
+            )
         except DigestValidationError:
             self.artifact = None
             log.info(
@@ -217,6 +425,453 @@ class DeclarativeFailsafeArtifact(DeclarativeArtifact):
                     self.relative_path
                 )
             )
+        else:
+            self.validators = _get_http_validators(download_result.headers)
+            return download_result
+        finally:
+            self.urls = urls
+
+
+class DeclarativeNotifyingContent(DeclarativeContent):
+    """
+    A declarative content that passes itself to on_resolved once its content has been saved.
+
+    Unlike awaiting its resolution, this does not keep the pipeline from batching it.
+    """
+
+    def __init__(self, *args, on_resolved=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.on_resolved = on_resolved
+
+    def resolve(self):
+        """
+        Resolve the content unit and notify on_resolved.
+        """
+        super().resolve()
+        if self.on_resolved:
+            self.on_resolved(self)
+
+
+class DeclarativeLinkedArtifact(DeclarativeArtifact):
+    """
+    A declarative artifact for a file:// url, which is hardlinked rather than downloaded.
+
+    The digests the artifact was declared with are trusted, and only the missing ones are computed.
+    """
+
+    async def download(self):
+        """
+        Link the file into the working directory and update the associated Artifact.
+        """
+        path = unquote(urlparse(self.url).path)
+        RemoteSerializer().validate_url("file://" + path)
+        linked_path, artifact_attributes = await sync_to_async(
+            _link_artifact_file, thread_sensitive=False
+        )(path, self.artifact, self.url)
+        self.artifact = Artifact(**artifact_attributes, file=linked_path)
+        return DownloadResult(
+            url=self.url, artifact_attributes=artifact_attributes, path=linked_path, headers=None
+        )
+
+
+# Number of failed downloads in a row after which an upstream mirror is demoted:
+MIRROR_MAX_FAILURES = 3
+# Weight of the latest download in the moving average of the throughput of an upstream mirror:
+MIRROR_THROUGHPUT_SMOOTHING = 0.3
+
+
+class UpstreamMirrors:
+    """
+    The health of the upstream mirrors of a remote, used to spread downloads across them.
+
+    Mirrors are ranked by the estimated time to complete one more download: their number of active
+    downloads divided by their measured throughput. Mirrors that failed MIRROR_MAX_FAILURES
+    downloads in a row are demoted behind all others, until a download from them succeeds again.
+    """
+
+    def __init__(self, base_urls):
+        self.active = dict.fromkeys(base_urls, 0)
+        self.failures = dict.fromkeys(base_urls, 0)
+        # Exponential moving average of the download throughput in bytes per second:
+        self.throughput = {}
+
+    def rank(self, base_urls):
+        """
+        Return the base_urls ordered from the healthiest to the least healthy mirror.
+        """
+        # Mirrors without a measurement yet are assumed to be as fast as the fastest one:
+        default_throughput = max(self.throughput.values(), default=1.0)
+
+        def score(base_url):
+            return (
+                self.failures[base_url] >= MIRROR_MAX_FAILURES,
+                (self.active[base_url] + 1) / self.throughput.get(base_url, default_throughput),
+            )
+
+        return sorted(base_urls, key=score)
+
+    def started(self, base_url):
+        """
+        Record the start of a download from the mirror.
+        """
+        self.active[base_url] += 1
+
+    def succeeded(self, base_url, size, seconds):
+        """
+        Record a download of size bytes from the mirror that took the given seconds.
+        """
+        self.active[base_url] -= 1
+        self.failures[base_url] = 0
+        if size and seconds > 0:
+            throughput = size / seconds
+            previous_throughput = self.throughput.get(base_url, throughput)
+            self.throughput[base_url] = (
+                MIRROR_THROUGHPUT_SMOOTHING * throughput
+                + (1 - MIRROR_THROUGHPUT_SMOOTHING) * previous_throughput
+            )
+
+    def failed(self, base_url):
+        """
+        Record a failed download from the mirror.
+        """
+        self.active[base_url] -= 1
+        self.failures[base_url] += 1
+        if self.failures[base_url] == MIRROR_MAX_FAILURES:
+            log.warning(
+                _("Demoting upstream mirror '{}' after repeated failures.").format(base_url)
+            )
+
+
+class DeclarativeMirroredArtifact(DeclarativeArtifact):
+    """
+    A declarative artifact available from several upstream mirrors.
+
+    It is downloaded from the healthiest of the mirrors, falling back to the others on failure.
+    The url and remote of the artifact remain the ones of the first mirror, which is the remote url.
+    """
+
+    def __init__(self, *args, mirrors=None, base_urls=None, mirror_remotes=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.mirrors = mirrors
+        # The base url of the mirror of each of the urls:
+        self.base_urls = dict(zip(base_urls, self.urls))
+        # The remote to download from each mirror with:
+        self.mirror_remotes = mirror_remotes
+
+    async def download(self):
+        """
+        Download the artifact from the healthiest mirror and record the mirror's health.
+        """
+        urls = self.urls
+        remote = self.remote
+        ranked_base_urls = self.mirrors.rank(self.base_urls)
+        try:
+            for base_url in ranked_base_urls:
+                self.urls = [self.base_urls[base_url]]
+                self.remote = self.mirror_remotes[base_url]
+                self.mirrors.started(base_url)
+                start = time.monotonic()
+                try:
+                    download_result = await super().download()
+                except Exception:
+                    self.mirrors.failed(base_url)
+                    if base_url == ranked_base_urls[-1]:
+                        raise
+                else:
+                    self.mirrors.succeeded(base_url, self.artifact.size, time.monotonic() - start)
+                    return download_result
+        finally:
+            self.urls = urls
+            self.remote = remote
+
+
+def _get_third_party_remote(remote):
+    """
+    Get an unsaved copy of the remote to download from upstream mirrors on other hosts with.
+
+    The credentials, client certificate and headers of the remote are meant for the host of the
+    remote url only, so the copy goes without them.
+    """
+    mirror_remote = copy.copy(remote)
+    # The copy must not share the downloader factory, whose session holds the client certificate:
+    mirror_remote.__dict__.pop("_download_factory", None)
+    mirror_remote.username = None
+    mirror_remote.password = None
+    mirror_remote.client_cert = None
+    mirror_remote.client_key = None
+    mirror_remote.headers = None
+    return mirror_remote
+
+
+class StageMetrics:
+    """
+    The wall time, item counts and queue waits of a pipeline stage.
+
+    The input wait is the time the stage spent waiting for its next item or batch, from asking for
+    it to its arrival, and None if the stage asks for its input ahead of time (see
+    InstrumentedStage). The output wait is the time it spent blocked on its full output queue.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = 0.0
+        self.items_in = 0
+        self.items_out = 0
+        self.input_wait = 0.0
+        self.output_wait = 0.0
+
+    def summary(self):
+        """
+        Summarize the metrics as a JSON serializable dict.
+        """
+        # The first stage has no input, so its throughput is the one of its output:
+        items = self.items_in or self.items_out
+        return {
+            "name": self.name,
+            "wall_time": round(self.wall_time, 3),
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "items_per_second": round(items / self.wall_time, 1) if self.wall_time else 0.0,
+            "input_wait": None if self.input_wait is None else round(self.input_wait, 3),
+            "output_wait": round(self.output_wait, 3),
+        }
+
+
+class MeasuredQueue:
+    """
+    A pipeline queue recording the items passing through it, and the time waiting to put them.
+    """
+
+    def __init__(self, queue, stage_metrics):
+        self.queue = queue
+        self.stage_metrics = stage_metrics
+
+    async def get(self):
+        item = await self.queue.get()
+        if item is not None:
+            self.stage_metrics.items_in += 1
+        return item
+
+    def get_nowait(self):
+        item = self.queue.get_nowait()
+        if item is not None:
+            self.stage_metrics.items_in += 1
+        return item
+
+    async def put(self, item):
+        start = time.monotonic()
+        await self.queue.put(item)
+        self.stage_metrics.output_wait += time.monotonic() - start
+        if item is not None:
+            self.stage_metrics.items_out += 1
+
+    def __getattr__(self, name):
+        return getattr(self.queue, name)
+
+
+class InstrumentedStage(Stage):
+    """
+    A wrapper measuring a pipeline stage, see SyncMetrics.
+
+    The input wait is measured in the items() and batches() iterators of the stage, rather than on
+    its input queue: batches() keeps a get() on the queue pending while the stage works on the
+    current batch, which is not time spent waiting. Stages asking for their next item from another
+    task, like the ArtifactDownloader does while it downloads, are not held up by the wait either,
+    so their input wait is not measured.
+    """
+
+    def __init__(self, stage, stage_metrics):
+        super().__init__()
+        self.stage = stage
+        self.stage_metrics = stage_metrics
+        self.task = None
+        stage.items = self._measure_input_wait(stage.items)
+        stage.batches = self._measure_input_wait(stage.batches)
+
+    def _measure_input_wait(self, iterate):
+        async def measured_iterate(*args, **kwargs):
+            iterator = iterate(*args, **kwargs)
+            try:
+                while True:
+                    start = time.monotonic()
+                    try:
+                        item = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    finally:
+                        self._add_input_wait(time.monotonic() - start)
+                    yield item
+            finally:
+                await iterator.aclose()
+
+        return measured_iterate
+
+    def _add_input_wait(self, seconds):
+        if asyncio.current_task() is not self.task:
+            self.stage_metrics.input_wait = None
+        elif self.stage_metrics.input_wait is not None:
+            self.stage_metrics.input_wait += seconds
+
+    def _connect(self, in_q, out_q):
+        super()._connect(in_q, out_q)
+        self.stage._connect(
+            in_q and MeasuredQueue(in_q, self.stage_metrics),
+            out_q and MeasuredQueue(out_q, self.stage_metrics),
+        )
+
+    async def __call__(self):
+        self.task = asyncio.current_task()
+        start = time.monotonic()
+        try:
+            await self.stage()
+        finally:
+            self.stage_metrics.wall_time = time.monotonic() - start
+
+
+# Instruments exporting the sync metrics, which do nothing unless an OpenTelemetry SDK is set up:
+meter = get_meter(__name__)
+stage_duration_histogram = meter.create_histogram(
+    "pulp_deb.sync.stage.duration", unit="s", description="Wall time of a sync pipeline stage."
+)
+stage_wait_histogram = meter.create_histogram(
+    "pulp_deb.sync.stage.wait",
+    unit="s",
+    description="Time a sync pipeline stage waited on a queue.",
+)
+stage_items_counter = meter.create_counter(
+    "pulp_deb.sync.stage.items", description="Items handled by a sync pipeline stage."
+)
+package_index_parse_duration_histogram = meter.create_histogram(
+    "pulp_deb.sync.package_index.parse_duration",
+    unit="s",
+    description="Time spent parsing a package index.",
+)
+package_index_paragraphs_counter = meter.create_counter(
+    "pulp_deb.sync.package_index.paragraphs", description="Package paragraphs parsed."
+)
+
+
+class SyncMetrics:
+    """
+    Timing and throughput measurements of a sync, collected if the SYNC_METRICS setting is enabled.
+
+    These cover the wall time, item counts and queue waits of each stage of the pipeline, as well
+    as the number of package paragraphs and the parse time of each package index. Once the pipeline
+    has finished, they are stored as a single summary in the "sync_metrics" info of the new
+    repository version and in progress reports of the sync task, and exported as OpenTelemetry
+    metrics.
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.package_indices = defaultdict(lambda: {"paragraphs": 0, "parse_time": 0.0})
+
+    def instrument(self, stages):
+        """
+        Wrap the stages of a pipeline, so they are measured.
+        """
+        instrumented_stages = []
+        for stage in stages:
+            stage_metrics = StageMetrics(stage.__class__.__name__)
+            self.stages.append(stage_metrics)
+            instrumented_stages.append(InstrumentedStage(stage, stage_metrics))
+        return instrumented_stages
+
+    def count_paragraphs(self, package_index_dir, chunks):
+        """
+        Count the paragraphs of the scanned package index chunks passing through.
+        """
+        for chunk in chunks:
+            self.package_indices[package_index_dir]["paragraphs"] += len(chunk)
+            yield chunk
+
+    async def time_parsing(self, package_index_dir, package_records):
+        """
+        Measure the time spent producing the package records passing through.
+
+        Only the time spent waiting for the next record counts, not the time the consumer spends
+        handling it.
+        """
+        package_index_metrics = self.package_indices[package_index_dir]
+        while True:
+            start = time.monotonic()
+            try:
+                package_record = await package_records.__anext__()
+            except StopAsyncIteration:
+                break
+            finally:
+                package_index_metrics["parse_time"] += time.monotonic() - start
+            yield package_record
+
+    def summary(self):
+        """
+        Summarize the metrics as a JSON serializable dict.
+        """
+        return {
+            "stages": [stage_metrics.summary() for stage_metrics in self.stages],
+            "package_indices": {
+                package_index_dir: {
+                    "paragraphs": package_index_metrics["paragraphs"],
+                    "parse_time": round(package_index_metrics["parse_time"], 3),
+                }
+                for package_index_dir, package_index_metrics in sorted(self.package_indices.items())
+            },
+        }
+
+    def save(self, new_version):
+        """
+        Store the summary in the new repository version and the sync task, and export it.
+        """
+        summary = self.summary()
+        new_version.info["sync_metrics"] = summary
+        package_indices = summary["package_indices"].values()
+        paragraphs = sum(package_index["paragraphs"] for package_index in package_indices)
+        parse_time = sum(package_index["parse_time"] for package_index in package_indices)
+
+        task = Task.current()
+        if task is not None:
+            message = "Stage {}: {:.1f}s, {} items/s, waited {} for input, {:.1f}s for output"
+            progress_reports = [
+                ProgressReport(
+                    message=_(message).format(
+                        stage["name"],
+                        stage["wall_time"],
+                        stage["items_per_second"],
+                        "-"
+                        if stage["input_wait"] is None
+                        else "{:.1f}s".format(stage["input_wait"]),
+                        stage["output_wait"],
+                    ),
+                    code="sync.metrics.stage",
+                    state=TASK_STATES.COMPLETED,
+                    done=stage["items_in"] or stage["items_out"],
+                    task=task,
+                )
+                for stage in summary["stages"]
+            ]
+            if package_indices:
+                message = "Parsed {} package indices in {:.1f}s"
+                progress_reports.append(
+                    ProgressReport(
+                        message=_(message).format(len(package_indices), parse_time),
+                        code="sync.metrics.package_indices",
+                        state=TASK_STATES.COMPLETED,
+                        done=paragraphs,
+                        task=task,
+                    )
+                )
+            ProgressReport.objects.bulk_create(progress_reports)
+
+        for stage in summary["stages"]:
+            attributes = {"stage": stage["name"]}
+            stage_duration_histogram.record(stage["wall_time"], attributes)
+            if stage["input_wait"] is not None:
+                stage_wait_histogram.record(stage["input_wait"], {**attributes, "queue": "input"})
+            stage_wait_histogram.record(stage["output_wait"], {**attributes, "queue": "output"})
+            stage_items_counter.add(stage["items_in"] or stage["items_out"], attributes)
+        for package_index in package_indices:
+            package_index_parse_duration_histogram.record(package_index["parse_time"])
+            package_index_paragraphs_counter.add(package_index["paragraphs"])
 
 
 class DebDeclarativeVersion(DeclarativeVersion):
@@ -224,6 +879,36 @@ class DebDeclarativeVersion(DeclarativeVersion):
     This class creates the Pipeline.
     """
 
+    def create(self):
+        """
+        Perform the work. This is the long-blocking call where all syncing occurs.
+
+        Unlike DeclarativeVersion.create(), this uses the DebContentAssociation stage, so content
+        the first stage carries over from the previous version is neither lost nor removed. If the
+        SYNC_METRICS setting is enabled, the stages are measured (see SyncMetrics).
+
+        Returns: The created RepositoryVersion or None if it represents no change from the latest.
+        """
+        with TemporaryDirectory(dir="."):
+            with self.repository.new_version() as new_version:
+                loop = asyncio.get_event_loop()
+                stages = self.pipeline_stages(new_version)
+                stages.append(
+                    DebContentAssociation(
+                        new_version, self.mirror, self.first_stage.bulk_content_pks
+                    )
+                )
+                stages.append(EndStage())
+                metrics = self.first_stage.metrics
+                if metrics is not None:
+                    stages = metrics.instrument(stages)
+                pipeline = create_pipeline(stages)
+                loop.run_until_complete(pipeline)
+                if metrics is not None:
+                    metrics.save(new_version)
+
+        return new_version if new_version.complete else None
+
     def pipeline_stages(self, new_version):
         """
         Build the list of pipeline stages feeding into the ContentAssociation stage.
@@ -253,6 +938,85 @@ class DebDeclarativeVersion(DeclarativeVersion):
         return pipeline
 
 
+# The field keying the previous units of each metadata model (see _get_previous_metadata):
+PREVIOUS_METADATA_KEYS = {
+    ReleaseFile: "distribution",
+    PackageIndex: "relative_path",
+    InstallerFileIndex: "relative_path",
+}
+# Number of content units to associate with the new version in bulk at a time:
+BULK_CONTENT_BATCH_SIZE = 10000
+# Number of PackageReleaseComponents to insert into the database at a time:
+PACKAGE_RELEASE_COMPONENT_BATCH_SIZE = 1000
+
+
+class DebContentAssociation(ContentAssociation):
+    """
+    A ContentAssociation stage that also associates the content the first stage handled in bulk.
+
+    When optimize mode skips an unchanged ReleaseFile or PackageIndex, the first stage does not
+    emit the content belonging to it, but adds its primary keys to bulk_content_pks instead. The
+    same goes for PackageReleaseComponents, which the first stage creates in bulk. That content is
+    associated with the new version in batches, and is never removed in mirror mode.
+    """
+
+    def __init__(self, new_version, mirror, bulk_content_pks, *args, **kwargs):
+        super().__init__(new_version, mirror, *args, **kwargs)
+        self.bulk_content_pks = bulk_content_pks
+
+    async def run(self):
+        """
+        The coroutine for this stage.
+
+        Returns:
+            The coroutine for this stage.
+        """
+        async with ProgressReport(message="Associating Content", code="associating.content") as pb:
+            to_delete = {
+                i
+                async for i in sync_to_async_iterable(
+                    self.new_version.content.values_list("pk", flat=True)
+                )
+            }
+            associated = set(to_delete)
+
+            async for batch in self.batches():
+                to_add = set()
+                for d_content in batch:
+                    try:
+                        to_delete.remove(d_content.content.pk)
+                    except KeyError:
+                        to_add.add(d_content.content.pk)
+                        await self.put(d_content)
+
+                if to_add:
+                    await sync_to_async(self.new_version.add_content)(
+                        Content.objects.filter(pk__in=to_add)
+                    )
+                    associated.update(to_add)
+                    await pb.aincrease_by(len(to_add))
+
+            # The first stage is done, so all bulk content is known by now:
+            to_delete.difference_update(self.bulk_content_pks)
+            to_add = list(self.bulk_content_pks.difference(associated))
+            for i in range(0, len(to_add), BULK_CONTENT_BATCH_SIZE):
+                batch = to_add[i : i + BULK_CONTENT_BATCH_SIZE]
+                await sync_to_async(self.new_version.add_content)(
+                    Content.objects.filter(pk__in=batch)
+                )
+                await pb.aincrease_by(len(batch))
+
+            if self.allow_delete:
+                async with ProgressReport(
+                    message="Un-Associating Content", code="unassociating.content"
+                ) as pb:
+                    if to_delete:
+                        await sync_to_async(self.new_version.remove_content)(
+                            Content.objects.filter(pk__in=to_delete)
+                        )
+                        await pb.aincrease_by(len(to_delete))
+
+
 def _filter_split_architectures(release_file_string, remote_string, distribution):
     """
     Returns the set intersection of the two architectures strings provided as a sorted list. If the
@@ -322,13 +1086,7 @@ class DebUpdateReleaseFileAttributes(Stage):
         self.remote = remote
         self.gpgkey = remote.gpgkey
         if self.gpgkey:
-            gnupghome = os.path.join(os.getcwd(), "gpg-home")
-            os.makedirs(gnupghome)
-            self.gpg = gnupg.GPG(gpgbinary="/usr/bin/gpg", gnupghome=gnupghome)
-            import_res = self.gpg.import_keys(self.gpgkey)
-            if import_res.count == 0:
-                log.warning(_("Key import failed."))
-            pass
+            self.gpg = _get_gpg(self.gpgkey)
 
     async def run(self):
         """
@@ -349,13 +1107,14 @@ class DebUpdateReleaseFileAttributes(Stage):
                     if "Release" in da_names:
                         if "Release.gpg" in da_names:
                             if self.gpgkey:
-                                with NamedTemporaryFile() as tmp_file:
-                                    tmp_file.write(da_names["Release"].artifact.file.read())
-                                    tmp_file.flush()
-                                    verified = self.gpg.verify_file(
-                                        da_names["Release.gpg"].artifact.file, tmp_file.name
-                                    )
-                                if verified.valid:
+                                verified = await sync_to_async(
+                                    _verify_release_signature, thread_sensitive=False
+                                )(
+                                    self.gpg,
+                                    da_names["Release"].artifact,
+                                    da_names["Release.gpg"].artifact,
+                                )
+                                if verified:
                                     log.info(_("Verification of Release successful."))
                                     release_file_artifact = da_names["Release"].artifact
                                     release_file.relative_path = da_names["Release"].relative_path
@@ -380,8 +1139,10 @@ class DebUpdateReleaseFileAttributes(Stage):
 
                     if "InRelease" in da_names:
                         if self.gpgkey:
-                            verified = self.gpg.verify_file(da_names["InRelease"].artifact.file)
-                            if verified.valid:
+                            verified = await sync_to_async(
+                                _verify_release_signature, thread_sensitive=False
+                            )(self.gpg, da_names["InRelease"].artifact)
+                            if verified:
                                 log.info(_("Verification of InRelease successful."))
                                 release_file_artifact = da_names["InRelease"].artifact
                                 release_file.relative_path = da_names["InRelease"].relative_path
@@ -445,6 +1206,92 @@ class DebUpdateReleaseFileAttributes(Stage):
                 await self.put(d_content)
 
 
+def _get_gpg(gpgkey):
+    """
+    Get a GPG instance using a keyring that contains the given gpgkey.
+
+    There is one keyring per gpgkey, which persists across syncs in GPG_KEYRING_DIRECTORY, so the
+    key is only imported once. The keyring also holds the cached Release file verification results.
+    """
+    keyring_directory = settings.GPG_KEYRING_DIRECTORY or os.path.join(
+        settings.WORKING_DIRECTORY, "deb-gpg"
+    )
+    gnupghome = os.path.join(keyring_directory, hashlib.sha256(gpgkey.encode()).hexdigest())
+    if not os.path.isdir(gnupghome):
+        # Set up the keyring in a temporary directory first, so concurrent syncs never use a
+        # keyring the key has not been imported into yet:
+        os.makedirs(keyring_directory, exist_ok=True)
+        tmp_gnupghome = mkdtemp(dir=keyring_directory)
+        gpg = gnupg.GPG(gpgbinary="/usr/bin/gpg", gnupghome=tmp_gnupghome)
+        import_res = gpg.import_keys(gpgkey)
+        if import_res.count == 0:
+            log.warning(_("Key import failed."))
+        os.makedirs(os.path.join(tmp_gnupghome, "verified"))
+        try:
+            os.rename(tmp_gnupghome, gnupghome)
+        except OSError:
+            # A concurrent sync has set up the keyring in the meantime.
+            shutil.rmtree(tmp_gnupghome, ignore_errors=True)
+    return gnupg.GPG(gpgbinary="/usr/bin/gpg", gnupghome=gnupghome)
+
+
+def _verify_release_signature(gpg, artifact, signature_artifact=None):
+    """
+    Verify the inline signature of an InRelease or the detached signature of a Release artifact.
+
+    Successful verifications are cached in the keyring by the sha256 of the verified artifacts, so
+    unchanged Release files are not verified again on later syncs. A cached result is used until
+    the signature or the key that made it expires.
+
+    Returns:
+        bool: True if the signature is valid.
+    """
+    cache_key = artifact.sha256
+    if signature_artifact is not None:
+        cache_key += signature_artifact.sha256
+    cache_path = os.path.join(gpg.gnupghome, "verified", cache_key)
+    try:
+        with open(cache_path) as cache_file:
+            if float(cache_file.read()) > time.time():
+                return True
+    except (OSError, ValueError):
+        pass
+
+    if signature_artifact is None:
+        verified = gpg.verify_file(artifact.file)
+    else:
+        try:
+            release_file_path = artifact.file.path
+        except NotImplementedError:
+            release_file_path = None
+        if release_file_path:
+            verified = gpg.verify_file(signature_artifact.file, release_file_path)
+        else:
+            # The storage backend does not provide local paths, so a copy of the Release is needed:
+            with NamedTemporaryFile() as tmp_file:
+                tmp_file.write(artifact.file.read())
+                tmp_file.flush()
+                verified = gpg.verify_file(signature_artifact.file, tmp_file.name)
+    if not verified.valid:
+        return False
+
+    # Expiry timestamps are empty or 0 if the signature or key do not expire:
+    timestamps = [verified.expire_timestamp]
+    timestamps.extend(
+        key["expires"]
+        for key in gpg.list_keys()
+        if key["fingerprint"] == verified.pubkey_fingerprint
+    )
+    valid_until = min(
+        (float(timestamp) for timestamp in timestamps if timestamp and float(timestamp) > 0),
+        default=float("inf"),
+    )
+    with NamedTemporaryFile("w", dir=os.path.dirname(cache_path), delete=False) as cache_file:
+        cache_file.write(str(valid_until))
+    os.replace(cache_file.name, cache_path)
+    return True
+
+
 class DebUpdatePackageIndexAttributes(Stage):  # TODO: Needs a new name
     """
     This stage handles PackageIndex content.
@@ -461,22 +1308,28 @@ class DebUpdatePackageIndexAttributes(Stage):  # TODO: Needs a new name
         ) as pb:
             async for d_content in self.items():
                 if isinstance(d_content.content, PackageIndex):
-                    if not d_content.d_artifacts:
+                    if all(da.deferred_download for da in d_content.d_artifacts):
                         d_content.content = None
                         d_content.resolve()
                         continue
                     content = d_content.content
-                    if not [
+                    main_d_artifacts = [
                         da for da in d_content.d_artifacts if da.artifact.sha256 == content.sha256
-                    ]:
+                    ]
+                    if not main_d_artifacts or main_d_artifacts[0].deferred_download:
                         # No main_artifact found, uncompress one
                         relative_dir = os.path.dirname(d_content.content.relative_path)
-                        filename = _uncompress_artifact(d_content.d_artifacts, relative_dir)
+                        artifact = await sync_to_async(_uncompress_artifact)(
+                            [da for da in d_content.d_artifacts if not da.deferred_download],
+                            relative_dir,
+                            {"sha256": content.sha256},
+                        )
+                        # It replaces the main artifact to be fetched on demand, if there is one:
+                        for da in main_d_artifacts:
+                            d_content.d_artifacts.remove(da)
                         da = DeclarativeArtifact(
-                            artifact=Artifact.init_and_validate(
-                                filename, expected_digests={"sha256": content.sha256}
-                            ),
-                            url=filename,
+                            artifact=artifact,
+                            url=artifact.file.name,
                             relative_path=content.relative_path,
                             remote=d_content.d_artifacts[0].remote,
                         )
@@ -489,32 +1342,179 @@ class DebUpdatePackageIndexAttributes(Stage):  # TODO: Needs a new name
                 await self.put(d_content)
 
 
-def _uncompress_artifact(d_artifacts, relative_dir):
-    for d_artifact in d_artifacts:
-        ext = os.path.splitext(d_artifact.relative_path)[1]
-        if ext == ".gz":
-            compressor = gzip
-        elif ext == ".bz2":
-            compressor = bz2
-        elif ext == ".xz":
-            compressor = lzma
-        else:
-            log.info(_("Compression algorithm unknown for extension '{}'.").format(ext))
+# Decompressors for package indices, ordered from cheapest to most expensive to decode:
+PACKAGE_INDEX_DECOMPRESSORS = {".gz": gzip, ".xz": lzma, ".bz2": bz2}
+
+
+def _uncompress_artifact(d_artifacts, relative_dir, expected_digests):
+    """
+    Decompress the cheapest to decode of the compressed package index artifacts provided.
+
+    Decompressing, hashing (using all allowed checksums) and writing the uncompressed file happen in
+    a single pass, so the uncompressed file never needs to be read back. Returns an unsaved Artifact
+    for the uncompressed file, which has been validated against the expected_digests.
+    """
+    d_artifacts_by_ext = {os.path.splitext(da.relative_path)[1]: da for da in d_artifacts}
+    for ext, decompressor in PACKAGE_INDEX_DECOMPRESSORS.items():
+        if ext not in d_artifacts_by_ext:
             continue
         # At this point we have found a file that can be decompressed
-        with NamedTemporaryFile(delete=False) as f_out:
-            with compressor.open(d_artifact.artifact.file) as f_in:
-                shutil.copyfileobj(f_in, f_out)
-        return f_out.name
+        with decompressor.open(d_artifacts_by_ext[ext].artifact.file) as f_in:
+            return _write_artifact(iter(lambda: f_in.read(1048576), b""), expected_digests)
     # Not one artifact was suitable
     raise NoPackageIndexFile(relative_dir=relative_dir)
 
 
-class DebDropFailedArtifacts(Stage):
+def _link_artifact_file(path, artifact, url):
     """
-    This stage removes failed failsafe artifacts.
+    Hardlink the file at path into the working directory, or copy it if that is not possible.
 
-    In case we tried to fetch something, but the artifact 404ed, we simply drop it.
+    Returns the new path and the attributes of the Artifact for it. Its size is validated, but only
+    the digests artifact does not have are computed from the file.
+    """
+    fd, linked_path = mkstemp(dir=".", suffix="-" + os.path.basename(path))
+    os.close(fd)
+    try:
+        try:
+            os.link(path, linked_path + ".link")
+            os.replace(linked_path + ".link", linked_path)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # Hardlinks do not cross filesystems
+            shutil.copyfile(path, linked_path)
+        artifact_attributes = {"size": os.path.getsize(linked_path)}
+        if artifact.size and artifact.size != artifact_attributes["size"]:
+            raise SizeValidationError(artifact_attributes["size"], artifact.size, url=url)
+        hashers = {}
+        for name in Artifact.DIGEST_FIELDS:
+            if getattr(artifact, name):
+                artifact_attributes[name] = getattr(artifact, name)
+            else:
+                hashers[name] = pulp_hashlib.new(name)
+        if hashers:
+            with open(linked_path, "rb") as linked_file:
+                for chunk in iter(lambda: linked_file.read(1024 * 1024), b""):
+                    for hasher in hashers.values():
+                        hasher.update(chunk)
+            artifact_attributes.update(
+                {name: hasher.hexdigest() for name, hasher in hashers.items()}
+            )
+    except Exception:
+        os.unlink(linked_path)
+        raise
+    return linked_path, artifact_attributes
+
+
+def _write_artifact(chunks, expected_digests):
+    """
+    Write chunks of bytes to a new file in the working directory, hashing them on the way.
+
+    Returns an unsaved Artifact for the file, which has been validated against the expected_digests.
+    """
+    hashers = {name: pulp_hashlib.new(name) for name in Artifact.DIGEST_FIELDS}
+    size = 0
+    with NamedTemporaryFile(dir=".", delete=False) as f_out:
+        for chunk in chunks:
+            f_out.write(chunk)
+            for hasher in hashers.values():
+                hasher.update(chunk)
+            size += len(chunk)
+    digests = {name: hasher.hexdigest() for name, hasher in hashers.items()}
+    for name, expected_digest in expected_digests.items():
+        if digests[name] != expected_digest:
+            os.unlink(f_out.name)
+            raise DigestValidationError(digests[name], expected_digest)
+    return Artifact(file=f_out.name, size=size, **digests)
+
+
+def _select_pdiffs(diff_index, from_sha256, to_sha256):
+    """
+    Select the pdiffs from a parsed Packages.diff/Index that turn one package index into another.
+
+    Returns a list of (filename, sha256, size) tuples for the compressed patches to download, or
+    None if the diff index does not provide a patch chain from from_sha256 to to_sha256.
+    """
+    current = diff_index.get("SHA256-Current", "").split()
+    if not current or current[0] != to_sha256:
+        return None
+    history = [line.split() for line in diff_index.get("SHA256-History", "").splitlines()]
+    history = [entry for entry in history if len(entry) == 3]
+    downloads = {}
+    for entry in diff_index.get("SHA256-Download", "").splitlines():
+        entry = entry.split()
+        if len(entry) == 3:
+            downloads[entry[2]] = (entry[0], int(entry[1]))
+    for index, (sha256, _size, name) in enumerate(history):
+        if sha256 == from_sha256:
+            break
+    else:
+        return None
+    if diff_index.get("X-Patch-Precedence") == "merged":
+        # Each patch leads straight from its history entry to the current package index.
+        names = [history[index][2]]
+    else:
+        names = [name for _sha256, _size, name in history[index:]]
+    pdiffs = []
+    for name in names:
+        filename = "{}.gz".format(name)
+        if filename not in downloads:
+            return None
+        pdiffs.append((filename,) + downloads[filename])
+    return pdiffs
+
+
+def _apply_ed_script(lines, ed_script):
+    """
+    Apply an ed script (as produced by 'diff --ed' for pdiffs) to a list of lines in place.
+
+    The commands of such a script are ordered from the end of the file to its start, so the line
+    numbers of later commands are unaffected by earlier ones.
+    """
+    ed_script = iter(ed_script)
+    for command in ed_script:
+        command = command.rstrip(b"\n")
+        if not command:
+            continue
+        operation = command[-1:]
+        addresses = command[:-1].split(b",")
+        if operation not in (b"a", b"c", b"d") or not 1 <= len(addresses) <= 2:
+            raise ValueError(_("Unsupported pdiff command '{}'.").format(command.decode()))
+        start = int(addresses[0])
+        end = int(addresses[-1])
+        new_lines = []
+        if operation != b"d":
+            for line in ed_script:
+                if line.rstrip(b"\n") == b".":
+                    break
+                new_lines.append(line)
+        if operation == b"a":
+            lines[start:start] = new_lines
+        else:
+            lines[start - 1 : end] = new_lines
+
+
+def _apply_pdiffs(package_index_file, pdiff_paths, expected_digests):
+    """
+    Apply the gzip compressed pdiffs in pdiff_paths to an uncompressed package index in order.
+
+    Returns an unsaved Artifact for the patched package index, which has been validated against the
+    expected_digests.
+    """
+    with package_index_file.open("rb") as f_in:
+        lines = f_in.readlines()
+    for pdiff_path in pdiff_paths:
+        with gzip.open(pdiff_path) as pdiff:
+            _apply_ed_script(lines, pdiff)
+    chunks = (b"".join(lines[i : i + 10000]) for i in range(0, len(lines), 10000))
+    return _write_artifact(chunks, expected_digests)
+
+
+class DebDropFailedArtifacts(Stage):
+    """
+    This stage removes failed failsafe artifacts.
+
+    In case we tried to fetch something, but the artifact 404ed, we simply drop it.
     """
 
     async def run(self):
@@ -533,7 +1533,9 @@ class DebFirstStage(Stage):
     The first stage of a pulp_deb sync pipeline.
     """
 
-    def __init__(self, remote, optimize, mirror, previous_repo_version, *args, **kwargs):
+    def __init__(
+        self, remote, optimize, mirror, previous_repo_version, *args, distributions=None, **kwargs
+    ):
         """
         The first stage of a pulp_deb sync pipeline.
 
@@ -541,9 +1543,11 @@ class DebFirstStage(Stage):
             remote (AptRemote): The remote data to be used when syncing
             optimize (Boolean): If optimize mode is enabled or not
             previous_repo_version repository (RepositoryVersion): The previous RepositoryVersion.
+            distributions (list): The distributions of the remote to sync, defaults to all of them.
         """
         super().__init__(*args, **kwargs)
         self.remote = remote
+        self.distributions = distributions or remote.distributions.split()
         self.optimize = optimize
         self.previous_repo_version = previous_repo_version
         self.previous_sync_info = defaultdict(dict, previous_repo_version.info)
@@ -553,12 +1557,58 @@ class DebFirstStage(Stage):
             "optimize": optimize,
             "mirror": mirror,
         }
+        # HTTP validators of the release files per distribution, for conditional requests:
+        self.sync_info["release_file_validators"] = {}
         self.parsed_url = urlparse(remote.url)
         self.sync_options_unchanged = (
             self.previous_sync_info["remote_options"] == self.sync_info["remote_options"]
             and self.previous_sync_info["sync_options"]["mirror"]
             == self.sync_info["sync_options"]["mirror"]
         )
+        self.parse_executor = None
+        self.parse_semaphore = None
+        self.distribution_semaphore = None
+        self.package_index_semaphore = None
+        # Primary keys of content to associate in bulk (see DebContentAssociation)
+        self.bulk_content_pks = set()
+        # Distributions with a Release file announcing "Acquire-By-Hash: yes"
+        self.by_hash_distributions = set()
+        # Checkpoints of parsed package indices not saved yet, see _add_sync_checkpoint():
+        self.pending_checkpoints = []
+        self.checkpoints_saved_at = time.monotonic()
+        self.package_filters = _get_package_filters(remote)
+        # The metadata units of the previous version, loaded in bulk by run():
+        self.previous_metadata = None
+        # The progress reports of skipped units by code, see _report_skipped():
+        self.skip_reports = {}
+        self.skip_reports_stack = None
+        self.metrics = SyncMetrics() if settings.SYNC_METRICS else None
+        self.mirror_urls = []
+        self.mirrors = None
+        self.mirror_remotes = None
+        # The base urls serving the same Release file as the remote url, per distribution:
+        self.distribution_mirror_urls = {}
+        # Pool files of local mirrors are hardlinked rather than copied
+        if self.parsed_url.scheme == "file":
+            self.pool_artifact_class = DeclarativeLinkedArtifact
+        else:
+            self.pool_artifact_class = DeclarativeArtifact
+            self.mirror_urls = [
+                url
+                for url in dict.fromkeys((remote.mirror_urls or "").split())
+                if url != remote.url
+            ]
+            if self.mirror_urls:
+                self.mirrors = UpstreamMirrors([remote.url] + self.mirror_urls)
+                # Mirrors on other hosts are downloaded from without the credentials of the remote:
+                third_party_remote = _get_third_party_remote(remote)
+                remote_host = urlparse(remote.url).hostname
+                self.mirror_remotes = {
+                    base_url: (
+                        remote if urlparse(base_url).hostname == remote_host else third_party_remote
+                    )
+                    for base_url in [remote.url] + self.mirror_urls
+                }
 
     async def run(self):
         """
@@ -567,27 +1617,163 @@ class DebFirstStage(Stage):
         if "md5" not in settings.ALLOWED_CONTENT_CHECKSUMS and settings.FORBIDDEN_CHECKSUM_WARNINGS:
             log.warning(_(NO_MD5_WARNING_MESSAGE))
 
-        await asyncio.gather(
-            *[self._handle_distribution(dist) for dist in self.remote.distributions.split()]
-        )
+        if settings.PACKAGE_INDEX_PARSE_PROCESSES > 0:
+            self.parse_executor = ProcessPoolExecutor(
+                max_workers=settings.PACKAGE_INDEX_PARSE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+            # Bound the number of chunks waiting for (or holding) a worker process:
+            self.parse_semaphore = asyncio.Semaphore(2 * settings.PACKAGE_INDEX_PARSE_PROCESSES)
+        # Bound the number of distributions and package indices that are handled concurrently:
+        self.distribution_semaphore = _get_semaphore(settings.SYNC_MAX_CONCURRENT_DISTRIBUTIONS)
+        self.package_index_semaphore = _get_semaphore(settings.SYNC_MAX_CONCURRENT_PACKAGE_INDICES)
+        self.previous_metadata = await _get_previous_metadata(self.previous_repo_version)
+
+        self.skip_reports_stack = AsyncExitStack()
+        try:
+            async with self.skip_reports_stack:
+                await asyncio.gather(
+                    *[
+                        _run_bounded(self.distribution_semaphore, self._handle_distribution, dist)
+                        for dist in self.distributions
+                    ]
+                )
+        finally:
+            if self.parse_executor:
+                self.parse_executor.shutdown()
 
         self.new_version.info = self.sync_info
 
+    async def _report_skipped(self, code, message):
+        """
+        Count a skipped unit in the progress report of its code, which is created on the first skip.
+        """
+        progress_report = self.skip_reports.get(code)
+        if progress_report is None:
+            progress_report = ProgressReport(message=message, code=code)
+            self.skip_reports[code] = progress_report
+            await self.skip_reports_stack.enter_async_context(progress_report)
+        await progress_report.aincrement()
+
     async def _create_unit(self, d_content):
         await self.put(d_content)
         return await d_content.resolution()
 
-    def _to_d_artifact(self, relative_path, data=None):
+    async def _add_sync_checkpoint(self, package_index, content_pks, architectures):
+        """
+        Record that the parsed package index has been completely handled, along with its content.
+
+        The checkpoints are saved in bulk every SYNC_CHECKPOINT_INTERVAL seconds, so syncs finishing
+        sooner never write any.
+        """
+        self.pending_checkpoints.append(
+            AptSyncCheckpoint(
+                repository_id=self.previous_repo_version.repository_id,
+                remote=self.remote,
+                remote_options=self.sync_info["remote_options"],
+                relative_path=package_index.relative_path,
+                artifact_set_sha256=package_index.artifact_set_sha256,
+                content_pks=[str(pk) for pk in content_pks],
+                architectures=sorted(architectures),
+            )
+        )
+        if time.monotonic() - self.checkpoints_saved_at >= settings.SYNC_CHECKPOINT_INTERVAL:
+            checkpoints, self.pending_checkpoints = self.pending_checkpoints, []
+            self.checkpoints_saved_at = time.monotonic()
+            await sync_to_async(_save_sync_checkpoints)(checkpoints)
+
+    def _get_previous_unit(self, model, key):
+        """
+        Get the unit of the model with the given key from the previous version, or None.
+        """
+        units = self.previous_metadata[model].get(key, [])
+        if len(units) > 1:
+            message = "Previous {} count: {}. There should only be one."
+            raise Exception(message.format(model.__name__, len(units)))
+        return units[0] if units else None
+
+    def _to_url(self, relative_path, base_url=None):
+        parsed_url = urlparse(base_url) if base_url else self.parsed_url
+        url_path = quote(os.path.join(parsed_url.path, relative_path), safe=":/")
+        return urlunparse(parsed_url._replace(path=url_path))
+
+    def _to_d_artifact(self, relative_path, data=None, by_hash=False):
         artifact = Artifact(**_get_checksums(data or {}))
-        url_path = quote(os.path.join(self.parsed_url.path, relative_path), safe=":/")
+        by_hash_url = None
+        if by_hash and artifact.sha256:
+            by_hash_path = os.path.join(
+                os.path.dirname(relative_path), "by-hash", "SHA256", artifact.sha256
+            )
+            by_hash_url = self._to_url(by_hash_path)
         return DeclarativeFailsafeArtifact(
             artifact=artifact,
-            url=urlunparse(self.parsed_url._replace(path=url_path)),
+            url=self._to_url(relative_path),
             relative_path=relative_path,
             remote=self.remote,
             deferred_download=False,
+            by_hash_url=by_hash_url,
+        )
+
+    def _to_pool_d_artifact(self, relative_path, artifact, distribution, deferred_download):
+        base_urls = self.distribution_mirror_urls.get(distribution)
+        if base_urls and not deferred_download:
+            return DeclarativeMirroredArtifact(
+                artifact=artifact,
+                urls=[self._to_url(relative_path, base_url) for base_url in base_urls],
+                relative_path=relative_path,
+                remote=self.remote,
+                mirrors=self.mirrors,
+                base_urls=base_urls,
+                mirror_remotes=self.mirror_remotes,
+            )
+        return self.pool_artifact_class(
+            artifact=artifact,
+            url=self._to_url(relative_path),
+            relative_path=relative_path,
+            remote=self.remote,
+            deferred_download=deferred_download,
         )
 
+    async def _verify_mirrors(self, distribution, release_file_dc):
+        """
+        Determine the mirrors serving the same Release file as the remote url for the distribution.
+        """
+        release_d_artifacts = {
+            os.path.basename(d_artifact.relative_path): d_artifact
+            for d_artifact in release_file_dc.d_artifacts
+            if d_artifact.artifact is not None
+        }
+        d_artifact = release_d_artifacts.get("Release") or release_d_artifacts.get("InRelease")
+        if d_artifact is None:
+            return
+
+        async def matches(base_url):
+            downloader = self.mirror_remotes[base_url].get_downloader(
+                url=self._to_url(d_artifact.relative_path, base_url),
+                expected_digests={"sha256": d_artifact.artifact.sha256},
+                expected_size=d_artifact.artifact.size,
+            )
+            try:
+                download_result = await downloader.run()
+            except (
+                aiohttp.ClientError,
+                asyncio.TimeoutError,
+                DigestValidationError,
+                SizeValidationError,
+                OSError,
+            ) as e:
+                message = "Not using mirror '{}' for distribution '{}': {}"
+                log.warning(_(message).format(base_url, distribution, str(e) or type(e).__name__))
+                return False
+            os.remove(download_result.path)
+            return True
+
+        matching = await asyncio.gather(*[matches(base_url) for base_url in self.mirror_urls])
+        self.distribution_mirror_urls[distribution] = [self.remote.url] + [
+            base_url for base_url, match in zip(self.mirror_urls, matching) if match
+        ]
+
     def _gen_remote_options(self):
         return {
             "distributions": self.remote.distributions,
@@ -599,6 +1785,8 @@ class DebFirstStage(Stage):
             "sync_installer": self.remote.sync_installer,
             "gpgkey": self.remote.gpgkey,
             "ignore_missing_package_indices": self.remote.ignore_missing_package_indices,
+            "metadata_policy": self.remote.metadata_policy,
+            **{name: getattr(self.remote, name) for name in PACKAGE_FILTER_FIELDS},
         }
 
     async def _handle_distribution(self, distribution):
@@ -608,33 +1796,68 @@ class DebFirstStage(Stage):
             release_file_dir = distribution.strip("/")
         else:
             release_file_dir = os.path.join("dists", distribution)
+        if self.optimize and self.sync_options_unchanged:
+            previous_validators = self.previous_sync_info["release_file_validators"].get(
+                distribution
+            )
+            release_file_urls = {
+                self._to_url(os.path.join(release_file_dir, filename))
+                for filename in ReleaseFile.SUPPORTED_ARTIFACTS
+            }
+            # The validators are only meaningful if the remote URL has not changed since:
+            if (
+                previous_validators
+                and release_file_urls.issuperset(previous_validators)
+                and await self._release_files_not_modified(previous_validators)
+            ):
+                previous_release_file = self._get_previous_unit(ReleaseFile, distribution)
+                if previous_release_file is not None:
+                    self.sync_info["release_file_validators"][distribution] = previous_validators
+                    self.bulk_content_pks.add(previous_release_file.pk)
+                    message = 'ReleaseFile not modified upstream for distribution="{}". Skipping.'
+                    log.info(_(message).format(distribution))
+                    await self._skip_distribution(previous_release_file)
+                    return
+        d_artifacts = [
+            self._to_d_artifact(os.path.join(release_file_dir, filename))
+            for filename in ReleaseFile.SUPPORTED_ARTIFACTS
+        ]
+        if self.remote.metadata_policy == AptRemote.MINIMAL:
+            # Prefer the InRelease file, and only fall back to Release and Release.gpg without it:
+            in_release_d_artifact = next(
+                da for da in d_artifacts if os.path.basename(da.relative_path) == "InRelease"
+            )
+            await in_release_d_artifact.download()
+            if in_release_d_artifact.artifact is not None:
+                d_artifacts = [in_release_d_artifact]
+            else:
+                d_artifacts.remove(in_release_d_artifact)
         release_file_dc = DeclarativeContent(
             content=ReleaseFile(distribution=distribution, relative_path=release_file_dir),
-            d_artifacts=[
-                self._to_d_artifact(os.path.join(release_file_dir, filename))
-                for filename in ReleaseFile.SUPPORTED_ARTIFACTS
-            ],
+            d_artifacts=d_artifacts,
         )
         release_file = await self._create_unit(release_file_dc)
         if release_file is None:
             return
+        validators = {
+            d_artifact.url: d_artifact.validators for d_artifact in release_file_dc.d_artifacts
+        }
+        if all(validators.values()):
+            self.sync_info["release_file_validators"][distribution] = validators
         if self.optimize and self.sync_options_unchanged:
-            previous_release_file = await _get_previous_release_file(
-                self.previous_repo_version, distribution
-            )
-            if previous_release_file.artifact_set_sha256 == release_file.artifact_set_sha256:
-                await _readd_previous_package_indices(
-                    self.previous_repo_version, self.new_version, distribution
-                )
+            previous_release_file = self._get_previous_unit(ReleaseFile, distribution)
+            if (
+                previous_release_file is not None
+                and previous_release_file.artifact_set_sha256 == release_file.artifact_set_sha256
+            ):
                 message = 'ReleaseFile has not changed for distribution="{}". Skipping.'
                 log.info(_(message).format(distribution))
-                async with ProgressReport(
-                    message="Skipping ReleaseFile sync (no change from previous sync)",
-                    code="sync.release_file.was_skipped",
-                ) as pb:
-                    await pb.aincrement()
+                await self._skip_distribution(release_file)
                 return
 
+        if self.mirrors is not None:
+            await self._verify_mirrors(distribution, release_file_dc)
+
         # Parse release file
         log.info(_('Parsing Release file at distribution="{}"').format(distribution))
         release_artifact = await _get_main_artifact_blocking(release_file)
@@ -690,6 +1913,9 @@ class DebFirstStage(Stage):
                 release_file.relative_path, no_support_for_arch_all
             )
 
+        if release_file_dict.get("Acquire-By-Hash", "").strip().lower() == "yes":
+            self.by_hash_distributions.add(distribution)
+
         # collect file references in new dict
         file_references = defaultdict(deb822.Deb822Dict)
         for digest_name in ["SHA512", "SHA256", "SHA1", "MD5sum"]:
@@ -717,6 +1943,53 @@ class DebFirstStage(Stage):
             ]
         await asyncio.gather(*sub_tasks)
 
+    async def _skip_distribution(self, release_file):
+        """
+        Carry over the content of an unchanged distribution from the previous version.
+        """
+        self.bulk_content_pks.update(
+            await _get_previous_distribution_content(
+                self.previous_repo_version, release_file, self.previous_metadata
+            )
+        )
+        await self._report_skipped(
+            "sync.release_file.was_skipped",
+            "Skipping ReleaseFile sync (no change from previous sync)",
+        )
+
+    async def _release_files_not_modified(self, validators):
+        """
+        Check whether the release files of a distribution are unchanged upstream.
+
+        This sends conditional requests using the HTTP validators (by URL) stored by the previous
+        sync, and only returns True if the upstream repo answers all of them with "304 Not
+        Modified".
+        """
+
+        async def _not_modified(url, file_validators):
+            downloader = self.remote.get_downloader(url=url)
+            if not isinstance(downloader, HttpDownloader):
+                return False
+            headers = {}
+            if "etag" in file_validators:
+                headers["If-None-Match"] = file_validators["etag"]
+            if "last_modified" in file_validators:
+                headers["If-Modified-Since"] = file_validators["last_modified"]
+            try:
+                async with downloader.session.get(
+                    downloader.url,
+                    headers=headers,
+                    proxy=downloader.proxy,
+                    proxy_auth=downloader.proxy_auth,
+                    auth=downloader.auth,
+                ) as response:
+                    return response.status == 304
+            except aiohttp.ClientError:
+                return False
+
+        results = await asyncio.gather(*[_not_modified(url, validators[url]) for url in validators])
+        return all(results)
+
     async def _handle_component(
         self,
         component,
@@ -834,7 +2107,10 @@ class DebFirstStage(Stage):
         # Await all tasks
         await asyncio.gather(*pending_tasks)
 
-    async def _handle_package_index(
+    async def _handle_package_index(self, *args, **kwargs):
+        await _run_bounded(self.package_index_semaphore, self._sync_package_index, *args, **kwargs)
+
+    async def _sync_package_index(
         self,
         release_file,
         release_component,
@@ -859,7 +2135,13 @@ class DebFirstStage(Stage):
             path = os.path.join(release_file_package_index_dir, filename)
             if path in file_references:
                 relative_path = os.path.join(release_base_path, path)
-                d_artifacts.append(self._to_d_artifact(relative_path, file_references[path]))
+                d_artifacts.append(
+                    self._to_d_artifact(
+                        relative_path,
+                        file_references[path],
+                        by_hash=release_file.distribution in self.by_hash_distributions,
+                    )
+                )
         if not d_artifacts:
             # This case will happen if it is not the case that 'path in file_references' for any of
             # PackageIndex.SUPPORTED_ARTIFACTS. The only case where this is known to occur is when
@@ -878,6 +2160,56 @@ class DebFirstStage(Stage):
                 log.info(_(message))
             return
         relative_path = os.path.join(package_index_dir, "Packages")
+        if d_artifacts[0].relative_path == relative_path:
+            artifact = None
+            if settings.SYNC_PDIFFS:
+                artifact = await self._fetch_package_index_by_pdiffs(
+                    release_file, release_file_package_index_dir, file_references, d_artifacts[0]
+                )
+            if artifact:
+                # The compressed variants are still referenced, but need not be downloaded:
+                for d_artifact in d_artifacts[1:]:
+                    d_artifact.deferred_download = True
+                d_artifacts[0] = DeclarativeArtifact(
+                    artifact=artifact,
+                    url=d_artifacts[0].url,
+                    relative_path=relative_path,
+                    remote=self.remote,
+                )
+            elif self.remote.metadata_policy == AptRemote.MINIMAL:
+                # Leave out the Release file of the package index, and only download its smallest
+                # compressed variant. The uncompressed package index is derived from it, while the
+                # other variants are still referenced, but fetched on demand:
+                d_artifacts = [
+                    d_artifact
+                    for d_artifact in d_artifacts
+                    if os.path.basename(d_artifact.relative_path) != "Release"
+                ]
+                compressed_d_artifacts = [
+                    d_artifact
+                    for d_artifact in d_artifacts
+                    if os.path.splitext(d_artifact.relative_path)[1] in PACKAGE_INDEX_DECOMPRESSORS
+                ]
+                if compressed_d_artifacts:
+
+                    def variant_order(d_artifact):
+                        path = os.path.join(
+                            release_file_package_index_dir,
+                            os.path.basename(d_artifact.relative_path),
+                        )
+                        return (
+                            d_artifact not in compressed_d_artifacts,
+                            int(file_references[path].get("Size", 0)),
+                        )
+
+                    # Should the smallest variant fail, the next larger ones and the uncompressed
+                    # package index are downloaded instead:
+                    smallest_d_artifact, *fallback_d_artifacts = sorted(
+                        d_artifacts, key=variant_order
+                    )
+                    for d_artifact in fallback_d_artifacts:
+                        d_artifact.deferred_download = True
+                    smallest_d_artifact.fallback_d_artifacts = fallback_d_artifacts
         log.info(_('Creating PackageIndex unit with relative_path="{}".').format(relative_path))
         content_unit = PackageIndex(
             component=release_component.component,
@@ -899,117 +2231,154 @@ class DebFirstStage(Stage):
             else:
                 raise NoPackageIndexFile(relative_dir=package_index_dir)
 
-        if self.optimize and self.sync_options_unchanged:
-            previous_package_index = await _get_previous_package_index(
-                self.previous_repo_version, relative_path
-            )
-            if previous_package_index.artifact_set_sha256 == package_index.artifact_set_sha256:
-                message = 'PackageIndex has not changed for relative_path="{}". Skipped.'
-                log.info(_(message).format(relative_path))
-                async with ProgressReport(
-                    message="Skipping PackageIndex processing (no change from previous sync)",
-                    code="sync.package_index.was_skipped",
-                ) as pb:
-                    await pb.aincrement()
-                return
-
-        # Interpret policy to download Artifacts or not
-        deferred_download = self.remote.policy != Remote.IMMEDIATE
-        # parse package_index
-        package_futures = []
+        parse_options = {
+            "architecture": architecture,
+            "distribution": release_file.distribution,
+            "release_architectures": release_file.architectures.split(),
+            "remote_architectures": (self.remote.architectures or "").split(),
+            "hybrid_format": hybrid_format,
+            "package_index_dir": package_index_dir,
+            "package_filters": self.package_filters,
+        }
         package_index_artifact = await _get_main_artifact_blocking(package_index)
-        for package_paragraph in deb822.Packages.iter_paragraphs(package_index_artifact.file):
-            # Sanity check the architecture from the package paragraph:
-            package_paragraph_architecture = package_paragraph["Architecture"]
-            if release_file.distribution[-1] == "/":
-                if (
-                    self.remote.architectures
-                    and package_paragraph_architecture != "all"
-                    and package_paragraph_architecture not in self.remote.architectures.split()
-                ):
-                    message = (
-                        "Omitting package '{}' with architecture '{}' from flat repo distribution "
-                        "'{}', since we are filtering for architectures '{}'!"
-                    )
-                    log.debug(
-                        _(message).format(
-                            package_paragraph["Filename"],
-                            package_paragraph_architecture,
-                            release_file.distribution,
-                            self.remote.architectures,
-                        )
+        chunks = _scan_package_index_chunks(
+            _iter_package_index_chunks(
+                package_index_artifact.file, settings.PACKAGE_INDEX_PARSE_CHUNK_SIZE
+            )
+        )
+        if self.package_filters:
+            # Filtered out packages are dropped before anything else looks at them:
+            chunks = _filter_package_paragraphs(chunks, self.package_filters)
+        unchanged_packages = []
+        # Packages and other content of this package index, and the architectures of its packages
+        # for flat repos:
+        package_pks = set()
+        content_pks = set()
+        package_architectures = set()
+        package_index_skipped = False
+        checkpoint = await sync_to_async(_get_sync_checkpoint)(
+            self.remote,
+            self.previous_repo_version.repository_id,
+            self.sync_info["remote_options"],
+            package_index,
+        )
+        if checkpoint is not None:
+            message = "Resuming package index '{}' from the checkpoint of an interrupted sync."
+            log.info(_(message).format(relative_path))
+            content_pks.update(checkpoint.content_pks)
+            package_architectures.update(checkpoint.architectures)
+            chunks = []
+            package_index_skipped = True
+        elif self.optimize and self.sync_options_unchanged:
+            previous_package_index = self._get_previous_unit(PackageIndex, relative_path)
+            if previous_package_index is not None:
+                previous_packages = await sync_to_async(_get_previous_packages)(
+                    self.previous_repo_version, release_component, package_index_dir
+                )
+                if previous_package_index.artifact_set_sha256 == package_index.artifact_set_sha256:
+                    message = 'PackageIndex has not changed for relative_path="{}". Skipped.'
+                    log.info(_(message).format(relative_path))
+                    await self._report_skipped(
+                        "sync.package_index.was_skipped",
+                        "Skipping PackageIndex processing (no change from previous sync)",
                     )
-                    continue
-            # We drop packages if the package_paragraph_architecture != architecture unless that
-            # architecture is "all" in a "mixed" (containing all as well as architecture specific
-            # packages) package index:
-            elif (
-                package_paragraph_architecture != "all"
-                or "all" in release_file.architectures.split()
-            ) and package_paragraph_architecture != architecture:
-                if not hybrid_format:
-                    message = (
-                        "The upstream package index in '{}' contains package '{}' with wrong "
-                        "architecture '{}'. Skipping!"
+                    unchanged_packages = await _get_unchanged_packages(
+                        package_index_artifact, previous_packages, parse_options
                     )
-                    log.warning(
-                        _(message).format(
-                            package_index_dir,
-                            package_paragraph["Filename"],
-                            package_paragraph_architecture,
-                        )
+                    chunks = []
+                    package_index_skipped = True
+                else:
+                    # The package index has changed, but usually only a few of its packages have.
+                    chunks = _skip_unchanged_package_paragraphs(
+                        chunks, previous_packages, parse_options, unchanged_packages
                     )
-                continue
 
-            try:
-                package_relpath = os.path.normpath(package_paragraph["Filename"])
-                package_sha256 = package_paragraph["sha256"]
-                if package_relpath.endswith(".deb"):
-                    package_class = Package
-                    serializer_class = Package822Serializer
-                elif package_relpath.endswith(".udeb"):
-                    package_class = InstallerPackage
-                    serializer_class = InstallerPackage822Serializer
-                log.debug(_("Downloading package {}").format(package_paragraph["Package"]))
-                serializer = serializer_class.from822(data=package_paragraph)
-                serializer.is_valid(raise_exception=True)
-                package_content_unit = package_class(
-                    relative_path=package_relpath,
-                    sha256=package_sha256,
-                    **serializer.validated_data,
-                )
-                package_path = quote(os.path.join(self.parsed_url.path, package_relpath), safe=":/")
-                package_da = DeclarativeArtifact(
-                    artifact=Artifact(
-                        size=int(package_paragraph["Size"]), **_get_checksums(package_paragraph)
-                    ),
-                    url=urlunparse(self.parsed_url._replace(path=package_path)),
-                    relative_path=package_relpath,
-                    remote=self.remote,
-                    deferred_download=deferred_download,
-                )
-                package_dc = DeclarativeContent(
-                    content=package_content_unit, d_artifacts=[package_da]
+        # Another sync of the same upstream repo may already have parsed this package index with
+        # the same options:
+        cached_packages = None
+        cache_key = _get_package_index_cache_key(
+            package_index_artifact.sha256, parse_options, self.remote.url
+        )
+        if self.optimize and not package_index_skipped and settings.PACKAGE_INDEX_CACHE_SIZE > 0:
+            cached_packages = await sync_to_async(_get_cached_packages)(
+                cache_key, self.remote, self._to_url
+            )
+        if cached_packages is not None:
+            message = "Using the cached packages of package index '{}'."
+            log.info(_(message).format(relative_path))
+            packages, installer_package_pks = cached_packages
+            package_pks.update(package_pk for package_pk, package_architecture in packages)
+            package_pks.update(installer_package_pks)
+            for i in range(0, len(packages), PACKAGE_RELEASE_COMPONENT_BATCH_SIZE):
+                batch = [
+                    package_pk
+                    for package_pk, package_architecture in packages[
+                        i : i + PACKAGE_RELEASE_COMPONENT_BATCH_SIZE
+                    ]
+                ]
+                content_pks.update(
+                    await _get_or_create_package_release_components(batch, release_component)
                 )
-                package_futures.append(package_dc)
-                await self.put(package_dc)
-            except KeyError:
-                log.warning(_("Ignoring invalid package paragraph. {}").format(package_paragraph))
-        # Assign packages to this release_component
-        package_architectures = set([])
-        for package_future in package_futures:
-            package = await package_future.resolution()
-            if not isinstance(package, Package):
-                # TODO repeat this for installer packages
-                continue
-            package_release_component_dc = DeclarativeContent(
-                content=PackageReleaseComponent(
-                    package=package, release_component=release_component
+            if release_file.distribution[-1] == "/":
+                package_architectures.update(
+                    package_architecture for package_pk, package_architecture in packages
                 )
+            chunks = []
+
+        # Interpret policy to download Artifacts or not
+        deferred_download = self.remote.policy != Remote.IMMEDIATE
+        # Packages are assigned to this release_component as they are saved:
+        pending_packages = {}
+        saved_packages = asyncio.Queue()
+
+        def on_package_resolved(package_dc):
+            del pending_packages[id(package_dc)]
+            saved_packages.put_nowait(package_dc.content)
+
+        association = asyncio.ensure_future(
+            self._associate_packages(
+                saved_packages,
+                release_file,
+                release_component,
+                package_pks,
+                content_pks,
+                package_architectures,
+            )
+        )
+        try:
+            await self._put_packages(
+                chunks, parse_options, deferred_download, pending_packages, on_package_resolved
             )
-            await self.put(package_release_component_dc)
+            # Wait for the remaining packages to be saved:
+            while pending_packages:
+                await next(iter(pending_packages.values())).resolution()
+            saved_packages.put_nowait(None)
+            await association
+        finally:
+            association.cancel()
+
+        # Packages (and their PackageReleaseComponents) that have not changed since the previous
+        # sync were never parsed, they are carried over from the previous version in bulk:
+        if unchanged_packages:
+            message = "Carrying over {} unchanged packages for package index '{}'."
+            log.info(_(message).format(len(unchanged_packages), relative_path))
+            for package_pk, prc_pk, package_architecture in unchanged_packages:
+                package_pks.add(package_pk)
+                if prc_pk is not None:
+                    content_pks.add(prc_pk)
             if release_file.distribution[-1] == "/":
-                package_architectures.add(package.architecture)
+                package_architectures.update(
+                    package_architecture
+                    for package_pk, prc_pk, package_architecture in unchanged_packages
+                    if prc_pk is not None
+                )
+        if checkpoint is None and cached_packages is None and settings.PACKAGE_INDEX_CACHE_SIZE > 0:
+            await sync_to_async(_cache_packages)(cache_key, package_pks)
+        content_pks.update(package_pks)
+        self.bulk_content_pks.update(content_pks)
+        # Unchanged and cached package indices are cheap to handle again, unlike parsed ones:
+        if not package_index_skipped and cached_packages is None:
+            await self._add_sync_checkpoint(package_index, content_pks, package_architectures)
 
         # For flat repos we may still need to create ReleaseArchitecture content:
         if release_file.distribution[-1] == "/":
@@ -1054,6 +2423,226 @@ class DebFirstStage(Stage):
                     )
                     await self.put(release_architecture_dc)
 
+    async def _put_packages(
+        self, chunks, options, deferred_download, pending_packages, on_resolved
+    ):
+        """
+        Send the packages of the scanned package index chunks down the pipeline.
+
+        The packages are added to pending_packages until on_resolved is called for them.
+        """
+        if self.metrics is not None:
+            chunks = self.metrics.count_paragraphs(options["package_index_dir"], chunks)
+        package_records = self._parse_package_index(chunks, options)
+        if self.metrics is not None:
+            package_records = self.metrics.time_parsing(
+                options["package_index_dir"], package_records
+            )
+        async for package_record in package_records:
+            package_relpath = package_record["relative_path"]
+            if "content" in package_record:
+                # The package is already known, so it was not parsed:
+                package_content_unit = package_record["content"]
+            else:
+                if package_record["suffix"] == Package.SUFFIX:
+                    package_class = Package
+                else:
+                    package_class = InstallerPackage
+                package_content_unit = package_class(
+                    relative_path=package_relpath,
+                    sha256=package_record["sha256"],
+                    **package_record["fields"],
+                )
+            package_da = self._to_pool_d_artifact(
+                package_relpath,
+                Artifact(size=package_record["size"], **package_record["checksums"]),
+                options["distribution"],
+                deferred_download,
+            )
+            package_dc = DeclarativeNotifyingContent(
+                content=package_content_unit,
+                d_artifacts=[package_da],
+                on_resolved=on_resolved,
+            )
+            # Bound the number of packages of this package index held in the pipeline at a time,
+            # making the pipeline flush its batches if need be:
+            if 0 < settings.SYNC_MAX_PENDING_PACKAGES <= len(pending_packages):
+                await next(iter(pending_packages.values())).resolution()
+            pending_packages[id(package_dc)] = package_dc
+            await self.put(package_dc)
+
+    async def _associate_packages(
+        self,
+        saved_packages,
+        release_file,
+        release_component,
+        package_pks,
+        content_pks,
+        package_architectures,
+    ):
+        """
+        Assign the packages from the saved_packages queue to the release_component until None.
+
+        The PackageReleaseComponents are created in batches, while further packages are saved. The
+        packages are added to package_pks, their PackageReleaseComponents to content_pks, and the
+        architectures of the packages of flat repos are added to package_architectures.
+        """
+        batch = []
+        package = await saved_packages.get()
+        while package is not None:
+            package_pks.add(package.pk)
+            if isinstance(package, Package):
+                # TODO repeat this for installer packages
+                batch.append(package.pk)
+                if release_file.distribution[-1] == "/":
+                    package_architectures.add(package.architecture)
+            package = await saved_packages.get()
+            # The PackageReleaseComponents have no artifacts, so they are created in bulk rather
+            # than being sent down the pipeline one by one:
+            if batch and (package is None or len(batch) >= PACKAGE_RELEASE_COMPONENT_BATCH_SIZE):
+                content_pks.update(
+                    await _get_or_create_package_release_components(batch, release_component)
+                )
+                batch = []
+
+    async def _fetch_package_index_by_pdiffs(
+        self, release_file, release_file_package_index_dir, file_references, packages_d_artifact
+    ):
+        """
+        Try to build the uncompressed package index from the previous one using upstream pdiffs.
+
+        Returns an unsaved Artifact that has been verified against the Release file checksum, or
+        None if there is nothing to patch, no usable patch chain, or anything goes wrong on the way.
+        """
+        diff_index_path = os.path.join(release_file_package_index_dir, "Packages.diff", "Index")
+        if diff_index_path not in file_references:
+            return None
+        previous_package_index = self._get_previous_unit(
+            PackageIndex, packages_d_artifact.relative_path
+        )
+        target_sha256 = packages_d_artifact.artifact.sha256
+        if previous_package_index is None or previous_package_index.sha256 == target_sha256:
+            return None
+
+        release_base_path = os.path.dirname(release_file.relative_path)
+        pdiff_dir = os.path.join(release_base_path, os.path.dirname(diff_index_path))
+        # The downloaded diff index and pdiffs, which are no longer needed once applied:
+        download_paths = []
+        try:
+            diff_index_download = await self._download_pdiff_file(
+                os.path.join(release_base_path, diff_index_path),
+                file_references[diff_index_path]["SHA256"],
+                int(file_references[diff_index_path]["size"]),
+            )
+            download_paths.append(diff_index_download.path)
+            with open(diff_index_download.path, "rb") as diff_index_file:
+                diff_index = deb822.Deb822(diff_index_file)
+            pdiffs = _select_pdiffs(diff_index, previous_package_index.sha256, target_sha256)
+            if not pdiffs:
+                message = "No pdiff chain leads to the package index in '{}'."
+                log.info(_(message).format(pdiff_dir))
+                return None
+            pdiff_downloads = await asyncio.gather(
+                *[
+                    self._download_pdiff_file(os.path.join(pdiff_dir, filename), sha256, size)
+                    for filename, sha256, size in pdiffs
+                ],
+                return_exceptions=True,
+            )
+            download_paths.extend(
+                download.path
+                for download in pdiff_downloads
+                if isinstance(download, DownloadResult)
+            )
+            for download in pdiff_downloads:
+                if isinstance(download, BaseException):
+                    raise download
+            previous_artifact = await _get_main_artifact_blocking(previous_package_index)
+            artifact = await sync_to_async(_apply_pdiffs)(
+                previous_artifact.file,
+                [download.path for download in pdiff_downloads],
+                {"sha256": target_sha256},
+            )
+        except (
+            aiohttp.ClientError,
+            asyncio.TimeoutError,
+            DigestValidationError,
+            SizeValidationError,
+            EOFError,
+            KeyError,
+            OSError,
+            ValueError,
+        ) as e:
+            # OSError covers missing files on file:// remotes, as well as corrupt gzip files
+            message = "Applying pdiffs from '{}' failed, downloading the full package index: {}"
+            log.info(_(message).format(pdiff_dir, e))
+            return None
+        finally:
+            for path in download_paths:
+                if os.path.exists(path):
+                    os.unlink(path)
+        message = "Built the package index in '{}' from {} pdiff(s)."
+        log.info(_(message).format(pdiff_dir, len(pdiffs)))
+        return artifact
+
+    async def _download_pdiff_file(self, relative_path, sha256, size):
+        url_path = quote(os.path.join(self.parsed_url.path, relative_path), safe=":/")
+        downloader = self.remote.get_downloader(
+            url=urlunparse(self.parsed_url._replace(path=url_path)),
+            expected_digests={"sha256": sha256},
+            expected_size=size,
+        )
+        return await downloader.run()
+
+    async def _parse_package_index(self, chunks, options):
+        """
+        Parse and validate scanned package index chunks, yielding one record per package.
+
+        Packages that already exist are looked up in bulk, and yielded as records holding the
+        existing content unit without any parsing. Only the remaining package paragraphs are
+        parsed: If PACKAGE_INDEX_PARSE_PROCESSES is set, they are handed to the parse process pool,
+        otherwise they are parsed right here.
+        """
+        loop = asyncio.get_event_loop()
+        max_pending = 2 * settings.PACKAGE_INDEX_PARSE_PROCESSES
+        pending = deque()
+        for chunk in chunks:
+            known_packages = await _get_known_packages(chunk, options)
+            raw_paragraphs = []
+            for raw_paragraph, fields in chunk:
+                package = known_packages.get(_get_package_key(fields))
+                if package is None:
+                    raw_paragraphs.append(raw_paragraph)
+                    continue
+                yield {
+                    "content": package,
+                    "relative_path": package.relative_path,
+                    "size": int(fields["Size"]),
+                    "checksums": _get_checksums(fields),
+                }
+            if not raw_paragraphs:
+                continue
+
+            if not self.parse_executor:
+                for package_record in _parse_package_paragraphs(raw_paragraphs, options):
+                    yield package_record
+                # Give the rest of the pipeline a chance to run between chunks:
+                await asyncio.sleep(0)
+                continue
+
+            await self.parse_semaphore.acquire()
+            future = loop.run_in_executor(
+                self.parse_executor, _parse_package_paragraphs, raw_paragraphs, options
+            )
+            future.add_done_callback(lambda f: self.parse_semaphore.release())
+            pending.append(future)
+            while pending and (pending[0].done() or len(pending) >= max_pending):
+                for package_record in await pending.popleft():
+                    yield package_record
+        while pending:
+            for package_record in await pending.popleft():
+                yield package_record
+
     async def _handle_installer_file_index(
         self, release_file, release_component, architecture, file_references
     ):
@@ -1070,7 +2659,13 @@ class DebFirstStage(Stage):
             path = os.path.join(installer_file_index_dir, filename)
             if path in file_references:
                 relative_path = os.path.join(release_base_path, path)
-                d_artifacts.append(self._to_d_artifact(relative_path, file_references[path]))
+                d_artifacts.append(
+                    self._to_d_artifact(
+                        relative_path,
+                        file_references[path],
+                        by_hash=release_file.distribution in self.by_hash_distributions,
+                    )
+                )
         if not d_artifacts:
             return
         log.info(_("Downloading installer files from {}").format(installer_file_index_dir))
@@ -1101,14 +2696,9 @@ class DebFirstStage(Stage):
 
         for filename, digests in file_list.items():
             relpath = os.path.join(installer_file_index.relative_path, filename)
-            urlpath = quote(os.path.join(self.parsed_url.path, relpath), safe=":/")
             content_unit = GenericContent(sha256=digests["sha256"], relative_path=relpath)
-            d_artifact = DeclarativeArtifact(
-                artifact=Artifact(**digests),
-                url=urlunparse(self.parsed_url._replace(path=urlpath)),
-                relative_path=relpath,
-                remote=self.remote,
-                deferred_download=deferred_download,
+            d_artifact = self._to_pool_d_artifact(
+                relpath, Artifact(**digests), release_file.distribution, deferred_download
             )
             d_content = DeclarativeContent(content=content_unit, d_artifacts=[d_artifact])
             await self.put(d_content)
@@ -1119,7 +2709,11 @@ class DebFirstStage(Stage):
         translations = {}
         for path in paths:
             relative_path = os.path.join(os.path.dirname(release_file.relative_path), path)
-            d_artifact = self._to_d_artifact(relative_path, file_references[path])
+            d_artifact = self._to_d_artifact(
+                relative_path,
+                file_references[path],
+                by_hash=release_file.distribution in self.by_hash_distributions,
+            )
             key, ext = os.path.splitext(relative_path)
             if key not in translations:
                 translations[key] = {"sha256": None, "d_artifacts": []}
@@ -1134,45 +2728,693 @@ class DebFirstStage(Stage):
             )
 
 
+def _get_semaphore(limit):
+    """
+    Return a semaphore admitting up to limit holders at a time, where 0 means no limit.
+    """
+    return asyncio.Semaphore(limit if limit > 0 else sys.maxsize)
+
+
+async def _run_bounded(semaphore, coroutine_function, *args, **kwargs):
+    async with semaphore:
+        return await coroutine_function(*args, **kwargs)
+
+
+def _iter_package_index_chunks(package_index_file, chunk_size):
+    """
+    Split an uncompressed package index into chunks of at most chunk_size package paragraphs.
+
+    Each chunk is a list of raw paragraphs (bytes, one per package), so it can be parsed on its own.
+    """
+    chunk = []
+    paragraph = []
+    for line in package_index_file:
+        if line.strip():
+            paragraph.append(line)
+        elif paragraph:
+            chunk.append(b"".join(paragraph))
+            paragraph = []
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if paragraph:
+        chunk.append(b"".join(paragraph))
+    if chunk:
+        yield chunk
+
+
+# The fields _scan_package_paragraph() extracts, by their lower case names:
+SCANNED_PACKAGE_FIELDS = {
+    name.lower().encode(): name
+    for name in ["Package", "Source", "Section", "Priority", "Filename", "Architecture", "Size"]
+    + list(CHECKSUM_TYPE_MAP.values())
+}
+
+# The AptRemote fields that filter packages by their scanned fields:
+PACKAGE_FILTER_FIELDS = (
+    "include_packages",
+    "exclude_packages",
+    "sections",
+    "priorities",
+    "source_packages",
+)
+
+
+def _scan_package_paragraph(raw_paragraph):
+    """
+    Extract the fields needed to identify and filter a package from a raw package paragraph.
+
+    This is a lot cheaper than a full parse, but it does not validate anything.
+    """
+    fields = {}
+    for line in raw_paragraph.splitlines():
+        if line[:1] in (b" ", b"\t"):
+            continue
+        key, _sep, value = line.partition(b":")
+        name = SCANNED_PACKAGE_FIELDS.get(key.strip().lower())
+        if name:
+            fields[name] = value.strip().decode()
+    return fields
+
+
+def _scan_package_index_chunks(chunks):
+    """
+    Pair each raw paragraph of the package index chunks with its _scan_package_paragraph() fields.
+    """
+    for chunk in chunks:
+        yield [(raw_paragraph, _scan_package_paragraph(raw_paragraph)) for raw_paragraph in chunk]
+
+
+def _get_package_filters(remote):
+    """
+    Map each of the package filter fields set on the remote onto its list of values.
+    """
+    package_filters = {}
+    for name in PACKAGE_FILTER_FIELDS:
+        values = (getattr(remote, name) or "").split()
+        if values:
+            package_filters[name] = sorted(values)
+    return package_filters
+
+
+def _package_filters_match(fields, package_filters):
+    """
+    Check if a package with the scanned fields passes the package_filters of the remote.
+    """
+    name = fields.get("Package", "")
+    if "include_packages" in package_filters and not any(
+        fnmatchcase(name, pattern) for pattern in package_filters["include_packages"]
+    ):
+        return False
+    if any(fnmatchcase(name, pattern) for pattern in package_filters.get("exclude_packages", [])):
+        return False
+    if "sections" in package_filters:
+        section = fields.get("Section", "")
+        # Sections outside of main are prefixed with their area, like "contrib/utils":
+        if not {section, section.rpartition("/")[2]} & set(package_filters["sections"]):
+            return False
+    if "priorities" in package_filters:
+        if fields.get("Priority") not in package_filters["priorities"]:
+            return False
+    if "source_packages" in package_filters:
+        # The Source field is left out if it equals Package, and may include a "(version)":
+        source = (fields.get("Source") or name).partition(" ")[0]
+        if not any(fnmatchcase(source, pattern) for pattern in package_filters["source_packages"]):
+            return False
+    return True
+
+
+def _filter_package_paragraphs(chunks, package_filters):
+    """
+    Drop the package paragraphs of the scanned chunks that do not pass the package_filters.
+    """
+    for chunk in chunks:
+        chunk = [
+            (raw_paragraph, fields)
+            for raw_paragraph, fields in chunk
+            if _package_filters_match(fields, package_filters)
+        ]
+        if chunk:
+            yield chunk
+
+
+def _get_package_key(fields):
+    """
+    Get the (relative_path, sha256) natural key of a package from its scanned fields.
+    """
+    return os.path.normpath(fields.get("Filename", "")), fields.get("SHA256")
+
+
+def _skip_unchanged_package_paragraphs(chunks, previous_packages, options, unchanged_packages):
+    """
+    Drop the package paragraphs that are already part of the previous repository version.
+
+    A paragraph is unchanged if its (relative_path, sha256) pair is one of the previous_packages.
+    The previous_packages values of all dropped paragraphs are collected in unchanged_packages.
+    """
+    for chunk in chunks:
+        changed_chunk = []
+        for raw_paragraph, fields in chunk:
+            previous_package = previous_packages.get(_get_package_key(fields))
+            if previous_package and _package_architecture_wanted(
+                fields.get("Architecture"), options
+            ):
+                unchanged_packages.append(previous_package)
+            else:
+                changed_chunk.append((raw_paragraph, fields))
+        if changed_chunk:
+            yield changed_chunk
+
+
+@sync_to_async
+def _get_known_packages(chunk, options):
+    """
+    Look up the packages of a scanned package index chunk that already exist, in one query per
+    package type.
+
+    Returns the existing Package and InstallerPackage units by their (relative_path, sha256) keys.
+    Paragraphs that would not pass the architecture check or lack a valid Size are not looked up,
+    so that they are left to the parser.
+    """
+    keys_by_class = defaultdict(set)
+    for raw_paragraph, fields in chunk:
+        if not fields.get("Size", "").isdigit() or not _package_architecture_wanted(
+            fields.get("Architecture"), options
+        ):
+            continue
+        key = _get_package_key(fields)
+        if key[0].endswith(".deb"):
+            keys_by_class[Package].add(key)
+        elif key[0].endswith(".udeb"):
+            keys_by_class[InstallerPackage].add(key)
+    known_packages = {}
+    for package_class, keys in keys_by_class.items():
+        package_qs = package_class.objects.filter(
+            relative_path__in=[relative_path for relative_path, sha256 in keys]
+        )
+        # Like QueryExistingContents, protect the content found from orphan cleanup:
+        package_qs.touch()
+        for package in package_qs:
+            key = (package.relative_path, package.sha256)
+            if key in keys:
+                known_packages[key] = package
+    return known_packages
+
+
+def _package_architecture_wanted(package_architecture, options):
+    """
+    Check if a package with package_architecture belongs into the package index options describe.
+    """
+    if options["distribution"][-1] == "/":
+        return (
+            not options["remote_architectures"]
+            or package_architecture == "all"
+            or package_architecture in options["remote_architectures"]
+        )
+    # We drop packages if the package_architecture != architecture unless that architecture is
+    # "all" in a "mixed" (containing all as well as architecture specific packages) package index:
+    return package_architecture == options["architecture"] or (
+        package_architecture == "all" and "all" not in options["release_architectures"]
+    )
+
+
+def _parse_package_paragraphs(raw_paragraphs, options):
+    """
+    Parse and validate a chunk of package paragraphs from a package index.
+
+    This runs inside the parse process pool (if one is used), so it takes and returns only plain
+    data: The options describe the package index the chunk belongs to, and one compact record is
+    returned for each valid package paragraph that belongs into that package index.
+    """
+    package_records = []
+    for raw_paragraph in raw_paragraphs:
+        package_paragraph = deb822.Packages(raw_paragraph)
+        # Sanity check the architecture from the package paragraph:
+        package_paragraph_architecture = package_paragraph["Architecture"]
+        if not _package_architecture_wanted(package_paragraph_architecture, options):
+            if options["distribution"][-1] == "/":
+                message = (
+                    "Omitting package '{}' with architecture '{}' from flat repo distribution "
+                    "'{}', since we are filtering for architectures '{}'!"
+                )
+                log.debug(
+                    _(message).format(
+                        package_paragraph["Filename"],
+                        package_paragraph_architecture,
+                        options["distribution"],
+                        " ".join(options["remote_architectures"]),
+                    )
+                )
+            elif not options["hybrid_format"]:
+                message = (
+                    "The upstream package index in '{}' contains package '{}' with wrong "
+                    "architecture '{}'. Skipping!"
+                )
+                log.warning(
+                    _(message).format(
+                        options["package_index_dir"],
+                        package_paragraph["Filename"],
+                        package_paragraph_architecture,
+                    )
+                )
+            continue
+        try:
+            package_relpath = os.path.normpath(package_paragraph["Filename"])
+            package_sha256 = package_paragraph["sha256"]
+            if package_relpath.endswith(".deb"):
+                package_class = Package
+                serializer_class = Package822Serializer
+            elif package_relpath.endswith(".udeb"):
+                package_class = InstallerPackage
+                serializer_class = InstallerPackage822Serializer
+            log.debug(_("Downloading package {}").format(package_paragraph["Package"]))
+            package_fields = serializer_class.validated_data_from822(package_paragraph)
+            package_records.append(
+                {
+                    "suffix": package_class.SUFFIX,
+                    "relative_path": package_relpath,
+                    "sha256": package_sha256,
+                    "size": int(package_paragraph["Size"]),
+                    "checksums": _get_checksums(package_paragraph),
+                    "fields": package_fields,
+                }
+            )
+        except KeyError:
+            log.warning(_("Ignoring invalid package paragraph. {}").format(package_paragraph))
+    return package_records
+
+
 @sync_to_async
 def _get_content_artifact_file(content_artifact):
     return content_artifact.artifact.file
 
 
 @sync_to_async
-def _readd_previous_package_indices(previous_version, new_version, distribution):
-    new_version.add_content(
+def _get_previous_distribution_content(previous_version, release_file, previous_metadata):
+    """
+    Get the primary keys of all content belonging to the distribution of an unchanged release_file
+    from the previous version, except for the release_file itself.
+
+    The package indices and installer file indices are taken from the previous_metadata (see
+    _get_previous_metadata).
+    """
+    distribution = release_file.distribution
+    # Metadata files of the distribution are found within the directory of its release file:
+    metadata_dir = os.path.join(os.path.dirname(release_file.relative_path), "")
+    if distribution[-1] == "/":
+        # The metadata files of a flat repo are right next to its release file, and the directory
+        # may well be the repository root, which also holds the "dists" of other distributions:
+        metadata_dir_regex = "^{}[^/]+$".format(re.escape(metadata_dir))
+    else:
+        metadata_dir_regex = "^{}".format(re.escape(metadata_dir))
+    release_components = previous_version.get_content(
+        ReleaseComponent.objects.filter(distribution=distribution)
+    )
+    package_release_components = previous_version.get_content(
+        PackageReleaseComponent.objects.filter(release_component__in=release_components)
+    )
+
+    def units_within_metadata_dir(model):
+        return [
+            unit
+            for relative_path, units in previous_metadata[model].items()
+            if re.match(metadata_dir_regex, relative_path)
+            for unit in units
+        ]
+
+    package_indices = units_within_metadata_dir(PackageIndex)
+    installer_file_indices = units_within_metadata_dir(InstallerFileIndex)
+    content_pks = set(package_release_components.values_list("package_id", flat=True))
+    content_pks.update(unit.pk for unit in package_indices + installer_file_indices)
+    for content_qs in [
+        previous_version.get_content(Release.objects.filter(distribution=distribution)),
+        previous_version.get_content(ReleaseArchitecture.objects.filter(distribution=distribution)),
+        release_components,
+        package_release_components,
         previous_version.get_content(
-            PackageIndex.objects.filter(relative_path__contains=distribution)
+            GenericContent.objects.filter(relative_path__regex=metadata_dir_regex)
+        ),
+    ]:
+        content_pks.update(content_qs.values_list("pk", flat=True))
+
+    # Installer packages are only referenced by the debian-installer package indices:
+    installer_package_indices = [
+        package_index
+        for package_index in package_indices
+        if "/debian-installer/" in package_index.relative_path
+    ]
+    if installer_package_indices:
+        previous_installer_packages = _get_previous_packages(
+            previous_version, None, "debian-installer"
         )
+        for package_index in installer_package_indices:
+            for key in _scan_package_index_keys(package_index.main_artifact.file):
+                if key in previous_installer_packages:
+                    content_pks.add(previous_installer_packages[key][0])
+    return content_pks
+
+
+@sync_to_async
+def _get_or_create_package_release_components(package_pks, release_component):
+    """
+    Get the PackageReleaseComponents of the given packages, creating the missing ones in bulk.
+
+    Returns:
+        list: The primary keys of the PackageReleaseComponents.
+    """
+    package_release_components = PackageReleaseComponent.objects.filter(
+        release_component=release_component, package__in=package_pks
     )
-    new_version.add_content(
-        previous_version.get_content(
-            InstallerFileIndex.objects.filter(relative_path__contains=distribution)
+    # Orphan cleanup protection for the existing PackageReleaseComponents:
+    package_release_components.touch()
+    existing = dict(package_release_components.values_list("package", "pk"))
+    missing_package_pks = [
+        package_pk for package_pk in dict.fromkeys(package_pks) if package_pk not in existing
+    ]
+    if not missing_package_pks:
+        return list(existing.values())
+    for i in range(0, len(missing_package_pks), PACKAGE_RELEASE_COMPONENT_BATCH_SIZE):
+        _create_package_release_components(
+            missing_package_pks[i : i + PACKAGE_RELEASE_COMPONENT_BATCH_SIZE], release_component
         )
+    # Including those a concurrent sync created in the meantime:
+    return list(package_release_components.values_list("pk", flat=True))
+
+
+def _create_package_release_components(package_pks, release_component):
+    """
+    Create the PackageReleaseComponents of the given packages, skipping any that exist already.
+
+    Django's bulk_create() does not support multi-table models, so the PackageReleaseComponent rows
+    are inserted ignoring conflicts first, like bulk_create(ignore_conflicts=True) does it. Only
+    then are the Content rows of those actually inserted created, since the foreign key of the
+    PackageReleaseComponent rows to them is not checked before the end of the transaction.
+    """
+    opts = PackageReleaseComponent._meta
+    columns = [
+        connection.ops.quote_name(opts.get_field(name).column)
+        for name in ("content_ptr", "package", "release_component")
+    ]
+    sql = "INSERT INTO {} ({}) VALUES {} ON CONFLICT DO NOTHING RETURNING {}".format(
+        connection.ops.quote_name(opts.db_table),
+        ", ".join(columns),
+        ", ".join(["(%s, %s, %s)"] * len(package_pks)),
+        columns[0],
     )
+    package_release_components = [
+        Content(pulp_type=PackageReleaseComponent.get_pulp_type()) for package_pk in package_pks
+    ]
+    params = []
+    for content, package_pk in zip(package_release_components, package_pks):
+        params.extend([content.pulp_id, package_pk, release_component.pk])
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            created_pks = {str(pk) for (pk,) in cursor.fetchall()}
+        Content.objects.bulk_create(
+            [content for content in package_release_components if str(content.pk) in created_pks]
+        )
 
 
-@sync_to_async
-def _get_previous_release_file(previous_version, distribution):
-    previous_release_file_qs = previous_version.get_content(
-        ReleaseFile.objects.filter(distribution=distribution)
+def _get_sync_checkpoint(remote, repository_pk, remote_options, package_index):
+    """
+    Get the checkpoint an interrupted sync left for the package index, if it can be resumed from.
+
+    The checkpoint must match the remote options and the package index, and all of its content
+    must still exist, that is it must not have been removed by orphan cleanup in the meantime.
+    """
+    checkpoint = AptSyncCheckpoint.objects.filter(
+        repository_id=repository_pk,
+        remote=remote,
+        relative_path=package_index.relative_path,
+        artifact_set_sha256=package_index.artifact_set_sha256,
+    ).first()
+    if checkpoint is None or checkpoint.remote_options != remote_options:
+        return None
+    for i in range(0, len(checkpoint.content_pks), BULK_CONTENT_BATCH_SIZE):
+        batch = checkpoint.content_pks[i : i + BULK_CONTENT_BATCH_SIZE]
+        content = Content.objects.filter(pk__in=batch)
+        if content.count() != len(batch):
+            return None
+        # Orphan cleanup protection until the content is added to the new repository version:
+        content.touch()
+    checkpoint.content_pks = [UUID(pk) for pk in checkpoint.content_pks]
+    return checkpoint
+
+
+def _save_sync_checkpoints(checkpoints):
+    """
+    Save the checkpoints, replacing those of earlier syncs for the same package indices.
+    """
+    AptSyncCheckpoint.objects.bulk_create(
+        checkpoints,
+        update_conflicts=True,
+        unique_fields=["repository", "remote", "relative_path"],
+        update_fields=["remote_options", "artifact_set_sha256", "content_pks", "architectures"],
     )
-    if previous_release_file_qs.count() > 1:
-        message = "Previous ReleaseFile count: {}. There should only be one."
-        raise Exception(message.format(previous_release_file_qs.count()))
-    return previous_release_file_qs.first()
 
 
-@sync_to_async
-def _get_previous_package_index(previous_version, relative_path):
-    previous_package_index_qs = previous_version.get_content(
-        PackageIndex.objects.filter(relative_path=relative_path)
+def _get_package_index_cache_key(sha256, options, url):
+    """
+    Get the key of the package index cache entry for a package index at the url parsed with options.
+
+    Only the options that decide which of its packages are wanted are part of the key, so syncs
+    using different filters share the entries of the package indices they have in common. The
+    entries are shared by all remotes of the upstream repo at the url, see _get_cached_packages.
+    """
+    if options["distribution"][-1] == "/":
+        wanted = ["/", sorted(options["remote_architectures"])]
+    else:
+        wanted = [options["architecture"], sorted(options["release_architectures"])]
+    wanted.append(options["package_filters"])
+    wanted.append(url)
+    return hashlib.sha256(json.dumps([sha256] + wanted, sort_keys=True).encode()).hexdigest()
+
+
+def _get_package_index_cache_path(cache_key):
+    cache_directory = settings.PACKAGE_INDEX_CACHE_DIRECTORY or os.path.join(
+        settings.WORKING_DIRECTORY, "deb-package-index-cache"
+    )
+    return os.path.join(cache_directory, cache_key)
+
+
+def _get_cached_packages(cache_key, remote, to_url):
+    """
+    Get the packages of a package index from the package index cache.
+
+    Cached packages skip the pipeline, so the remote artifacts of the remote are created for them
+    here, with their urls built by to_url from their relative paths.
+
+    Returns a list of (pk, architecture) tuples of the packages and a list of the pks of the
+    installer packages, or None if the package index is not cached, some of its packages have
+    been removed by orphan cleanup in the meantime, or the remote uses the immediate policy and
+    some of their artifacts have not been downloaded.
+    """
+    cache_path = _get_package_index_cache_path(cache_key)
+    try:
+        with open(cache_path) as cache_file:
+            cached_pks = json.load(cache_file)
+        # Mark the entry as recently used:
+        os.utime(cache_path)
+    except (OSError, ValueError):
+        return None
+    packages = []
+    installer_package_pks = []
+    for i in range(0, len(cached_pks), BULK_CONTENT_BATCH_SIZE):
+        batch = cached_pks[i : i + BULK_CONTENT_BATCH_SIZE]
+        packages.extend(Package.objects.filter(pk__in=batch).values_list("pk", "architecture"))
+        installer_package_pks.extend(
+            InstallerPackage.objects.filter(pk__in=batch).values_list("pk", flat=True)
+        )
+        # Orphan cleanup protection until the packages are added to the new repository version:
+        Content.objects.filter(pk__in=batch).touch()
+    if len(packages) + len(installer_package_pks) != len(cached_pks):
+        return None
+    remote_artifacts = []
+    for i in range(0, len(cached_pks), BULK_CONTENT_BATCH_SIZE):
+        batch = cached_pks[i : i + BULK_CONTENT_BATCH_SIZE]
+        batch_remote_artifacts = _get_missing_remote_artifacts(batch, remote, to_url)
+        if batch_remote_artifacts is None:
+            return None
+        remote_artifacts.extend(batch_remote_artifacts)
+    RemoteArtifact.objects.bulk_create(
+        remote_artifacts, batch_size=BULK_CONTENT_BATCH_SIZE, ignore_conflicts=True
     )
-    if previous_package_index_qs.count() > 1:
-        message = "Previous PackageIndex count: {}. There should only be one."
-        raise Exception(message.format(previous_package_index_qs.count()))
-    return previous_package_index_qs.first()
+    return packages, installer_package_pks
+
+
+def _get_missing_remote_artifacts(content_pks, remote, to_url):
+    """
+    Get the unsaved remote artifacts of the remote missing for the content artifacts of the content.
+
+    Their digests are those of the downloaded artifact, or of the remote artifact of another remote
+    with the same url. Returns None if there is neither, or if the remote uses the immediate policy
+    and an artifact has not been downloaded.
+    """
+    content_artifacts = ContentArtifact.objects.filter(content__in=content_pks).select_related(
+        "artifact"
+    )
+    urls = {
+        content_artifact.pk: to_url(content_artifact.relative_path)
+        for content_artifact in content_artifacts
+    }
+    existing_pks = set(
+        RemoteArtifact.objects.filter(
+            content_artifact__in=content_artifacts, remote=remote
+        ).values_list("content_artifact", flat=True)
+    )
+    other_remote_artifacts = {
+        remote_artifact.content_artifact_id: remote_artifact
+        for remote_artifact in RemoteArtifact.objects.filter(
+            content_artifact__in=content_artifacts, url__in=urls.values()
+        ).exclude(remote=remote)
+    }
+    remote_artifacts = []
+    for content_artifact in content_artifacts:
+        if remote.policy == Remote.IMMEDIATE and content_artifact.artifact is None:
+            return None
+        if content_artifact.pk in existing_pks:
+            continue
+        source = content_artifact.artifact or other_remote_artifacts.get(content_artifact.pk)
+        if source is None:
+            return None
+        remote_artifacts.append(
+            RemoteArtifact(
+                content_artifact=content_artifact,
+                remote=remote,
+                url=urls[content_artifact.pk],
+                size=source.size,
+                **{digest: getattr(source, digest) for digest in Artifact.DIGEST_FIELDS},
+            )
+        )
+    return remote_artifacts
+
+
+def _cache_packages(cache_key, package_pks):
+    """
+    Add the packages of a package index to the package index cache.
+
+    The least recently used entries are evicted, once the cache exceeds PACKAGE_INDEX_CACHE_SIZE.
+    """
+    cache_path = _get_package_index_cache_path(cache_key)
+    if os.path.exists(cache_path):
+        os.utime(cache_path)
+        return
+    cache_directory = os.path.dirname(cache_path)
+    os.makedirs(cache_directory, exist_ok=True)
+    # Write the entry to a temporary file first, so concurrent syncs never read a partial entry:
+    with NamedTemporaryFile("w", dir=cache_directory, prefix=".", delete=False) as cache_file:
+        json.dump([str(pk) for pk in package_pks], cache_file)
+    os.replace(cache_file.name, cache_path)
+
+    entries = []
+    for entry in os.scandir(cache_directory):
+        if not entry.name.startswith("."):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    cache_size = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if cache_size <= settings.PACKAGE_INDEX_CACHE_SIZE:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            # A concurrent sync has evicted the entry already.
+            pass
+        cache_size -= size
+
+
+def _get_previous_packages(previous_version, release_component, package_index_dir):
+    """
+    Map the (relative_path, sha256) of packages in the previous version that belong to a package
+    index onto their (package_pk, prc_pk, architecture).
+
+    For debian-installer package indices there are no PackageReleaseComponents and prc_pk is None.
+    """
+    if "debian-installer" in package_index_dir:
+        installer_packages = previous_version.get_content(InstallerPackage.objects.all())
+        return {
+            (relative_path, sha256): (pk, None, architecture)
+            for relative_path, sha256, pk, architecture in installer_packages.values_list(
+                "relative_path", "sha256", "pk", "architecture"
+            ).iterator()
+        }
+    package_release_components = previous_version.get_content(
+        PackageReleaseComponent.objects.filter(release_component=release_component)
+    )
+    return {
+        (relative_path, sha256): (package_pk, prc_pk, architecture)
+        for relative_path, sha256, package_pk, prc_pk, architecture in (
+            package_release_components.values_list(
+                "package__relative_path",
+                "package__sha256",
+                "package_id",
+                "pk",
+                "package__architecture",
+            ).iterator()
+        )
+    }
+
+
+@sync_to_async
+def _get_unchanged_packages(package_index_artifact, previous_packages, options):
+    """
+    Select the previous_packages that belong to an unchanged package index.
+
+    Packages are matched to the package index by the architecture rules applied while parsing it,
+    only debian-installer package indices are scanned to find their installer packages.
+    """
+    if "debian-installer" in options["package_index_dir"]:
+        return [
+            previous_packages[key]
+            for key in _scan_package_index_keys(package_index_artifact.file, options)
+            if key in previous_packages
+        ]
+    return [
+        previous_package
+        for previous_package in previous_packages.values()
+        if _package_architecture_wanted(previous_package[2], options)
+    ]
+
+
+def _scan_package_index_keys(package_index_file, options=None):
+    """
+    Scan a package index for the (relative_path, sha256) pairs of the packages it lists.
+
+    If options are given, packages that do not belong into the package index they describe are
+    left out.
+    """
+    keys = set()
+    with package_index_file.open("rb") as f_in:
+        chunks = _iter_package_index_chunks(f_in, settings.PACKAGE_INDEX_PARSE_CHUNK_SIZE)
+        for chunk in _scan_package_index_chunks(chunks):
+            for raw_paragraph, fields in chunk:
+                if options and not _package_architecture_wanted(
+                    fields.get("Architecture"), options
+                ):
+                    continue
+                keys.add(_get_package_key(fields))
+    return keys
+
+
+@sync_to_async
+def _get_previous_metadata(previous_version):
+    """
+    Load the ReleaseFile, PackageIndex and InstallerFileIndex units of the previous version in bulk.
+
+    Returns a dict mapping each of these models onto a dict of lists of its units, keyed by
+    distribution for ReleaseFiles and by relative_path for the indices.
+    """
+    previous_metadata = {}
+    for model, key in PREVIOUS_METADATA_KEYS.items():
+        units = defaultdict(list)
+        for unit in previous_version.get_content(model.objects.all()).iterator():
+            units[getattr(unit, key)].append(unit)
+        previous_metadata[model] = dict(units)
+    return previous_metadata
 
 
 @sync_to_async
@@ -1209,6 +3451,19 @@ def _get_artifact_set_sha256(d_content, supported_artifacts):
     return hashlib.sha256(hash_string.encode("utf-8")).hexdigest()
 
 
+def _get_http_validators(headers):
+    """
+    Get the HTTP validators for conditional requests from the headers of a response.
+    """
+    validators = {}
+    if headers:
+        if "ETag" in headers:
+            validators["etag"] = headers["ETag"]
+        if "Last-Modified" in headers:
+            validators["last_modified"] = headers["Last-Modified"]
+    return validators
+
+
 def _get_checksums(unit_dict):
     """
     Filters the unit_dict provided to retain only checksum fields present in the
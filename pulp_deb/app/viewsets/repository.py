@@ -9,7 +9,7 @@ from pulp_deb.app.serializers import AptRepositorySyncURLSerializer
 
 from pulpcore.plugin.actions import ModifyRepositoryActionMixin
 from pulpcore.plugin.serializers import AsyncOperationResponseSerializer
-from pulpcore.plugin.models import RepositoryVersion
+from pulpcore.plugin.models import RepositoryVersion, TaskGroup
 from pulpcore.plugin.tasking import dispatch
 from pulpcore.plugin.viewsets import (
     OperationPostponedResponse,
@@ -57,6 +57,37 @@ class AptRepositoryViewSet(RepositoryViewSet, ModifyRepositoryActionMixin):
         mirror = serializer.validated_data.get("mirror")
         optimize = serializer.validated_data.get("optimize")
 
+        if serializer.validated_data.get("plan"):
+            # Planning does not change the repository:
+            result = dispatch(
+                func=tasks.plan_synchronize,
+                shared_resources=[repository, remote],
+                kwargs={
+                    "remote_pk": remote.pk,
+                    "repository_pk": repository.pk,
+                    "mirror": mirror,
+                },
+            )
+            return OperationPostponedResponse(result, request)
+
+        if serializer.validated_data.get("distributed"):
+            task_group = TaskGroup.objects.create(
+                description=_("Distributed sync of repository {}").format(repository.name)
+            )
+            result = dispatch(
+                func=tasks.synchronize_distributed,
+                task_group=task_group,
+                exclusive_resources=[repository],
+                shared_resources=[remote],
+                kwargs={
+                    "remote_pk": remote.pk,
+                    "repository_pk": repository.pk,
+                    "mirror": mirror,
+                    "optimize": optimize,
+                },
+            )
+            return OperationPostponedResponse(result, request)
+
         result = dispatch(
             func=tasks.synchronize,
             exclusive_resources=[repository],
@@ -10,11 +10,15 @@ from pulp_deb.tests.functional.constants import (
     DEB_FIXTURE_COMPONENT,
     DEB_FIXTURE_COMPONENT_UPDATE,
     DEB_FIXTURE_INVALID_REPOSITORY_NAME,
+    DEB_FIXTURE_MULTI_DIST,
     DEB_FIXTURE_SINGLE_DIST,
     DEB_FIXTURE_STANDARD_REPOSITORY_NAME,
     DEB_FIXTURE_SUMMARY,
     DEB_FIXTURE_UPDATE_REPOSITORY_NAME,
     DEB_FULL_FIXTURE_SUMMARY,
+    DEB_PACKAGE_NAME,
+    DEB_REPORT_CODE_PLAN_ADDED,
+    DEB_REPORT_CODE_PLAN_REMOVED,
     DEB_REPORT_CODE_SKIP_PACKAGE,
     DEB_REPORT_CODE_SKIP_RELEASE,
     DEB_SIGNING_KEY,
@@ -27,6 +31,7 @@ from pulp_deb.tests.functional.constants import (
     [
         ({"gpgkey": DEB_SIGNING_KEY}, DEB_FIXTURE_SUMMARY),
         ({"gpgkey": DEB_SIGNING_KEY, "sync_udebs": True}, DEB_FULL_FIXTURE_SUMMARY),
+        ({"gpgkey": DEB_SIGNING_KEY, "metadata_policy": "minimal"}, DEB_FIXTURE_SUMMARY),
     ],
 )
 def test_sync(
@@ -38,7 +43,7 @@ def test_sync(
     fixture_summary,
     remote_params,
 ):
-    """Test whether synchronizations with and without udebs works as expected."""
+    """Test whether synchronizations with and without udebs or minimal metadata work."""
     # Create a repository and a remote and verify latest `repository_version` is 0
     repo = deb_repository_factory()
     url = deb_get_fixture_server_url()
@@ -376,9 +381,125 @@ def test_sync_orphan_cleanup_fail(
             assert report.done == 2
 
 
+@pytest.mark.parallel
+def test_sync_optimize_mirror(
+    deb_get_fixture_server_url,
+    deb_remote_factory,
+    deb_repository_factory,
+    deb_get_repository_by_href,
+    deb_sync_repository,
+):
+    """Test whether optimized mirror synchronizations yield the same content as full ones."""
+    # Sync the repository in mirror mode
+    repo = deb_repository_factory()
+    url = deb_get_fixture_server_url()
+    remote = deb_remote_factory(url=url, distributions=DEB_FIXTURE_SINGLE_DIST)
+    task = deb_sync_repository(remote, repo, mirror=True)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/1/")
+    assert not is_sync_skipped(task, DEB_REPORT_CODE_SKIP_RELEASE)
+    summary = get_content_summary(repo.to_dict())
+
+    # Sync again, the unchanged release file must carry all content over
+    task_skip = deb_sync_repository(remote, repo, mirror=True)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/1/")
+    assert is_sync_skipped(task_skip, DEB_REPORT_CODE_SKIP_RELEASE)
+    assert get_content_summary(repo.to_dict()) == summary
+
+    # Sync from the updated repository, skipping the unchanged package index
+    url = deb_get_fixture_server_url(DEB_FIXTURE_UPDATE_REPOSITORY_NAME)
+    remote_diff = deb_remote_factory(url=url, distributions=DEB_FIXTURE_SINGLE_DIST)
+    task_diff = deb_sync_repository(remote_diff, repo, mirror=True)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/2/")
+    assert not is_sync_skipped(task_diff, DEB_REPORT_CODE_SKIP_RELEASE)
+    assert is_sync_skipped(task_diff, DEB_REPORT_CODE_SKIP_PACKAGE)
+
+    # Verify the content is identical to that of a full mirror sync of the updated repository
+    repo_full = deb_repository_factory()
+    deb_sync_repository(remote_diff, repo_full, mirror=True)
+    repo_full = deb_get_repository_by_href(repo_full.pulp_href)
+    assert get_content_summary(repo.to_dict()) == get_content_summary(repo_full.to_dict())
+
+
+@pytest.mark.parallel
+def test_sync_plan(
+    deb_get_fixture_server_url,
+    deb_remote_factory,
+    deb_repository_factory,
+    deb_get_repository_by_href,
+    deb_sync_repository,
+):
+    """Test whether a sync plan estimates the changes of a sync without making them."""
+    repo = deb_repository_factory()
+    url = deb_get_fixture_server_url()
+    remote = deb_remote_factory(url=url, distributions=DEB_FIXTURE_SINGLE_DIST)
+
+    # Plan the sync and verify that no `repository_version` was created
+    task_plan = deb_sync_repository(remote, repo, mirror=True, plan=True)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/0/")
+    plan = get_report_totals(task_plan)
+
+    # Verify that the plan matches the actual sync
+    deb_sync_repository(remote, repo, mirror=True)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/1/")
+    added_packages = get_added_content_summary(repo.to_dict())[DEB_PACKAGE_NAME]
+    assert plan[DEB_REPORT_CODE_PLAN_ADDED] == added_packages
+    assert plan[DEB_REPORT_CODE_PLAN_REMOVED] == 0
+
+    # Plan a mirror sync from the updated repository
+    url = deb_get_fixture_server_url(DEB_FIXTURE_UPDATE_REPOSITORY_NAME)
+    remote_diff = deb_remote_factory(url=url, distributions=DEB_FIXTURE_SINGLE_DIST)
+    plan = get_report_totals(deb_sync_repository(remote_diff, repo, mirror=True, plan=True))
+    summary = get_content_summary(repo.to_dict())
+    deb_sync_repository(remote_diff, repo, mirror=True)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/2/")
+    assert get_content_summary(repo.to_dict())[DEB_PACKAGE_NAME] == (
+        summary[DEB_PACKAGE_NAME]
+        + plan[DEB_REPORT_CODE_PLAN_ADDED]
+        - plan[DEB_REPORT_CODE_PLAN_REMOVED]
+    )
+
+
+def get_report_totals(task):
+    """Returns the totals of the progress reports of a given task by their code."""
+    return {report.code: report.total for report in task.progress_reports}
+
+
 def is_sync_skipped(task, code):
     """Checks if a given task has skipped the sync based of a given code."""
     for report in task.progress_reports:
         if report.code == code:
             return True
     return False
+
+
+@pytest.mark.parallel
+def test_sync_distributed(
+    deb_get_fixture_server_url,
+    deb_remote_factory,
+    deb_repository_factory,
+    deb_get_repository_by_href,
+    deb_sync_repository,
+    monitor_task_group,
+):
+    """Test whether a distributed sync creates the same repository version as a regular sync."""
+    url = deb_get_fixture_server_url()
+    remote = deb_remote_factory(url=url, distributions=DEB_FIXTURE_MULTI_DIST)
+
+    # Sync each distribution in a child task and wait for the merge
+    repo = deb_repository_factory()
+    task = deb_sync_repository(remote, repo, distributed=True)
+    monitor_task_group(task.task_group)
+    repo = deb_get_repository_by_href(repo.pulp_href)
+    assert repo.latest_version_href.endswith("/1/")
+
+    # Verify the content is identical to that of a regular sync
+    repo_regular = deb_repository_factory()
+    deb_sync_repository(remote, repo_regular)
+    repo_regular = deb_get_repository_by_href(repo_regular.pulp_href)
+    assert get_content_summary(repo.to_dict()) == get_content_summary(repo_regular.to_dict())
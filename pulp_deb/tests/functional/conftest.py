@@ -431,14 +431,18 @@ def deb_sync_repository(apt_repository_api, monitor_task):
     and returns the monitored task.
     """
 
-    def _deb_sync_repository(remote, repo):
+    def _deb_sync_repository(remote, repo, mirror=False, **kwargs):
         """Sync a given remote and repository.
 
         :param remote: The remote where to sync from.
         :param repo: The repository that needs syncing.
+        :param mirror: Whether to sync in mirror mode.
+        :param kwargs: Further sync parameters, like plan.
         :returns: The task of the sync operation.
         """
-        repository_sync_data = AptRepositorySyncURL(remote=remote.pulp_href)
+        repository_sync_data = AptRepositorySyncURL(
+            remote=remote.pulp_href, mirror=mirror, **kwargs
+        )
         sync_response = apt_repository_api.sync(repo.pulp_href, repository_sync_data)
         return monitor_task(sync_response.task)
 
@@ -102,6 +102,8 @@ DEB_FIXTURE_PACKAGE_COUNT = DEB_FIXTURE_SUMMARY.get(DEB_PACKAGE_NAME, 0)
 
 DEB_REPORT_CODE_SKIP_RELEASE = "sync.release_file.was_skipped"
 DEB_REPORT_CODE_SKIP_PACKAGE = "sync.package_index.was_skipped"
+DEB_REPORT_CODE_PLAN_ADDED = "sync.plan.packages_added"
+DEB_REPORT_CODE_PLAN_REMOVED = "sync.plan.packages_removed"
 
 DEB_PACKAGE_RELPATH = "frigg_1.0_ppc64.deb"
 DEB_GENERIC_CONTENT_RELPATH = "dists/ragnarok/asgard/binary-armeb/Release"
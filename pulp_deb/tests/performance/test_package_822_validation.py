@@ -0,0 +1,70 @@
+"""Benchmark validating package paragraphs with and without a serializer instance."""
+import logging
+import time
+
+from django.test import TestCase
+from debian import deb822
+
+from pulp_deb.app.serializers import Package822Serializer
+
+log = logging.getLogger(__name__)
+
+PACKAGE_COUNT = 2000
+PACKAGE_PARAGRAPH = """\
+Package: package-{index}
+Source: source-{index}
+Version: 1.{index}-1
+Architecture: amd64
+Maintainer: Asgard Maintainers <maintainers@asgard.example>
+Installed-Size: {index}
+Depends: libc6 (>= 2.34), libfrigg{index} (= 1.{index}-1)
+Recommends: odin | thor
+Section: utils
+Priority: optional
+Multi-Arch: foreign
+Essential: no
+Homepage: https://asgard.example/package-{index}
+Description: Package number {index}
+ A longer description of package number {index}
+ that spans multiple lines.
+Description-md5: 0123456789abcdef0123456789abcdef
+X-Custom-Field: custom value {index}
+Filename: pool/main/p/package-{index}/package-{index}_1.{index}-1_amd64.deb
+Size: {index}
+SHA256: {sha256}
+"""
+
+
+class TestPackage822ValidationPerformance(TestCase):
+    """Compare validated_data_from822 with the from822 serializer."""
+
+    def setUp(self):
+        """Generate the package paragraphs."""
+        self.paragraphs = [
+            deb822.Packages(PACKAGE_PARAGRAPH.format(index=index, sha256="{:064x}".format(index)))
+            for index in range(PACKAGE_COUNT)
+        ]
+
+    def test_parity(self):
+        """Test validated_data_from822 has the same result as from822, and log the timings."""
+        start = time.perf_counter()
+        serializer_results = []
+        for paragraph in self.paragraphs:
+            serializer = Package822Serializer.from822(data=paragraph)
+            serializer.is_valid(raise_exception=True)
+            serializer_results.append(dict(serializer.validated_data))
+        serializer_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        results = [
+            Package822Serializer.validated_data_from822(paragraph) for paragraph in self.paragraphs
+        ]
+        validator_time = time.perf_counter() - start
+
+        self.assertEqual(results, serializer_results)
+        log.info(
+            "Validated %d packages: serializer %.3fs, validated_data_from822 %.3fs",
+            PACKAGE_COUNT,
+            serializer_time,
+            validator_time,
+        )
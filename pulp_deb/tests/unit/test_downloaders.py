@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase
+
+from pulp_deb.app.downloaders import ADAPTIVE_WINDOW_MIN_DOWNLOADS, AdaptiveConcurrencyLimiter
+
+
+class TestAdaptiveConcurrencyLimiter(TestCase):
+    """
+    Tests adapting the download concurrency for a host.
+    """
+
+    def setUp(self):
+        self.limiter = AdaptiveConcurrencyLimiter("example.com", 10, 2, 20)
+
+    def complete_window(self, latency):
+        for i in range(max(self.limiter.limit, ADAPTIVE_WINDOW_MIN_DOWNLOADS)):
+            async_to_sync(self.limiter.completed)(latency, 1000)
+
+    def test_bounds(self):
+        """
+        Test that the initial limit is kept within the bounds.
+        """
+        self.assertEqual(AdaptiveConcurrencyLimiter("example.com", 100, 2, 20).limit, 20)
+        self.assertEqual(AdaptiveConcurrencyLimiter("example.com", 0, 2, 20).limit, 2)
+
+    def test_throttled(self):
+        """
+        Test that throttling halves the limit once for the requests started before.
+        """
+        started = time.monotonic()
+        async_to_sync(self.limiter.throttled)(started)
+        self.assertEqual(self.limiter.limit, 5)
+        async_to_sync(self.limiter.throttled)(started)
+        self.assertEqual(self.limiter.limit, 5)
+        for i in range(2):
+            async_to_sync(self.limiter.throttled)(time.monotonic())
+        self.assertEqual(self.limiter.limit, 2)
+
+    def test_slow_start(self):
+        """
+        Test that the limit grows by half while the throughput grows, and by one afterwards.
+        """
+        self.complete_window(0.01)
+        self.assertEqual(self.limiter.limit, 15)
+        self.limiter.previous_throughput = 0
+        self.complete_window(0.01)
+        self.assertEqual(self.limiter.limit, 20)
+        self.limiter.slow_start = False
+        self.limiter.limit = 10
+        self.limiter.previous_throughput = 0
+        self.complete_window(0.01)
+        self.assertEqual(self.limiter.limit, 11)
+
+    def test_latency_increase(self):
+        """
+        Test that the limit is decreased by one when the latency rises.
+        """
+        self.complete_window(0.01)
+        limit = self.limiter.limit
+        self.complete_window(0.05)
+        self.assertEqual(self.limiter.limit, limit - 1)
+        self.assertFalse(self.limiter.slow_start)
+
+    def test_limit_downloads(self):
+        """
+        Test that no more than limit downloads run at a time.
+        """
+        limiter = AdaptiveConcurrencyLimiter("example.com", 2, 1, 20)
+        running = 0
+        peak = 0
+
+        async def download():
+            nonlocal running, peak
+            async with limiter:
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.01)
+                running -= 1
+
+        async def download_all():
+            await asyncio.gather(*[download() for i in range(10)])
+
+        async_to_sync(download_all)()
+        self.assertEqual(peak, 2)
+        self.assertEqual(limiter.active, 0)
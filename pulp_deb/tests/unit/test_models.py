@@ -2,7 +2,12 @@ from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import TestCase
 
 from pulpcore.plugin.models import Artifact, ContentArtifact
-from pulp_deb.app.models import Package
+from pulp_deb.app.models import (
+    AptRepository,
+    Package,
+    PackageReleaseComponent,
+    ReleaseComponent,
+)
 from pulp_deb.app.serializers import Package822Serializer
 
 
@@ -81,3 +86,110 @@ class TestPackage(TestCase):
             Package822Serializer(self.package1, context={"request": None}).to822().dump(),
             self.PACKAGE_PARAGRAPH,
         )
+
+
+class TestAptRepositoryRetention(TestCase):
+    """Test retaining only the newest versions of each package in a repository."""
+
+    def setUp(self):
+        """Add several versions of some packages to a repository."""
+        self.repository = AptRepository.objects.create(
+            name="retention-repository", retain_package_versions=2
+        )
+        release_component = ReleaseComponent.objects.create(
+            component="asgard", distribution="ragnarok"
+        )
+        self.packages = {}
+        for package, version, architecture in (
+            ("frigg", "1.0~rc1", "ppc64"),
+            ("frigg", "1.0", "ppc64"),
+            ("frigg", "1.1", "ppc64"),
+            ("frigg", "1:0.1", "ppc64"),
+            ("frigg", "1.0", "armeb"),
+            ("odin", "1.0", "ppc64"),
+        ):
+            self.packages[(package, version, architecture)] = Package.objects.create(
+                package=package,
+                version=version,
+                architecture=architecture,
+                maintainer="Odin",
+                description="Asgard",
+                relative_path="pool/{}_{}_{}.deb".format(package, version, architecture),
+                sha256="{}{}{}".format(package, version, architecture),
+            )
+        self.prcs = [
+            PackageReleaseComponent.objects.create(
+                package=package, release_component=release_component
+            )
+            for package in self.packages.values()
+        ]
+
+    def test_old_versions_are_removed(self):
+        """Test that only the newest versions per package and architecture are kept."""
+        with self.repository.new_version() as new_version:
+            new_version.add_content(Package.objects.filter(pk__in=self.packages.values()))
+            new_version.add_content(
+                PackageReleaseComponent.objects.filter(pk__in=[prc.pk for prc in self.prcs])
+            )
+
+        retained_packages = new_version.get_content(Package.objects)
+        self.assertCountEqual(
+            retained_packages.values_list("package", "version", "architecture"),
+            [
+                ("frigg", "1:0.1", "ppc64"),
+                ("frigg", "1.1", "ppc64"),
+                ("frigg", "1.0", "armeb"),
+                ("odin", "1.0", "ppc64"),
+            ],
+        )
+        self.assertCountEqual(
+            new_version.get_content(PackageReleaseComponent.objects).values_list(
+                "package", flat=True
+            ),
+            retained_packages.values_list("pk", flat=True),
+        )
+
+    def test_distributions_are_pruned_separately(self):
+        """Test that a package is kept as long as the release component of any distribution does."""
+        jammy = ReleaseComponent.objects.create(component="main", distribution="jammy")
+        jammy_updates = ReleaseComponent.objects.create(
+            component="main", distribution="jammy-updates"
+        )
+        packages = {}
+        for version in ("1.0", "1.1", "1.2"):
+            packages[version] = Package.objects.create(
+                package="thor",
+                version=version,
+                architecture="ppc64",
+                maintainer="Odin",
+                description="Asgard",
+                relative_path="pool/thor_{}_ppc64.deb".format(version),
+                sha256="thor{}".format(version),
+            )
+        prcs = [
+            PackageReleaseComponent.objects.create(
+                package=packages["1.0"], release_component=jammy
+            ),
+            *[
+                PackageReleaseComponent.objects.create(
+                    package=package, release_component=jammy_updates
+                )
+                for package in packages.values()
+            ],
+        ]
+        with self.repository.new_version() as new_version:
+            new_version.add_content(Package.objects.filter(pk__in=packages.values()))
+            new_version.add_content(
+                PackageReleaseComponent.objects.filter(pk__in=[prc.pk for prc in prcs])
+            )
+
+        self.assertCountEqual(
+            new_version.get_content(Package.objects).values_list("version", flat=True),
+            ["1.0", "1.1", "1.2"],
+        )
+        self.assertCountEqual(
+            new_version.get_content(PackageReleaseComponent.objects).values_list(
+                "release_component__distribution", "package__version"
+            ),
+            [("jammy", "1.0"), ("jammy-updates", "1.1"), ("jammy-updates", "1.2")],
+        )
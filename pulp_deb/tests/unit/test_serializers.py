@@ -1,7 +1,12 @@
 import unittest
 from django.test import TestCase
+from rest_framework.serializers import ValidationError
 
-from pulp_deb.app.serializers import GenericContentSerializer
+from pulp_deb.app.serializers import (
+    GenericContentSerializer,
+    InstallerPackage822Serializer,
+    Package822Serializer,
+)
 from pulp_deb.app.models import GenericContent
 
 from pulpcore.plugin.models import Artifact
@@ -36,3 +41,83 @@ class TestGenericContentSerializer(TestCase):
         data = {"_artifact": "/pulp/api/v3/artifacts/{}/".format(self.artifact.pk)}
         serializer = GenericContentSerializer(data=data)
         self.assertFalse(serializer.is_valid())
+
+
+class TestPackage822Validation(TestCase):
+    """Test validated_data_from822 against the from822 serializer."""
+
+    PARAGRAPH = {
+        "Package": "frigg",
+        "Version": "1.0",
+        "Architecture": "ppc64",
+        "Maintainer": "Odin <odin@asgard.example>",
+        "Description": "A package with a description\n that spans multiple lines",
+        "Installed-Size": "42",
+        "Essential": "yes",
+        "Build-Essential": "no",
+        "Multi-Arch": "foreign",
+        "Depends": "odin (>= 1.0), loki | thor",
+        "Filename": "pool/asgard/f/frigg/frigg_1.0_ppc64.deb",
+        "Size": "1024",
+        "SHA256": "c8ddb3dcf8da48278d57b0b94486832c66a8835316ccf7ca39e143cbfeb9184f",
+        "X-Custom-Field": "  custom value  ",
+    }
+
+    def assert_parity(self, serializer_class, paragraph):
+        """Assert both code paths accept or reject the paragraph with the same result."""
+        serializer = serializer_class.from822(data=dict(paragraph))
+        if serializer.is_valid():
+            self.assertEqual(
+                serializer_class.validated_data_from822(dict(paragraph)),
+                dict(serializer.validated_data),
+            )
+        else:
+            with self.assertRaises(ValidationError) as context:
+                serializer_class.validated_data_from822(dict(paragraph))
+            self.assertEqual(context.exception.detail, serializer.errors)
+
+    def test_valid_paragraphs(self):
+        """Test valid paragraphs translate to the same validated data."""
+        for serializer_class in (Package822Serializer, InstallerPackage822Serializer):
+            self.assert_parity(serializer_class, self.PARAGRAPH)
+            self.assert_parity(
+                serializer_class,
+                {
+                    key: value
+                    for key, value in self.PARAGRAPH.items()
+                    if key in ("Package", "Version", "Architecture", "Maintainer", "Description")
+                },
+            )
+
+    def test_dropped_fields(self):
+        """Test invalid optional fields are dropped like in from822."""
+        paragraph = dict(self.PARAGRAPH)
+        paragraph.update(
+            {
+                "Installed-Size": "a lot",
+                "Essential": "maybe",
+                "Build-Essential": "",
+                "Multi-Arch": "everything",
+                "Section": "",
+            }
+        )
+        self.assert_parity(Package822Serializer, paragraph)
+        validated_data = Package822Serializer.validated_data_from822(paragraph)
+        for key in ("installed_size", "essential", "build_essential", "multi_arch", "section"):
+            self.assertNotIn(key, validated_data)
+
+    def test_invalid_paragraphs(self):
+        """Test invalid paragraphs are rejected with the same errors."""
+        for update in (
+            {"Maintainer": " "},
+            {"Description": "null\x00character"},
+            {"Depends": "surrogate \udc80 character"},
+            {"X-Custom-Field": " "},
+            {"X-Custom-Field": "\x00"},
+        ):
+            paragraph = dict(self.PARAGRAPH)
+            paragraph.update(update)
+            self.assert_parity(Package822Serializer, paragraph)
+        paragraph = dict(self.PARAGRAPH)
+        del paragraph["Description"]
+        self.assert_parity(Package822Serializer, paragraph)
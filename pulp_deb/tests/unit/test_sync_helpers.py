@@ -1,10 +1,68 @@
-from django.test import TestCase
+import aiohttp
+import asyncio
+import gzip
+import hashlib
+import io
+import lzma
+import os
+import tempfile
+import time
+
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
 from unittest import mock
 
+from pulpcore.plugin.download import DownloadResult
+from pulpcore.plugin.exceptions import DigestValidationError, SizeValidationError
+from pulpcore.plugin.models import Artifact, Content, ContentArtifact, RemoteArtifact
+from pulpcore.plugin.stages import DeclarativeArtifact, EndStage, Stage, create_pipeline
+
+from pulp_deb.app.models import (
+    AptRemote,
+    AptRepository,
+    AptSyncCheckpoint,
+    Package,
+    PackageIndex,
+    PackageReleaseComponent,
+    ReleaseComponent,
+    ReleaseFile,
+)
+
 from pulp_deb.app.tasks.synchronizing import (
+    MIRROR_MAX_FAILURES,
+    DebFirstStage,
+    DeclarativeMirroredArtifact,
+    DeclarativeNotifyingContent,
+    SyncMetrics,
+    UpstreamMirrors,
+    _apply_ed_script,
+    _cache_packages,
+    _create_package_release_components,
+    _filter_package_paragraphs,
     _filter_split_architectures,
     _filter_split_components,
     _get_artifact_set_sha256,
+    _get_cached_packages,
+    _get_http_validators,
+    _get_known_packages,
+    _get_or_create_package_release_components,
+    _get_package_index_cache_key,
+    _get_previous_distribution_content,
+    _get_previous_metadata,
+    _get_semaphore,
+    _get_sync_checkpoint,
+    _iter_package_index_chunks,
+    _link_artifact_file,
+    _parse_package_paragraphs,
+    _run_bounded,
+    _save_sync_checkpoints,
+    _scan_package_index_chunks,
+    _scan_package_paragraph,
+    _select_pdiffs,
+    _skip_unchanged_package_paragraphs,
+    _uncompress_artifact,
+    _verify_release_signature,
+    synchronize,
 )
 
 
@@ -50,6 +108,417 @@ class TestArtifactSetSha256Generation(TestCase):
         )
 
 
+class TestHttpValidators(TestCase):
+    """
+    Tests the _get_http_validators() helper function.
+    """
+
+    def test_get_http_validators(self):
+        """
+        Test that the ETag and Last-Modified headers are used as validators.
+        """
+        self.assertEqual(
+            _get_http_validators(
+                {
+                    "ETag": '"5e8f-5c3f1a"',
+                    "Last-Modified": "Thu, 10 Aug 2023 04:11:49 GMT",
+                    "Content-Length": "24207",
+                }
+            ),
+            {"etag": '"5e8f-5c3f1a"', "last_modified": "Thu, 10 Aug 2023 04:11:49 GMT"},
+        )
+        self.assertEqual(_get_http_validators({"Content-Length": "24207"}), {})
+        self.assertEqual(_get_http_validators(None), {})
+
+
+class TestByHashUrls(TestCase):
+    """
+    Tests the download URLs of the declarative artifacts created by the DebFirstStage.
+    """
+
+    def setUp(self):
+        remote = AptRemote(url="http://example.com/debian/", distributions="stable")
+        previous_repo_version = mock.Mock(
+            info={"remote_options": {}, "sync_options": {"mirror": False}}
+        )
+        self.stage = DebFirstStage(remote, True, False, previous_repo_version)
+        self.sha256 = hashlib.sha256(b"Packages").hexdigest()
+        self.data = {"SHA256": self.sha256, "Size": "8"}
+
+    def test_plain_url(self):
+        """
+        Test that only the plain path is used without Acquire-By-Hash.
+        """
+        d_artifact = self.stage._to_d_artifact("dists/stable/main/binary-amd64/Packages", self.data)
+        self.assertEqual(
+            d_artifact.urls,
+            ["http://example.com/debian/dists/stable/main/binary-amd64/Packages"],
+        )
+
+    def test_by_hash_url(self):
+        """
+        Test that the by-hash path is tried first, falling back to the plain path.
+        """
+        d_artifact = self.stage._to_d_artifact(
+            "dists/stable/main/binary-amd64/Packages", self.data, by_hash=True
+        )
+        plain_url = "http://example.com/debian/dists/stable/main/binary-amd64/Packages"
+        by_hash_url = (
+            "http://example.com/debian/dists/stable/main/binary-amd64/by-hash/SHA256/" + self.sha256
+        )
+        # The plain url is the one kept for on-demand downloads:
+        self.assertEqual(d_artifact.urls, [plain_url])
+
+        downloaded_urls = []
+        download_result = DownloadResult(
+            url=by_hash_url, artifact_attributes={}, path="Packages", headers={}
+        )
+
+        async def download(d_artifact):
+            downloaded_urls.extend(d_artifact.urls)
+            return download_result
+
+        with mock.patch.object(DeclarativeArtifact, "download", download):
+            self.assertEqual(async_to_sync(d_artifact.download)(), download_result)
+        self.assertEqual(downloaded_urls, [by_hash_url, plain_url])
+        self.assertEqual(d_artifact.urls, [plain_url])
+
+    def test_fallback_d_artifacts(self):
+        """
+        Test that the fallback artifacts are downloaded in turn if the artifact fails.
+        """
+        xz, gz, plain = [
+            self.stage._to_d_artifact("dists/stable/main/binary-amd64/" + filename, self.data)
+            for filename in ("Packages.xz", "Packages.gz", "Packages")
+        ]
+        for d_artifact in (gz, plain):
+            d_artifact.deferred_download = True
+        xz.fallback_d_artifacts = [gz, plain]
+        downloaded_urls = []
+
+        async def download(d_artifact):
+            downloaded_urls.append(d_artifact.url)
+            if d_artifact.url.endswith("z"):
+                raise aiohttp.ClientResponseError(mock.Mock(), (), status=404)
+            return DownloadResult(
+                url=d_artifact.url, artifact_attributes={}, path="Packages", headers={}
+            )
+
+        with mock.patch.object(DeclarativeArtifact, "download", download):
+            download_result = async_to_sync(xz.download)()
+        self.assertEqual(download_result.url, plain.url)
+        self.assertEqual(downloaded_urls, [xz.url, gz.url, plain.url])
+        # The failed variants are dropped, the uncompressed one is saved:
+        self.assertEqual((xz.artifact, gz.artifact), (None, None))
+        self.assertFalse(plain.deferred_download)
+        self.assertIsNotNone(plain.artifact)
+
+
+class TestUpstreamMirrors(TestCase):
+    """
+    Tests spreading downloads across the upstream mirrors of a remote.
+    """
+
+    def setUp(self):
+        self.primary = "http://example.com/debian/"
+        self.mirror = "http://mirror.example.org/debian/"
+        self.mirrors = UpstreamMirrors([self.primary, self.mirror])
+
+    def test_spread_active_downloads(self):
+        """
+        Test that downloads are spread across unmeasured mirrors.
+        """
+        self.mirrors.started(self.primary)
+        self.assertEqual(self.mirrors.rank([self.primary, self.mirror])[0], self.mirror)
+        self.mirrors.started(self.mirror)
+        self.assertEqual(self.mirrors.rank([self.primary, self.mirror])[0], self.primary)
+
+    def test_prefer_fast_mirror(self):
+        """
+        Test that the faster mirror keeps being preferred until it is busier.
+        """
+        for base_url, seconds in ((self.primary, 4.0), (self.mirror, 1.0)):
+            self.mirrors.started(base_url)
+            self.mirrors.succeeded(base_url, 1000, seconds)
+        for active in range(3):
+            self.assertEqual(self.mirrors.rank([self.primary, self.mirror])[0], self.mirror)
+            self.mirrors.started(self.mirror)
+        self.assertEqual(self.mirrors.rank([self.primary, self.mirror])[0], self.primary)
+
+    def test_demote_failing_mirror(self):
+        """
+        Test that a mirror failing repeatedly is demoted until it succeeds again.
+        """
+        for attempt in range(MIRROR_MAX_FAILURES):
+            self.mirrors.started(self.mirror)
+            self.mirrors.failed(self.mirror)
+        for active in range(5):
+            self.mirrors.started(self.primary)
+        self.assertEqual(
+            self.mirrors.rank([self.mirror, self.primary]), [self.primary, self.mirror]
+        )
+        self.mirrors.started(self.mirror)
+        self.mirrors.succeeded(self.mirror, 1000, 1.0)
+        self.assertEqual(self.mirrors.rank([self.mirror, self.primary])[0], self.mirror)
+
+    def test_pool_d_artifact_urls(self):
+        """
+        Test that pool files are only downloaded from the mirrors matching the distribution.
+        """
+        remote = AptRemote(
+            url=self.primary, distributions="stable", mirror_urls=self.mirror + " " + self.primary
+        )
+        previous_repo_version = mock.Mock(
+            info={"remote_options": {}, "sync_options": {"mirror": False}}
+        )
+        stage = DebFirstStage(remote, True, False, previous_repo_version)
+        self.assertEqual(stage.mirror_urls, [self.mirror])
+        stage.distribution_mirror_urls["stable"] = [self.primary, self.mirror]
+        relative_path = "pool/main/f/frigg/frigg_1.0_ppc64.deb"
+        d_artifact = stage._to_pool_d_artifact(relative_path, Artifact(size=5), "stable", False)
+        self.assertIsInstance(d_artifact, DeclarativeMirroredArtifact)
+        self.assertEqual(d_artifact.url, self.primary + relative_path)
+        self.assertEqual(
+            d_artifact.urls, [self.primary + relative_path, self.mirror + relative_path]
+        )
+        d_artifact = stage._to_pool_d_artifact(relative_path, Artifact(size=5), "stable", True)
+        self.assertNotIsInstance(d_artifact, DeclarativeMirroredArtifact)
+        d_artifact = stage._to_pool_d_artifact(relative_path, Artifact(size=5), "unstable", False)
+        self.assertEqual(d_artifact.urls, [self.primary + relative_path])
+
+    def test_third_party_mirror_credentials(self):
+        """
+        Test that the credentials of the remote are only used for mirrors on the host of its url.
+        """
+        same_host_mirror = "http://example.com/debian-mirror/"
+        remote = AptRemote(
+            url=self.primary,
+            distributions="stable",
+            mirror_urls=self.mirror + " " + same_host_mirror,
+            username="odin",
+            password="gungnir",
+            headers=[{"Authorization": "Bearer sleipnir"}],
+        )
+        previous_repo_version = mock.Mock(
+            info={"remote_options": {}, "sync_options": {"mirror": False}}
+        )
+        stage = DebFirstStage(remote, True, False, previous_repo_version)
+        self.assertIs(stage.mirror_remotes[self.primary], remote)
+        self.assertIs(stage.mirror_remotes[same_host_mirror], remote)
+        third_party_remote = stage.mirror_remotes[self.mirror]
+        self.assertIsNot(third_party_remote, remote)
+        self.assertEqual(third_party_remote.url, self.primary)
+        self.assertIsNone(third_party_remote.username)
+        self.assertIsNone(third_party_remote.password)
+        self.assertIsNone(third_party_remote.headers)
+        self.assertEqual((remote.username, remote.password), ("odin", "gungnir"))
+
+        # Downloads from the third-party mirror use its remote, while the artifact keeps the remote:
+        stage.distribution_mirror_urls["stable"] = [self.primary, self.mirror]
+        relative_path = "pool/main/f/frigg/frigg_1.0_ppc64.deb"
+        d_artifact = stage._to_pool_d_artifact(relative_path, Artifact(size=5), "stable", False)
+        stage.mirrors.started(self.primary)
+        used_remotes = []
+
+        async def download(self):
+            used_remotes.append((self.remote, self.urls))
+            return "result"
+
+        with mock.patch.object(DeclarativeArtifact, "download", download):
+            self.assertEqual(async_to_sync(d_artifact.download)(), "result")
+        self.assertEqual(used_remotes, [(third_party_remote, [self.mirror + relative_path])])
+        self.assertIs(d_artifact.remote, remote)
+        self.assertEqual(d_artifact.url, self.primary + relative_path)
+
+
+class TestBoundedConcurrency(TestCase):
+    """
+    Tests the _get_semaphore() and _run_bounded() helper functions.
+    """
+
+    def _max_concurrency(self, limit, tasks=8):
+        running = []
+        peak = []
+
+        async def work():
+            running.append(None)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+        async def run():
+            semaphore = _get_semaphore(limit)
+            await asyncio.gather(*[_run_bounded(semaphore, work) for _ in range(tasks)])
+
+        async_to_sync(run)()
+        return max(peak)
+
+    def test_bounded_concurrency(self):
+        """
+        Test that no more than the limit of coroutines run at a time.
+        """
+        self.assertEqual(self._max_concurrency(1), 1)
+        self.assertEqual(self._max_concurrency(3), 3)
+
+    def test_unbounded_concurrency(self):
+        """
+        Test that a limit of 0 means no limit.
+        """
+        self.assertEqual(self._max_concurrency(0), 8)
+
+
+class TestDeclarativeNotifyingContent(TestCase):
+    """
+    Tests the DeclarativeNotifyingContent class.
+    """
+
+    def test_on_resolved(self):
+        """
+        Test that on_resolved is called on resolution, without keeping the content from batching.
+        """
+        resolved = []
+        d_content = DeclarativeNotifyingContent(
+            content=ReleaseComponent(component="main", distribution="stable"),
+            on_resolved=resolved.append,
+        )
+        self.assertTrue(d_content.does_batch)
+        d_content.resolve()
+        self.assertEqual(resolved, [d_content])
+
+
+class FakeClock:
+    """
+    A stand-in for the time module of the synchronizing task, which only moves on when told to.
+    """
+
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.now += seconds
+        await asyncio.sleep(0)
+
+
+clock = FakeClock()
+
+
+@mock.patch("pulp_deb.app.tasks.synchronizing.time", clock)
+class TestSyncMetrics(TestCase):
+    """
+    Tests measuring a sync pipeline and its package index parsing.
+    """
+
+    class Producer(Stage):
+        async def run(self):
+            for i in range(5):
+                await self.put(i)
+
+    class SlowConsumer(Stage):
+        async def run(self):
+            async for item in self.items():
+                await clock.sleep(1)
+                await self.put(item)
+
+    class BatchProducer(Stage):
+        async def run(self):
+            for i in range(5):
+                await self.put(mock.Mock(does_batch=True))
+
+    class SlowBatchConsumer(Stage):
+        async def run(self):
+            async for batch in self.batches(minsize=1):
+                for item in batch:
+                    await clock.sleep(1)
+                    await self.put(item)
+
+    class PrefetchingConsumer(Stage):
+        async def run(self):
+            items = self.items()
+            next_item = asyncio.ensure_future(items.__anext__())
+            while True:
+                try:
+                    item = await next_item
+                except StopAsyncIteration:
+                    break
+                next_item = asyncio.ensure_future(items.__anext__())
+                await self.put(item)
+
+    def test_stages(self):
+        """
+        Test that the items, wall time and queue waits of each stage are measured.
+        """
+        metrics = SyncMetrics()
+        stages = metrics.instrument([self.Producer(), self.SlowConsumer(), EndStage()])
+        async_to_sync(create_pipeline)(stages)
+
+        producer, consumer, end = metrics.summary()["stages"]
+        self.assertEqual(
+            [producer["name"], consumer["name"], end["name"]],
+            ["Producer", "SlowConsumer", "EndStage"],
+        )
+        self.assertEqual((producer["items_in"], producer["items_out"]), (0, 5))
+        self.assertEqual((consumer["items_in"], consumer["items_out"]), (5, 5))
+        self.assertEqual((end["items_in"], end["items_out"]), (5, 0))
+        self.assertEqual(consumer["wall_time"], 5)
+        self.assertEqual(consumer["items_per_second"], 1)
+        # The producer is held up by the slow consumer, which holds up the end stage:
+        self.assertGreaterEqual(producer["output_wait"], 3)
+        self.assertGreaterEqual(end["input_wait"], 4)
+        self.assertEqual(consumer["input_wait"], 0)
+
+    def test_input_wait(self):
+        """
+        Test that the input wait excludes the work of batching stages and prefetching stages.
+        """
+        metrics = SyncMetrics()
+        stages = [
+            self.BatchProducer(),
+            self.SlowBatchConsumer(),
+            self.PrefetchingConsumer(),
+            EndStage(),
+        ]
+        async_to_sync(create_pipeline)(metrics.instrument(stages))
+
+        producer, consumer, prefetching, end = metrics.summary()["stages"]
+        self.assertEqual((consumer["items_in"], consumer["items_out"]), (5, 5))
+        self.assertEqual((prefetching["items_in"], prefetching["items_out"]), (5, 5))
+        # The producer is done before the consumer is through its first batch:
+        self.assertEqual(consumer["wall_time"], 5)
+        self.assertEqual(consumer["input_wait"], 0)
+        # The prefetching stage is not held up by the wait for its input:
+        self.assertIsNone(prefetching["input_wait"])
+        self.assertGreaterEqual(end["input_wait"], 4)
+
+    def test_package_indices(self):
+        """
+        Test that the paragraphs and the parse time of each package index are measured.
+        """
+        metrics = SyncMetrics()
+        chunks = metrics.count_paragraphs("main/binary-amd64", [["a", "b"], ["c"]])
+
+        async def parse():
+            for chunk in chunks:
+                await clock.sleep(1)
+                for paragraph in chunk:
+                    yield paragraph
+
+        async def consume():
+            records = []
+            async for record in metrics.time_parsing("main/binary-amd64", parse()):
+                await clock.sleep(5)
+                records.append(record)
+            return records
+
+        self.assertEqual(async_to_sync(consume)(), ["a", "b", "c"])
+        package_index = metrics.summary()["package_indices"]["main/binary-amd64"]
+        self.assertEqual(package_index["paragraphs"], 3)
+        # Only the parsing counts, not the time spent handling the records:
+        self.assertEqual(package_index["parse_time"], 2)
+
+
 class TestArchitectureFiltering(TestCase):
     """
     Tests common as well as edge cases handled by the _filter_split_architectures function.
@@ -236,3 +705,988 @@ class TestComponentFiltering(TestCase):
 
             self.assertEqual(len(captured.records), 3)
             self.assertEqual(captured.records[0].getMessage(), expected_log_message)
+
+
+class TestPackageIndexParsing(TestCase):
+    """
+    Tests the chunking and parsing of package indices used by the sync.
+    """
+
+    PACKAGE_INDEX = (
+        b"Package: aegir\n"
+        b"Version: 0.1-edda0\n"
+        b"Architecture: ppc64\n"
+        b"Maintainer: Utgardloki\n"
+        b"Description: A sea jotunn associated with the ocean.\n"
+        b"Filename: pool/asgard/a/aegir/aegir_0.1-edda0_ppc64.deb\n"
+        b"Size: 42\n"
+        b"SHA256: eeff\n"
+        b"\n"
+        b"Package: frigg\n"
+        b"Version: 0.3-edda0\n"
+        b"Architecture: all\n"
+        b"Maintainer: Odin\n"
+        b"Description: Goddess of marriage.\n"
+        b" She is married to Odin.\n"
+        b"Filename: pool/asgard/f/frigg/frigg_0.3-edda0_all.deb\n"
+        b"Size: 23\n"
+        b"SHA256: aabb\n"
+        b"\n"
+        b"Package: loki\n"
+        b"Version: 1.0-edda0\n"
+        b"Architecture: armeb\n"
+        b"Maintainer: Laufey\n"
+        b"Description: Trickster god.\n"
+        b"Filename: pool/asgard/l/loki/loki_1.0-edda0_armeb.deb\n"
+        b"Size: 13\n"
+        b"SHA256: ccdd\n"
+    )
+
+    options = {
+        "architecture": "ppc64",
+        "distribution": "ragnarok",
+        "release_architectures": ["ppc64", "armeb"],
+        "remote_architectures": [],
+        "hybrid_format": False,
+        "package_index_dir": "dists/ragnarok/asgard/binary-ppc64",
+    }
+
+    def test_chunks_split_at_paragraph_boundaries(self):
+        """
+        Test that chunking preserves the package index and never splits a paragraph.
+        """
+        lines = self.PACKAGE_INDEX.splitlines(keepends=True)
+        chunks = list(_iter_package_index_chunks(lines, 2))
+        self.assertEqual([len(chunk) for chunk in chunks], [2, 1])
+        self.assertEqual(b"\n".join(chunks[0] + chunks[1]), self.PACKAGE_INDEX)
+        self.assertTrue(chunks[1][0].startswith(b"Package: loki\n"))
+
+    def test_parse_package_paragraphs(self):
+        """
+        Test that only packages belonging into the package index are parsed into records.
+        """
+        lines = self.PACKAGE_INDEX.splitlines(keepends=True)
+        (raw_paragraphs,) = _iter_package_index_chunks(lines, 10)
+        with self.assertLogs(level="WARNING") as captured:
+            records = _parse_package_paragraphs(raw_paragraphs, self.options)
+
+        self.assertEqual([record["fields"]["package"] for record in records], ["aegir", "frigg"])
+        self.assertEqual(len(captured.records), 1)
+        self.assertIn("loki", captured.records[0].getMessage())
+        record = records[1]
+        self.assertEqual(record["suffix"], "deb")
+        self.assertEqual(record["relative_path"], "pool/asgard/f/frigg/frigg_0.3-edda0_all.deb")
+        self.assertEqual(record["sha256"], "aabb")
+        self.assertEqual(record["size"], 23)
+        self.assertEqual(record["checksums"], {"sha256": "aabb"})
+        self.assertEqual(
+            record["fields"]["description"], "Goddess of marriage.\n She is married to Odin."
+        )
+
+    def test_skip_unchanged_package_paragraphs(self):
+        """
+        Test that paragraphs of packages from the previous version are dropped before parsing.
+        """
+        lines = self.PACKAGE_INDEX.splitlines(keepends=True)
+        previous_packages = {
+            ("pool/asgard/a/aegir/aegir_0.1-edda0_ppc64.deb", "eeff"): (1, 2, "ppc64"),
+            ("pool/asgard/f/frigg/frigg_0.3-edda0_all.deb", "0000"): (3, 4, "all"),
+            ("pool/asgard/l/loki/loki_1.0-edda0_armeb.deb", "ccdd"): (5, 6, "armeb"),
+        }
+        unchanged_packages = []
+        chunks = list(
+            _skip_unchanged_package_paragraphs(
+                _scan_package_index_chunks(_iter_package_index_chunks(lines, 10)),
+                previous_packages,
+                self.options,
+                unchanged_packages,
+            )
+        )
+
+        # frigg has a new checksum, and loki does not belong into the index, so both are kept.
+        self.assertEqual(unchanged_packages, [(1, 2, "ppc64")])
+        self.assertEqual(len(chunks), 1)
+        self.assertEqual(
+            [fields["Filename"] for raw_paragraph, fields in chunks[0]],
+            [
+                "pool/asgard/f/frigg/frigg_0.3-edda0_all.deb",
+                "pool/asgard/l/loki/loki_1.0-edda0_armeb.deb",
+            ],
+        )
+
+    def test_scan_package_paragraph(self):
+        """
+        Test that the scan extracts the fields needed to identify and filter a package, whatever
+        their case.
+        """
+        fields = _scan_package_paragraph(
+            b"Package: frigg\nARCHITECTURE: all\nDescription: Goddess.\n"
+            b" Filename: not/a/field.deb\nFilename: pool/frigg.deb\nSize: 23\nsha256: aabb\n"
+        )
+        self.assertEqual(
+            fields,
+            {
+                "Package": "frigg",
+                "Architecture": "all",
+                "Filename": "pool/frigg.deb",
+                "Size": "23",
+                "SHA256": "aabb",
+            },
+        )
+
+    def test_get_known_packages(self):
+        """
+        Test that existing packages are found by their natural key, and only those.
+        """
+        package = Package(
+            package="aegir",
+            version="0.1-edda0",
+            architecture="ppc64",
+            maintainer="Utgardloki",
+            description="A sea jotunn associated with the ocean.",
+            relative_path="pool/asgard/a/aegir/aegir_0.1-edda0_ppc64.deb",
+            sha256="eeff",
+        )
+        package.save()
+        Package(
+            package="frigg",
+            version="0.3-edda0",
+            architecture="all",
+            maintainer="Odin",
+            description="Goddess of marriage.",
+            relative_path="pool/asgard/f/frigg/frigg_0.3-edda0_all.deb",
+            sha256="0000",
+        ).save()
+        lines = self.PACKAGE_INDEX.splitlines(keepends=True)
+        (chunk,) = _scan_package_index_chunks(_iter_package_index_chunks(lines, 10))
+
+        known_packages = async_to_sync(_get_known_packages)(chunk, self.options)
+
+        self.assertEqual(
+            known_packages, {("pool/asgard/a/aegir/aegir_0.1-edda0_ppc64.deb", "eeff"): package}
+        )
+
+
+class TestPackageFilters(TestCase):
+    """
+    Tests filtering scanned package paragraphs by the package filters of a remote.
+    """
+
+    def setUp(self):
+        """Scan a chunk of package paragraphs."""
+        self.chunks = [
+            [
+                (raw_paragraph, _scan_package_paragraph(raw_paragraph))
+                for raw_paragraph in (
+                    b"Package: frigg\nSection: misc\nPriority: optional\n",
+                    b"Package: frigg-dbgsym\nSource: frigg (1.0)\nSection: debug\n",
+                    b"Package: odin\nSection: contrib/misc\nPriority: important\n",
+                    b"Package: thor\nSource: asgard\nSection: net\nPriority: optional\n",
+                )
+            ]
+        ]
+
+    def _filter(self, package_filters):
+        return [
+            fields["Package"]
+            for chunk in _filter_package_paragraphs(self.chunks, package_filters)
+            for raw_paragraph, fields in chunk
+        ]
+
+    def test_package_names(self):
+        """
+        Test that packages are filtered by their name, with exclusions taking precedence.
+        """
+        self.assertEqual(self._filter({"include_packages": ["frigg*"]}), ["frigg", "frigg-dbgsym"])
+        self.assertEqual(
+            self._filter({"include_packages": ["frigg*"], "exclude_packages": ["*-dbgsym"]}),
+            ["frigg"],
+        )
+
+    def test_sections_and_priorities(self):
+        """
+        Test that sections match with and without their area, and priorities match exactly.
+        """
+        self.assertEqual(self._filter({"sections": ["misc"]}), ["frigg", "odin"])
+        self.assertEqual(self._filter({"sections": ["contrib/misc"]}), ["odin"])
+        self.assertEqual(self._filter({"priorities": ["optional"]}), ["frigg", "thor"])
+
+    def test_source_packages(self):
+        """
+        Test that packages are filtered by their source package, which defaults to their name.
+        """
+        self.assertEqual(self._filter({"source_packages": ["frigg"]}), ["frigg", "frigg-dbgsym"])
+        self.assertEqual(self._filter({"source_packages": ["as*"]}), ["thor"])
+        self.assertEqual(self._filter({"source_packages": ["loki"]}), [])
+
+
+class TestPackageReleaseComponentCreation(TestCase):
+    """
+    Tests the bulk creation of PackageReleaseComponents.
+    """
+
+    def setUp(self):
+        """Create some packages and a release component."""
+        self.release_component = ReleaseComponent.objects.create(
+            component="asgard", distribution="ragnarok"
+        )
+        self.packages = []
+        for name in ("aegir", "frigg", "odin"):
+            package = Package(
+                package=name,
+                version="0.1-edda0",
+                architecture="ppc64",
+                maintainer="Utgardloki",
+                description="A god.",
+                relative_path="pool/asgard/{0}/{0}_0.1-edda0_ppc64.deb".format(name),
+                sha256=name,
+            )
+            package.save()
+            self.packages.append(package)
+
+    def test_get_or_create_package_release_components(self):
+        """
+        Test that missing PackageReleaseComponents are created and existing ones are reused.
+        """
+        existing = PackageReleaseComponent.objects.create(
+            package=self.packages[0], release_component=self.release_component
+        )
+        package_pks = [package.pk for package in self.packages]
+
+        prc_pks = async_to_sync(_get_or_create_package_release_components)(
+            package_pks + package_pks[1:2], self.release_component
+        )
+
+        package_release_components = PackageReleaseComponent.objects.filter(
+            release_component=self.release_component
+        )
+        self.assertEqual(package_release_components.count(), 3)
+        self.assertCountEqual(prc_pks, package_release_components.values_list("pk", flat=True))
+        self.assertIn(existing.pk, prc_pks)
+        self.assertCountEqual(
+            package_release_components.values_list("package", flat=True), package_pks
+        )
+        self.assertCountEqual(
+            async_to_sync(_get_or_create_package_release_components)(
+                package_pks, self.release_component
+            ),
+            prc_pks,
+        )
+
+    def test_create_package_release_components_conflicts(self):
+        """
+        Test that PackageReleaseComponents a concurrent sync created are skipped without a trace.
+        """
+        existing = PackageReleaseComponent.objects.create(
+            package=self.packages[0], release_component=self.release_component
+        )
+        content_count = Content.objects.count()
+
+        _create_package_release_components(
+            [package.pk for package in self.packages], self.release_component
+        )
+
+        package_release_components = PackageReleaseComponent.objects.filter(
+            release_component=self.release_component
+        )
+        self.assertEqual(package_release_components.count(), 3)
+        self.assertIn(existing, package_release_components)
+        self.assertEqual(Content.objects.count(), content_count + 2)
+        self.assertEqual(
+            {prc.pulp_type for prc in package_release_components},
+            {PackageReleaseComponent.get_pulp_type()},
+        )
+
+
+class TestPreviousMetadata(TestCase):
+    """
+    Tests loading the metadata units of the previous version in bulk.
+    """
+
+    def setUp(self):
+        """Create a repository version with a release file and two package indices."""
+        self.repository = AptRepository.objects.create(name="asgard")
+        self.release_file = ReleaseFile.objects.create(
+            codename="ragnarok",
+            suite="stable",
+            distribution="ragnarok",
+            relative_path="dists/ragnarok",
+            sha256="release",
+            artifact_set_sha256="release",
+        )
+        self.package_indices = [
+            PackageIndex.objects.create(
+                component="asgard",
+                architecture=architecture,
+                relative_path="dists/ragnarok/asgard/binary-{}/Packages".format(architecture),
+                sha256=architecture,
+                artifact_set_sha256=architecture,
+            )
+            for architecture in ("ppc64", "armeb")
+        ]
+        with self.repository.new_version() as new_version:
+            new_version.add_content(ReleaseFile.objects.filter(pk=self.release_file.pk))
+            new_version.add_content(
+                PackageIndex.objects.filter(pk__in=[pi.pk for pi in self.package_indices])
+            )
+        self.stage = DebFirstStage(
+            AptRemote(url="http://example.com/debian/", distributions="ragnarok"),
+            True,
+            False,
+            new_version,
+        )
+
+    def test_get_previous_unit(self):
+        """
+        Test that the previous units are looked up by distribution and by relative_path.
+        """
+        self.stage.previous_metadata = async_to_sync(_get_previous_metadata)(
+            self.repository.latest_version()
+        )
+        self.assertEqual(self.stage._get_previous_unit(ReleaseFile, "ragnarok"), self.release_file)
+        self.assertIsNone(self.stage._get_previous_unit(ReleaseFile, "fimbulwinter"))
+        self.assertEqual(
+            self.stage._get_previous_unit(
+                PackageIndex, "dists/ragnarok/asgard/binary-armeb/Packages"
+            ),
+            self.package_indices[1],
+        )
+
+    def test_duplicate_units(self):
+        """
+        Test that looking up a key shared by several previous units fails.
+        """
+        relative_path = "dists/ragnarok/asgard/binary-ppc64/Packages"
+        self.stage.previous_metadata = {PackageIndex: {relative_path: self.package_indices}}
+        with self.assertRaises(Exception):
+            self.stage._get_previous_unit(PackageIndex, relative_path)
+
+    def test_flat_distribution_content(self):
+        """
+        Test that only the metadata next to the release file of a flat repo belongs to it.
+        """
+        flat_release_file = ReleaseFile.objects.create(
+            codename="",
+            suite="",
+            distribution="/",
+            relative_path="Release",
+            sha256="flat",
+            artifact_set_sha256="flat",
+        )
+        flat_package_index = PackageIndex.objects.create(
+            component="",
+            architecture="",
+            relative_path="Packages",
+            sha256="flat",
+            artifact_set_sha256="flat",
+        )
+        with self.repository.new_version() as new_version:
+            new_version.add_content(
+                Content.objects.filter(
+                    pk__in=[self.release_file.pk, flat_release_file.pk, flat_package_index.pk]
+                    + [pi.pk for pi in self.package_indices]
+                )
+            )
+        previous_metadata = async_to_sync(_get_previous_metadata)(new_version)
+
+        flat_content = async_to_sync(_get_previous_distribution_content)(
+            new_version, flat_release_file, previous_metadata
+        )
+        self.assertEqual(flat_content, {flat_package_index.pk})
+        ragnarok_content = async_to_sync(_get_previous_distribution_content)(
+            new_version, self.release_file, previous_metadata
+        )
+        self.assertEqual(ragnarok_content, {pi.pk for pi in self.package_indices})
+
+
+class TestSyncCheckpoints(TestCase):
+    """
+    Tests the checkpoints that interrupted syncs leave for their completed package indices.
+    """
+
+    def setUp(self):
+        """Create a remote, a repository and some content of a package index."""
+        self.remote = AptRemote.objects.create(
+            name="checkpoint-remote", url="http://example.com/debian/", distributions="ragnarok"
+        )
+        self.repository = AptRepository.objects.create(name="checkpoint-repository")
+        self.remote_options = {"distributions": "ragnarok", "architectures": None}
+        self.package_index = mock.Mock(
+            relative_path="dists/ragnarok/asgard/binary-ppc64/Packages",
+            artifact_set_sha256="f00",
+        )
+        self.content_pks = {
+            ReleaseComponent.objects.create(component=component, distribution="ragnarok").pk
+            for component in ("asgard", "jotunheimr")
+        }
+        _save_sync_checkpoints(
+            [
+                AptSyncCheckpoint(
+                    repository=self.repository,
+                    remote=self.remote,
+                    remote_options=self.remote_options,
+                    relative_path=self.package_index.relative_path,
+                    artifact_set_sha256=self.package_index.artifact_set_sha256,
+                    content_pks=[str(pk) for pk in self.content_pks],
+                    architectures=["ppc64"],
+                )
+            ]
+        )
+
+    def test_resume_from_checkpoint(self):
+        """
+        Test that an unchanged package index is resumed from its checkpoint.
+        """
+        checkpoint = _get_sync_checkpoint(
+            self.remote, self.repository.pk, self.remote_options, self.package_index
+        )
+        self.assertCountEqual(checkpoint.content_pks, self.content_pks)
+        self.assertEqual(checkpoint.architectures, ["ppc64"])
+
+    def test_changed_package_index(self):
+        """
+        Test that a checkpoint is not used for a changed package index or remote options.
+        """
+        self.package_index.artifact_set_sha256 = "ba4"
+        self.assertIsNone(
+            _get_sync_checkpoint(
+                self.remote, self.repository.pk, self.remote_options, self.package_index
+            )
+        )
+        self.package_index.artifact_set_sha256 = "f00"
+        self.assertIsNone(
+            _get_sync_checkpoint(
+                self.remote,
+                self.repository.pk,
+                dict(self.remote_options, architectures="ppc64"),
+                self.package_index,
+            )
+        )
+
+    def test_removed_content(self):
+        """
+        Test that a checkpoint is not used once some of its content has been removed.
+        """
+        ReleaseComponent.objects.filter(component="jotunheimr").delete()
+        self.assertIsNone(
+            _get_sync_checkpoint(
+                self.remote, self.repository.pk, self.remote_options, self.package_index
+            )
+        )
+
+    def test_save_in_bulk(self):
+        """
+        Test that the checkpoints of a sync are saved in bulk once the interval has passed.
+        """
+        previous_repo_version = mock.Mock(
+            repository_id=self.repository.pk,
+            info={"remote_options": {}, "sync_options": {"mirror": False}},
+        )
+        stage = DebFirstStage(self.remote, True, False, previous_repo_version)
+        self.package_index.artifact_set_sha256 = "ba4"
+        armeb_package_index = mock.Mock(
+            relative_path="dists/ragnarok/asgard/binary-armeb/Packages",
+            artifact_set_sha256="ba4",
+        )
+        async_to_sync(stage._add_sync_checkpoint)(self.package_index, self.content_pks, {"ppc64"})
+        self.assertEqual(AptSyncCheckpoint.objects.get().artifact_set_sha256, "f00")
+
+        with override_settings(SYNC_CHECKPOINT_INTERVAL=0):
+            async_to_sync(stage._add_sync_checkpoint)(armeb_package_index, set(), {"armeb"})
+        self.assertEqual(stage.pending_checkpoints, [])
+        self.assertCountEqual(
+            AptSyncCheckpoint.objects.values_list("relative_path", "artifact_set_sha256"),
+            [
+                (self.package_index.relative_path, "ba4"),
+                (armeb_package_index.relative_path, "ba4"),
+            ],
+        )
+
+    @mock.patch("pulp_deb.app.tasks.synchronizing.DebDeclarativeVersion")
+    @mock.patch("pulp_deb.app.tasks.synchronizing.DebFirstStage")
+    def test_delete_after_sync(self, first_stage, declarative_version):
+        """
+        Test that the checkpoints are deleted once a sync succeeds, but kept if it fails.
+        """
+        declarative_version.return_value.create.side_effect = RuntimeError("interrupted")
+        with self.assertRaises(RuntimeError):
+            synchronize(self.remote.pk, self.repository.pk, False, True)
+        self.assertTrue(AptSyncCheckpoint.objects.exists())
+
+        declarative_version.return_value.create.side_effect = None
+        synchronize(self.remote.pk, self.repository.pk, False, True)
+        self.assertFalse(AptSyncCheckpoint.objects.exists())
+
+
+class TestPackageIndexCache(TestCase):
+    """
+    Tests the cache of the packages of synced package indices.
+    """
+
+    def setUp(self):
+        """Create a package and a temporary cache directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.override = override_settings(PACKAGE_INDEX_CACHE_DIRECTORY=self.tmp_dir.name)
+        self.override.enable()
+        self.package = Package.objects.create(
+            package="frigg",
+            version="1.0",
+            architecture="ppc64",
+            maintainer="Odin",
+            description="Queen",
+            relative_path="pool/asgard/f/frigg/frigg_1.0_ppc64.deb",
+            sha256="f00",
+        )
+        self.options = {
+            "distribution": "ragnarok",
+            "architecture": "ppc64",
+            "release_architectures": ["ppc64", "armeb"],
+            "remote_architectures": ["ppc64"],
+            "package_filters": {},
+        }
+        self.remote = AptRemote.objects.create(
+            name="on_demand",
+            url="http://example.com/debian/",
+            distributions="ragnarok",
+            policy="on_demand",
+        )
+
+    def tearDown(self):
+        """Clean up the temporary cache directory."""
+        self.override.disable()
+        self.tmp_dir.cleanup()
+
+    def to_url(self, relative_path):
+        return "http://example.com/debian/" + relative_path
+
+    def test_cache_key(self):
+        """
+        Test that only the upstream url and the options deciding which packages are wanted are part
+        of the cache key.
+        """
+        url = "http://example.com/debian/"
+        key = _get_package_index_cache_key("f00", self.options, url)
+        self.assertEqual(
+            key,
+            _get_package_index_cache_key(
+                "f00",
+                dict(
+                    self.options,
+                    release_architectures=["armeb", "ppc64"],
+                    remote_architectures=["armeb"],
+                ),
+                url,
+            ),
+        )
+        self.assertNotEqual(key, _get_package_index_cache_key("ba4", self.options, url))
+        self.assertNotEqual(
+            key,
+            _get_package_index_cache_key("f00", dict(self.options, architecture="armeb"), url),
+        )
+        self.assertNotEqual(
+            key,
+            _get_package_index_cache_key(
+                "f00", dict(self.options, package_filters={"sections": ["misc"]}), url
+            ),
+        )
+        self.assertNotEqual(
+            key, _get_package_index_cache_key("f00", self.options, "http://example.org/debian/")
+        )
+
+    def test_cached_packages(self):
+        """
+        Test that cached packages are returned, unless some of them have been removed.
+        """
+        self.assertIsNone(_get_cached_packages("f00", self.remote, self.to_url))
+        _cache_packages("f00", [self.package.pk])
+        self.assertEqual(
+            _get_cached_packages("f00", self.remote, self.to_url),
+            ([(self.package.pk, "ppc64")], []),
+        )
+        self.package.delete()
+        self.assertIsNone(_get_cached_packages("f00", self.remote, self.to_url))
+
+    def test_cached_packages_remotes(self):
+        """
+        Test that cached packages get remote artifacts for the remote, and are only used with the
+        immediate policy if their artifacts have been downloaded.
+        """
+        content_artifact = ContentArtifact.objects.create(
+            content=self.package, relative_path=self.package.relative_path
+        )
+        url = self.to_url(self.package.relative_path)
+        RemoteArtifact.objects.create(
+            content_artifact=content_artifact, remote=self.remote, url=url, size=5, sha256="f00"
+        )
+        other_remote = AptRemote.objects.create(
+            name="other",
+            url="http://example.com/debian/",
+            distributions="ragnarok",
+            policy="on_demand",
+        )
+        _cache_packages("f00", [self.package.pk])
+
+        self.assertEqual(
+            _get_cached_packages("f00", other_remote, self.to_url),
+            ([(self.package.pk, "ppc64")], []),
+        )
+        remote_artifact = RemoteArtifact.objects.get(remote=other_remote)
+        self.assertEqual(
+            (remote_artifact.content_artifact, remote_artifact.url, remote_artifact.sha256),
+            (content_artifact, url, "f00"),
+        )
+
+        other_remote.policy = "immediate"
+        self.assertIsNone(_get_cached_packages("f00", other_remote, self.to_url))
+        with tempfile.NamedTemporaryFile(dir=self.tmp_dir.name, prefix=".") as artifact_file:
+            artifact_file.write(b"frigg")
+            artifact_file.flush()
+            artifact = Artifact.init_and_validate(artifact_file.name)
+            artifact.save()
+        content_artifact.artifact = artifact
+        content_artifact.save()
+        self.assertIsNotNone(_get_cached_packages("f00", other_remote, self.to_url))
+
+    def test_eviction(self):
+        """
+        Test that the least recently used entries are evicted once the cache is full.
+        """
+        _cache_packages("f00", [self.package.pk])
+        entry_size = os.path.getsize(os.path.join(self.tmp_dir.name, "f00"))
+        old_time = time.time() - 60
+        os.utime(os.path.join(self.tmp_dir.name, "f00"), (old_time, old_time))
+        with override_settings(PACKAGE_INDEX_CACHE_SIZE=entry_size):
+            _cache_packages("ba4", [self.package.pk])
+        self.assertCountEqual(os.listdir(self.tmp_dir.name), ["ba4"])
+
+
+class TestLinkArtifactFile(TestCase):
+    """
+    Tests linking the pool files of local mirrors into the working directory.
+    """
+
+    def setUp(self):
+        """Create a pool file and change to a temporary working directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.cwd = os.getcwd()
+        os.chdir(self.tmp_dir.name)
+        self.path = os.path.join(self.tmp_dir.name, "frigg_1.0_ppc64.deb")
+        with open(self.path, "wb") as pool_file:
+            pool_file.write(b"frigg")
+
+    def tearDown(self):
+        """Return to the previous working directory and clean up."""
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def test_trusted_digests(self):
+        """
+        Test that the file is hardlinked, and only the missing digests are computed.
+        """
+        artifact = Artifact(size=5, sha256="f00")
+        linked_path, artifact_attributes = _link_artifact_file(self.path, artifact, "file://")
+        self.assertEqual(os.stat(linked_path).st_ino, os.stat(self.path).st_ino)
+        self.assertEqual(artifact_attributes["size"], 5)
+        self.assertEqual(artifact_attributes["sha256"], "f00")
+        for name in set(Artifact.DIGEST_FIELDS) - {"sha256"}:
+            self.assertEqual(artifact_attributes[name], hashlib.new(name, b"frigg").hexdigest())
+
+    def test_size_mismatch(self):
+        """
+        Test that a file of the wrong size is rejected, and its link is removed.
+        """
+        with self.assertRaises(SizeValidationError):
+            _link_artifact_file(self.path, Artifact(size=6, sha256="f00"), "file://")
+        self.assertCountEqual(os.listdir(self.tmp_dir.name), ["frigg_1.0_ppc64.deb"])
+
+
+class TestUncompressArtifact(TestCase):
+    """
+    Tests the single pass decompression of package indices by _uncompress_artifact().
+    """
+
+    PACKAGE_INDEX = b"Package: aegir\nVersion: 0.1-edda0\nArchitecture: ppc64\n"
+
+    def setUp(self):
+        """Work in a temporary directory, since the uncompressed file is written to the cwd."""
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def _d_artifact(relative_path, data):
+        d_artifact = mock.Mock()
+        d_artifact.relative_path = relative_path
+        d_artifact.artifact.file = io.BytesIO(data)
+        return d_artifact
+
+    def test_prefers_cheapest_decompressor(self):
+        """
+        Test that the gz variant is decompressed, even if the xz variant is listed first.
+        """
+        d_artifacts = [
+            self._d_artifact("dists/stable/main/binary-ppc64/Packages.xz", lzma.compress(b"xz")),
+            self._d_artifact(
+                "dists/stable/main/binary-ppc64/Packages.gz", gzip.compress(self.PACKAGE_INDEX)
+            ),
+        ]
+        sha256 = hashlib.sha256(self.PACKAGE_INDEX).hexdigest()
+
+        artifact = _uncompress_artifact(d_artifacts, "dists/stable", {"sha256": sha256})
+
+        self.assertEqual(artifact.sha256, sha256)
+        self.assertEqual(artifact.size, len(self.PACKAGE_INDEX))
+        with open(artifact.file.name, "rb") as uncompressed_file:
+            self.assertEqual(uncompressed_file.read(), self.PACKAGE_INDEX)
+
+    def test_digest_mismatch(self):
+        """
+        Test that an uncompressed file not matching the expected digest is rejected.
+        """
+        d_artifacts = [
+            self._d_artifact(
+                "dists/stable/main/binary-ppc64/Packages.xz", lzma.compress(self.PACKAGE_INDEX)
+            )
+        ]
+
+        with self.assertRaises(DigestValidationError):
+            _uncompress_artifact(d_artifacts, "dists/stable", {"sha256": "bogus"})
+        self.assertEqual(os.listdir("."), [])
+
+    def test_allowed_checksums_only(self):
+        """
+        Test that only the allowed checksums are computed, using the pulpcore hashers.
+        """
+        d_artifacts = [
+            self._d_artifact(
+                "dists/stable/main/binary-ppc64/Packages.gz", gzip.compress(self.PACKAGE_INDEX)
+            )
+        ]
+        sha256 = hashlib.sha256(self.PACKAGE_INDEX).hexdigest()
+
+        with mock.patch.object(Artifact, "DIGEST_FIELDS", ["sha512", "sha256"]), mock.patch(
+            "pulp_deb.app.tasks.synchronizing.pulp_hashlib.new", side_effect=hashlib.new
+        ) as new_hasher:
+            artifact = _uncompress_artifact(d_artifacts, "dists/stable", {"sha256": sha256})
+
+        self.assertEqual(
+            sorted(call.args[0] for call in new_hasher.call_args_list), ["sha256", "sha512"]
+        )
+        self.assertEqual(artifact.sha256, sha256)
+        self.assertIsNone(artifact.md5)
+
+
+class TestPdiffs(TestCase):
+    """
+    Tests the selection and application of pdiffs from a Packages.diff/Index.
+    """
+
+    diff_index = {
+        "SHA256-Current": "cccc 300",
+        "SHA256-History": "\n aaaa 100 T-1-F-1\n bbbb 200 T-2-F-2",
+        "SHA256-Patches": "\n 1111 10 T-1-F-1\n 2222 20 T-2-F-2",
+        "SHA256-Download": "\n 3333 5 T-1-F-1.gz\n 4444 6 T-2-F-2.gz",
+    }
+
+    def test_select_pdiff_chain(self):
+        """
+        Test that all patches from the matching history entry onward are selected.
+        """
+        self.assertEqual(
+            _select_pdiffs(self.diff_index, "aaaa", "cccc"),
+            [("T-1-F-1.gz", "3333", 5), ("T-2-F-2.gz", "4444", 6)],
+        )
+        self.assertEqual(
+            _select_pdiffs(self.diff_index, "bbbb", "cccc"), [("T-2-F-2.gz", "4444", 6)]
+        )
+
+    def test_select_merged_pdiff(self):
+        """
+        Test that only a single patch is selected if the patches are merged.
+        """
+        diff_index = dict(self.diff_index, **{"X-Patch-Precedence": "merged"})
+        self.assertEqual(_select_pdiffs(diff_index, "aaaa", "cccc"), [("T-1-F-1.gz", "3333", 5)])
+
+    def test_select_no_pdiff_chain(self):
+        """
+        Test that no patches are selected if there is no chain to the expected package index.
+        """
+        self.assertIsNone(_select_pdiffs(self.diff_index, "dddd", "cccc"))
+        self.assertIsNone(_select_pdiffs(self.diff_index, "aaaa", "eeee"))
+
+    def test_apply_ed_script(self):
+        """
+        Test that append, change and delete commands are applied like ed would.
+        """
+        lines = [b"one\n", b"two\n", b"three\n", b"four\n", b"five\n"]
+        ed_script = [
+            b"5a\n",
+            b"six\n",
+            b".\n",
+            b"3,4c\n",
+            b"drei\n",
+            b".\n",
+            b"1d\n",
+        ]
+        _apply_ed_script(lines, ed_script)
+        self.assertEqual(lines, [b"two\n", b"drei\n", b"five\n", b"six\n"])
+
+        with self.assertRaises(ValueError):
+            _apply_ed_script(lines, [b"1s/two/zwei/\n"])
+
+
+class TestFetchPackageIndexByPdiffs(TestCase):
+    """
+    Tests building a package index from pdiffs, and falling back to the full download.
+    """
+
+    PREVIOUS = b"one\ntwo\n"
+    CURRENT = b"one\n"
+    PACKAGES_PATH = "dists/stable/main/binary-amd64/Packages"
+
+    def setUp(self):
+        """Work in a temporary directory, since the downloads are written to the cwd."""
+        self.cwd = os.getcwd()
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp_dir.name)
+        remote = AptRemote(url="http://example.com/debian/", distributions="stable")
+        previous_repo_version = mock.Mock(
+            info={"remote_options": {}, "sync_options": {"mirror": False}}
+        )
+        self.stage = DebFirstStage(remote, True, False, previous_repo_version)
+        self.stage.previous_metadata = {
+            PackageIndex: {
+                self.PACKAGES_PATH: [mock.Mock(sha256=hashlib.sha256(self.PREVIOUS).hexdigest())]
+            }
+        }
+        with open(os.path.join(self.tmp_dir.name, "previous"), "wb") as previous_file:
+            previous_file.write(self.PREVIOUS)
+        self.previous_artifact = mock.Mock()
+        self.previous_artifact.file.open.side_effect = lambda mode: open(
+            os.path.join(self.tmp_dir.name, "previous"), mode
+        )
+        os.mkdir("downloads")
+        os.chdir("downloads")
+
+    def tearDown(self):
+        """Clean up the temporary directory."""
+        os.chdir(self.cwd)
+        self.tmp_dir.cleanup()
+
+    def fetch(self, pdiff_error=None):
+        diff_index = (
+            "SHA256-Current: {} 4\n"
+            "SHA256-History:\n {} 8 T-1-F-1\n"
+            "SHA256-Patches:\n 1111 3 T-1-F-1\n"
+            "SHA256-Download:\n 2222 20 T-1-F-1.gz\n"
+        ).format(
+            hashlib.sha256(self.CURRENT).hexdigest(), hashlib.sha256(self.PREVIOUS).hexdigest()
+        )
+        downloads = {"Index": diff_index.encode(), "T-1-F-1.gz": gzip.compress(b"2d\n")}
+
+        async def download_pdiff_file(relative_path, sha256, size):
+            filename = os.path.basename(relative_path)
+            if filename != "Index" and pdiff_error:
+                raise pdiff_error
+            with open(filename, "wb") as download:
+                download.write(downloads[filename])
+            return DownloadResult(
+                url=relative_path, artifact_attributes={}, path=filename, headers={}
+            )
+
+        packages_d_artifact = mock.Mock(relative_path=self.PACKAGES_PATH)
+        packages_d_artifact.artifact.sha256 = hashlib.sha256(self.CURRENT).hexdigest()
+        file_references = {"main/binary-amd64/Packages.diff/Index": {"SHA256": "3333", "size": "1"}}
+        with mock.patch.object(
+            self.stage, "_download_pdiff_file", side_effect=download_pdiff_file
+        ), mock.patch(
+            "pulp_deb.app.tasks.synchronizing._get_main_artifact_blocking",
+            new=mock.AsyncMock(return_value=self.previous_artifact),
+        ):
+            return async_to_sync(self.stage._fetch_package_index_by_pdiffs)(
+                mock.Mock(relative_path="dists/stable/Release"),
+                "main/binary-amd64",
+                file_references,
+                packages_d_artifact,
+            )
+
+    def test_apply_pdiffs(self):
+        """
+        Test that the package index is patched, and the downloads are removed.
+        """
+        artifact = self.fetch()
+        self.assertEqual(artifact.sha256, hashlib.sha256(self.CURRENT).hexdigest())
+        self.assertEqual(os.listdir("."), [os.path.basename(artifact.file.name)])
+
+    def test_fall_back(self):
+        """
+        Test that failing pdiff downloads fall back to the full download, removing the downloads.
+        """
+        for error in (
+            aiohttp.ClientResponseError(mock.Mock(), (), status=404),
+            asyncio.TimeoutError(),
+            DigestValidationError("2222", "3333"),
+            SizeValidationError(20, 21),
+            FileNotFoundError("T-1-F-1.gz"),
+        ):
+            with self.subTest(error=error):
+                self.assertIsNone(self.fetch(pdiff_error=error))
+                self.assertEqual(os.listdir("."), [])
+
+
+class TestReleaseSignatureVerification(TestCase):
+    """
+    Tests the caching of Release file signature verification results.
+    """
+
+    def setUp(self):
+        """Set up a mocked GPG instance with a temporary keyring directory."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp_dir.name, "verified"))
+        self.gpg = mock.Mock(gnupghome=self.tmp_dir.name)
+        self.gpg.verify_file.return_value = mock.Mock(
+            valid=True, expire_timestamp="0", pubkey_fingerprint="AABB"
+        )
+        self.gpg.list_keys.return_value = [{"fingerprint": "AABB", "expires": ""}]
+        self.artifact = mock.Mock(sha256="aabb")
+
+    def tearDown(self):
+        """Clean up the temporary keyring directory."""
+        self.tmp_dir.cleanup()
+
+    def test_valid_signature_is_cached(self):
+        """
+        Test that a successful verification is cached, and only applies to the same artifacts.
+        """
+        self.assertTrue(_verify_release_signature(self.gpg, self.artifact))
+        self.assertTrue(_verify_release_signature(self.gpg, self.artifact))
+        self.assertEqual(self.gpg.verify_file.call_count, 1)
+
+        signature_artifact = mock.Mock(sha256="ccdd")
+        self.artifact.file.path = "Release"
+        self.assertTrue(_verify_release_signature(self.gpg, self.artifact, signature_artifact))
+        self.assertEqual(self.gpg.verify_file.call_count, 2)
+        self.gpg.verify_file.assert_called_with(signature_artifact.file, "Release")
+
+    def test_invalid_signature_is_not_cached(self):
+        """
+        Test that a failed verification is not cached.
+        """
+        self.gpg.verify_file.return_value.valid = False
+        self.assertFalse(_verify_release_signature(self.gpg, self.artifact))
+        self.assertFalse(_verify_release_signature(self.gpg, self.artifact))
+        self.assertEqual(self.gpg.verify_file.call_count, 2)
+
+    def test_expired_cache_entry(self):
+        """
+        Test that a cached verification is not used once the signing key has expired.
+        """
+        self.gpg.list_keys.return_value = [{"fingerprint": "AABB", "expires": str(time.time())}]
+        self.assertTrue(_verify_release_signature(self.gpg, self.artifact))
+        self.assertTrue(_verify_release_signature(self.gpg, self.artifact))
+        self.assertEqual(self.gpg.verify_file.call_count, 2)